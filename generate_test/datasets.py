@@ -0,0 +1,39 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the datasets, see "size and parameters of datasets.xlsx".
+#
+# Every dataset is a list of groups, the files of a group are numbered after the previous group.
+#   mode     "-0", "-a" or "-p" of fuzz
+#   count    number of files in the group
+#   n        (lo, hi), the length of every file is drawn from lo to hi. With -l it is the number of lines
+#   l        maximum line length for -l, 0 without -l
+# fast asks for the numpy generator of fuzzgen, which is not replayable by fuzz but much faster for huge files.
+#
+# Small2, Medium2, Large2 and Huge2 have the parameters of Small1, Medium1, Large1 and Huge1. Since the seeds
+# of a dataset come from its name, they are different files.
+
+# groups with the three modes and the same parameters
+def modes(count, n, l=0):
+  return [{"mode": mode, "count": count, "n": n, "l": l} for mode in ("-0", "-a", "-p")]
+
+datasets = {}
+
+datasets["Small1"] = {"fast": False, "groups": modes(200, (0, 1000)) + modes(200, (0, 100), 255)}
+datasets["Small3"] = {"fast": False, "groups": modes(200, (1000, 1000)) + modes(200, (10, 10), 100)}
+
+# In Medium1, t0-t11 is replaced with the test cases in previous study
+datasets["Medium1"] = {"fast": False, "groups": modes(100, (0, 100000)) + modes(100, (0, 100000), 255) + modes(100, (0, 5000), 255)}
+datasets["Medium3"] = {"fast": False, "groups": modes(100, (100000, 100000)) + modes(100, (1000, 1000), 100)}
+
+datasets["Large1"] = {"fast": False, "groups": modes(30, (1000000, 10000000)) + modes(30, (10000, 100000), 255)}
+datasets["Large3"] = {"fast": False, "groups": modes(30, (10000000, 10000000)) + modes(30, (100000, 100000), 100)}
+
+datasets["Huge1"] = {"fast": True, "groups": modes(10, (10000000, 100000000)) + modes(10, (100000, 1000000), 255)}
+datasets["Huge3"] = {"fast": True, "groups": modes(10, (100000000, 100000000)) + modes(10, (1000000, 1000000), 100)}
+
+for name in ("Small", "Medium", "Large", "Huge"):
+  datasets[name + "2"] = datasets[name + "1"]
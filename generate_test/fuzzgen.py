@@ -0,0 +1,278 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# this script generates random files like ../src/fuzz.c, but in-process and with an explicit seed for every file.
+# It reproduces glibc's rand(), so "fuzzgen.py n -s seed" writes the same bytes as "fuzz n -s seed" on Linux.
+# With numpy installed, -f uses a vectorized generator instead, which has the same distributions but not fuzz's bytes.
+# -z gzip or -z zstd compresses the file as it is written, run.py tests its content.
+
+import os
+import sys
+import gzip
+
+# numpy is only needed by the fast generator
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# zstandard is only needed by -z zstd
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+usage = "Usage: python3 fuzzgen.py [-0] [-a] [-p] [-l [strlen]] [-s seed] [-f] [-z gzip|zstd] -o outfile [len]"
+
+# the suffix of the files of every compression, run.py knows a compressed test case by it
+compressions = {"gzip": ".gz", "zstd": ".zst"}
+
+# number of random values generated at a time
+chunk_size = 1 << 16
+
+# number of bytes the fast generator makes at a time, it bounds the memory used whatever the file size is
+fast_chunk_size = 1 << 22
+
+# glibc's TYPE_3 random(): r[i] = r[i-31] + r[i-3], the state is the last 34 values
+def srand(seed):
+  # seed is a C int
+  seed = seed & 0xffffffff
+  if(seed >= 0x80000000):
+    seed = seed - 0x100000000
+  if(seed == 0):
+    seed = 1
+
+  r = [seed]
+  word = seed
+  for i in range(1, 31):
+    # hi and lo are computed with C division, which truncates toward zero
+    hi = abs(word) // 127773
+    lo = abs(word) % 127773
+    if(word < 0):
+      hi = -hi
+      lo = -lo
+    word = 16807 * lo - 2836 * hi
+    if(word < 0):
+      word = word + 2147483647
+    r.append(word)
+  for i in range(31, 34):
+    r.append(r[i - 31])
+  r = [v & 0xffffffff for v in r]
+
+  # glibc throws away the first 310 values
+  rand(r, 310)
+  return r
+
+# return the next count values of rand(), r is updated in place
+def rand(r, count):
+  for i in range(count):
+    r.append((r[-31] + r[-3]) & 0xffffffff)
+  out = [v >> 1 for v in r[34:]]
+  del r[:-34]
+  return out
+
+# the range of random characters, every character is of the form c = rand() % m + h
+def char_range(flag0, flaga):
+  # Defaults, 1-255
+  h = 1
+  m = 255
+  # All ASCII, including 0, 0-255
+  if(flag0):
+    h = 0
+    m = 256
+  # Printables, 32-126
+  if(not flaga):
+    h = 32
+    m = 95 + (flag0 != 0)
+  return m, h
+
+# turn random values into characters
+def make_chars(values, m, h, flag0, flaga):
+  chars = bytearray([v % m + h for v in values])
+  # -0 with -p maps 127 to 0
+  if(flag0 and not flaga):
+    chars = chars.replace(b"\x7f", b"\x00")
+  return chars
+
+# write length random characters to out
+def fuzzchar(out, r, length, m, h, flag0, flaga):
+  while length > 0:
+    count = min(length, chunk_size)
+    out.write(make_chars(rand(r, count), m, h, flag0, flaga))
+    length = length - count
+
+# write length random LF terminated strings to out, each is shorter than flagl
+def fuzzstr(out, r, length, flagl, m, h, flag0, flaga):
+  buf = bytearray()
+  for i in range(length):
+    l = rand(r, 1)[0] % flagl
+    buf += make_chars(rand(r, l), m, h, flag0, flaga)
+    buf += b"\n"
+    if(len(buf) >= chunk_size):
+      out.write(buf)
+      buf = bytearray()
+  out.write(buf)
+
+# return count random characters as a numpy array
+def fast_chars(rng, count, m, h, flag0, flaga):
+  # all 256 values, random bytes are much faster than integers()
+  if(m == 256):
+    return numpy.frombuffer(rng.bytes(count), dtype=numpy.uint8)
+  chars = rng.integers(h, h + m, size=count, dtype=numpy.uint8)
+  # -0 with -p maps 127 to 0
+  if(flag0 and not flaga):
+    chars[chars == 127] = 0
+  return chars
+
+# the fast version of fuzzchar, every chunk is generated by numpy at once
+def fast_fuzzchar(out, rng, length, m, h, flag0, flaga):
+  while length > 0:
+    count = min(length, fast_chunk_size)
+    out.write(fast_chars(rng, count, m, h, flag0, flaga).tobytes())
+    length = length - count
+
+# the fast version of fuzzstr. A chunk of lines is made by drawing all line lengths, then all characters,
+# and putting a LF after every line
+def fast_fuzzstr(out, rng, length, flagl, m, h, flag0, flaga):
+  # number of lines per chunk, so that a chunk is about fast_chunk_size bytes
+  lines_per_chunk = max(1, fast_chunk_size // (flagl // 2 + 1))
+  while length > 0:
+    count = min(length, lines_per_chunk)
+    line_lengths = rng.integers(0, flagl, size=count, dtype=numpy.int64)
+    ends = numpy.cumsum(line_lengths + 1) - 1
+    chunk = numpy.empty(int(ends[-1]) + 1, dtype=numpy.uint8)
+    is_char = numpy.ones(len(chunk), dtype=bool)
+    is_char[ends] = False
+    chunk[is_char] = fast_chars(rng, len(chunk) - count, m, h, flag0, flaga)
+    chunk[ends] = ord("\n")
+    out.write(chunk.tobytes())
+    length = length - count
+
+# fuzz.c's switches of the datasets, "-0", "-a" or "-p"
+def mode_flags(mode):
+  if(mode == "-0"):
+    return True, True
+  elif(mode == "-a"):
+    return False, True
+  elif(mode == "-p"):
+    return False, False
+  else:
+    raise ValueError("unknown mode %s" % mode)
+
+# write length random characters (or LF terminated strings if flagl) to out, with glibc's rand() or with numpy if fast.
+# Like fuzz.c, a length of None is taken from the random sequence
+def write_fuzz(out, length, seed, flag0, flaga, flagl, fast):
+  m, h = char_range(flag0, flaga)
+  if(fast):
+    rng = numpy.random.default_rng(seed)
+    if(length is None):
+      length = int(rng.integers(0, 100000))
+    if(flagl):
+      fast_fuzzstr(out, rng, length, flagl, m, h, flag0, flaga)
+    else:
+      fast_fuzzchar(out, rng, length, m, h, flag0, flaga)
+  else:
+    r = srand(seed)
+    if(length is None):
+      length = rand(r, 1)[0] % 100000
+    if(flagl):
+      fuzzstr(out, r, length, flagl, m, h, flag0, flaga)
+    else:
+      fuzzchar(out, r, length, m, h, flag0, flaga)
+
+# open path for writing, compressed with compression (None, "gzip" or "zstd")
+def open_output(path, compression=None):
+  if(compression == "gzip"):
+    # level 6 compresses random bytes as well as 9, much faster
+    return gzip.open(path, "wb", compresslevel=6)
+  if(compression == "zstd"):
+    if(zstandard is None):
+      raise ValueError("zstd needs the zstandard module")
+    return zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+  if(compression is not None):
+    raise ValueError("unknown compression %s" % compression)
+  return open(path, "wb")
+
+# open path, written by open_output, for reading its content
+def open_input(path):
+  suffix = os.path.splitext(path)[1]
+  if(suffix == compressions["gzip"]):
+    return gzip.open(path, "rb")
+  if(suffix == compressions["zstd"]):
+    if(zstandard is None):
+      raise ValueError("zstd needs the zstandard module")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+  return open(path, "rb")
+
+# write a file like "fuzz length mode [-l flagl] -s seed -o path", mode is "-0", "-a" or "-p".
+# fast asks for the numpy generator, it falls back to glibc's rand() if numpy is not installed.
+# The file is compressed with compression, path should have its suffix.
+# Return whether the fast generator was used, since its files can't be replayed by fuzz
+def fuzz(path, length, seed, mode="-a", flagl=0, fast=False, compression=None):
+  flag0, flaga = mode_flags(mode)
+  fast = fast and numpy is not None
+  with open_output(path, compression) as out:
+    write_fuzz(out, int(length), seed, flag0, flaga, flagl, fast)
+  return fast
+
+
+if __name__ == "__main__":
+
+  flag0 = False
+  flaga = True
+  flagl = 0
+  seed = 0
+  length = None
+  outfile = ""
+  fast = False
+  compression = None
+
+  # -l takes an optional argument like fuzz.c, so the arguments are parsed by hand
+  argv = sys.argv[1:]
+  while argv:
+    arg = argv.pop(0)
+    if(not arg.startswith("-")):
+      length = int(arg)
+    elif(arg == "-0"):
+      flag0 = True
+    elif(arg == "-a"):
+      flaga = True
+    elif(arg == "-p"):
+      flaga = False
+    elif(arg == "-l"):
+      flagl = 255
+      if(argv and not argv[0].startswith("-")):
+        flagl = int(argv.pop(0))
+    elif(arg == "-s" and argv):
+      seed = int(argv.pop(0))
+    elif(arg == "-o" and argv):
+      outfile = argv.pop(0)
+    elif(arg == "-f"):
+      fast = True
+    elif(arg == "-z" and argv):
+      compression = argv.pop(0)
+    else:
+      print(usage)
+      sys.exit(1)
+
+  if(outfile == ""):
+    print(usage)
+    sys.exit(1)
+
+  if(fast and numpy is None):
+    print("-f needs numpy")
+    sys.exit(1)
+
+  if(compression not in (None, "gzip", "zstd")):
+    print(usage)
+    sys.exit(1)
+
+  if(compression == "zstd" and zstandard is None):
+    print("-z zstd needs zstandard")
+    sys.exit(1)
+
+  with open_output(outfile, compression) as out:
+    write_fuzz(out, length, seed, flag0, flaga, flagl, fast)
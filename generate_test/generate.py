@@ -0,0 +1,318 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# this script generates the datasets described in datasets.py with a pool of processes.
+# Every dataset gets a manifest next to its directory with the seed, mode, size and hash of each file,
+# so the dataset can be rebuilt exactly or verified later. With -u, a file with the same content as a file with a lower
+# number (tiny and empty files often are) is drawn again, see redraw_duplicates. This changes the lengths of the
+# published datasets, so by default duplicates are kept. With -z gzip or -z zstd the files are
+# compressed (t0.gz, t0.zst), the manifest has the size and hash of their content and the size of the file.
+# With -P the dataset is also packed into one file next to its directory (see ../run_test/pack.py), which run.py
+# can test instead of the directory.
+
+import os
+import sys
+import getopt
+import json
+import random
+import hashlib
+import multiprocessing
+
+import fuzzgen
+from datasets import datasets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "run_test"))
+import pack
+
+usage = "Usage: python3 generate.py dataset [dataset ...] [-o output_dir] [-j jobs] [-s seed] [-f] [-v] [-u] [-z gzip|zstd] [-P]"
+
+# number of times a duplicate file is drawn again before it is kept
+max_retries = 10
+
+# the seed of every file and its length are drawn from the seed of the dataset, so a dataset can be rebuilt.
+# A file drawn again for the retry-th time (retries, by name) has its seed and length drawn from the seed, its name
+# and retry instead, the other files keep theirs
+def plan_dataset(spec, seed, retries={}):
+  rng = random.Random(seed)
+  files = []
+  for group in spec["groups"]:
+    for i in range(group["count"]):
+      planned = {"name": "t%d" % len(files), "seed": rng.randint(0, 2**31 - 1), "mode": group["mode"], \
+        "length": rng.randint(group["n"][0], group["n"][1]), "line_length": group["l"]}
+      retry = retries.get(planned["name"], 0)
+      if(retry > 0):
+        redraw = random.Random("%s\0%s\0%d" % (seed, planned["name"], retry))
+        planned["seed"] = redraw.randint(0, 2**31 - 1)
+        planned["length"] = redraw.randint(group["n"][0], group["n"][1])
+        planned["retry"] = retry
+      files.append(planned)
+  return files
+
+# return the size and sha256 of the content of a file
+def hash_file(path):
+  h = hashlib.sha256()
+  size = 0
+  with fuzzgen.open_input(path) as f:
+    while True:
+      data = f.read(1 << 20)
+      if not data:
+        break
+      h.update(data)
+      size = size + len(data)
+  return size, h.hexdigest()
+
+# generate one file in a worker, return its manifest entry
+def generate_file(task):
+  path, entry, fast = task
+  entry = dict(entry)
+  used_fast = fuzzgen.fuzz(path, entry["length"], entry["seed"], entry["mode"], entry["line_length"], fast, \
+    entry.get("compression"))
+  entry["generator"] = "numpy" if used_fast else "glibc"
+  entry["size"], entry["sha256"] = hash_file(path)
+  if(entry.get("compression") is not None):
+    entry["file"] = os.path.basename(path)
+    entry["stored_size"] = os.path.getsize(path)
+  return entry
+
+# check one file against its manifest entry in a worker, return the entry and what is wrong with the file
+def verify_file(task):
+  path, entry = task
+  path = os.path.join(os.path.dirname(path), entry.get("file", entry["name"]))
+  if not os.path.isfile(path):
+    return entry, "missing"
+  size, sha256 = hash_file(path)
+  if(size != entry["size"] or sha256 != entry["sha256"]):
+    return entry, "changed"
+  return entry, ""
+
+def read_manifest(manifest_path):
+  if not os.path.isfile(manifest_path):
+    return None
+  with open(manifest_path, "r") as f:
+    return json.load(f)
+
+# write the manifest to a temporary file first, so an interrupted run never leaves a truncated manifest
+def write_manifest(manifest_path, name, seed, entries):
+  entries = sorted(entries, key=lambda entry: int(entry["name"][1:]))
+  with open(manifest_path + ".tmp", "w") as f:
+    json.dump({"dataset": name, "seed": seed, "files": entries}, f, indent=1)
+  os.replace(manifest_path + ".tmp", manifest_path)
+
+# whether entry was made with the planned parameters
+def same_plan(planned, entry):
+  for key in ("seed", "mode", "length", "line_length", "compression"):
+    if(entry.get(key) != planned.get(key)):
+      return False
+  return True
+
+# the file of a planned entry in dataset_dir, with the suffix of its compression
+def planned_path(dataset_dir, planned):
+  return os.path.join(dataset_dir, planned["name"] + fuzzgen.compressions.get(planned.get("compression"), ""))
+
+# remove the files of name in dataset_dir with another compression than path, left by an earlier run
+def remove_other_files(dataset_dir, name, path):
+  for suffix in [""] + list(fuzzgen.compressions.values()):
+    other = os.path.join(dataset_dir, name + suffix)
+    if(other != path and os.path.isfile(other)):
+      os.unlink(other)
+
+# an existing file is kept if the manifest says it was made with the planned parameters
+def entry_up_to_date(path, planned, old_entry):
+  if(old_entry is None or not os.path.isfile(path)):
+    return False
+  if not same_plan(planned, old_entry):
+    return False
+  return os.path.getsize(path) == old_entry.get("stored_size", old_entry["size"])
+
+# draw again every file with the same content as a file with a lower number, unless it was drawn max_retries times
+# already. retries is updated, return the number of files to draw again and the number of duplicates kept
+def redraw_duplicates(entries, retries):
+  seen = set()
+  redrawn = 0
+  kept = 0
+  for entry in sorted(entries, key=lambda entry: int(entry["name"][1:])):
+    if entry["sha256"] not in seen:
+      seen.add(entry["sha256"])
+    elif(retries.get(entry["name"], 0) < max_retries):
+      retries[entry["name"]] = retries.get(entry["name"], 0) + 1
+      redrawn = redrawn + 1
+    else:
+      kept = kept + 1
+  return redrawn, kept
+
+# with unique, files the same as another are drawn again (see redraw_duplicates). The files are compressed with
+# compression, None for plain files
+def generate_dataset(pool, name, dataset_dir, manifest_path, seed, force, unique, compression=None):
+  spec = datasets[name]
+
+  if not os.path.exists(dataset_dir):
+    os.makedirs(dataset_dir)
+
+  old_entries = {}
+  manifest = read_manifest(manifest_path)
+  if(manifest is not None and manifest["seed"] == seed):
+    old_entries = dict((entry["name"], entry) for entry in manifest["files"])
+
+  # the files drawn again by an earlier run are planned the same way, so they are up to date
+  retries = {}
+  if(unique):
+    retries = dict((entry["name"], entry["retry"]) for entry in old_entries.values() if entry.get("retry"))
+
+  # the files made so far by this run, by name
+  made = {}
+  while True:
+    entries = []
+    tasks = []
+    for planned in plan_dataset(spec, seed, retries):
+      if(compression is not None):
+        planned["compression"] = compression
+      path = planned_path(dataset_dir, planned)
+      if(planned["name"] in made and same_plan(planned, made[planned["name"]])):
+        entries.append(made[planned["name"]])
+      elif(not force and entry_up_to_date(path, planned, old_entries.get(planned["name"]))):
+        entries.append(old_entries[planned["name"]])
+      else:
+        remove_other_files(dataset_dir, planned["name"], path)
+        tasks.append((path, planned, spec["fast"]))
+
+    # start the longest files first, so that one huge file doesn't run alone at the end
+    tasks.sort(key=lambda task: task[1]["length"] * max(1, task[1]["line_length"] // 2), reverse=True)
+
+    print("%s: %d files to generate, %d up to date" % (name, len(tasks), len(entries)))
+    for entry in pool.imap_unordered(generate_file, tasks):
+      print("%s %s seed %d size %d" % (name, entry["name"], entry["seed"], entry["size"]))
+      made[entry["name"]] = entry
+      entries.append(entry)
+
+    if(not unique):
+      break
+    redrawn, kept = redraw_duplicates(entries, retries)
+    if(redrawn == 0):
+      if(kept > 0):
+        print("%s: %d duplicate files kept after %d draws" % (name, kept, max_retries + 1))
+      break
+    print("%s: %d duplicate files to draw again" % (name, redrawn))
+
+  write_manifest(manifest_path, name, seed, entries)
+  print("%s: manifest written to %s" % (name, manifest_path))
+
+# return the number of bad files
+def verify_dataset(pool, name, dataset_dir, manifest_path):
+  manifest = read_manifest(manifest_path)
+  if(manifest is None):
+    print("%s: no manifest %s" % (name, manifest_path))
+    return 1
+
+  bad = 0
+  tasks = [(os.path.join(dataset_dir, entry["name"]), entry) for entry in manifest["files"]]
+  for entry, problem in pool.imap_unordered(verify_file, tasks):
+    if(problem != ""):
+      print("%s %s %s" % (name, entry["name"], problem))
+      bad = bad + 1
+  print("%s: %d files, %d bad" % (name, len(tasks), bad))
+
+  # the pack must hold the content of every file of the manifest
+  pack_path = dataset_dir + ".pack"
+  if os.path.isfile(pack_path):
+    state = pack.open_pack(pack_path)
+    changed = pack.verify_pack(state)
+    for entry in manifest["files"]:
+      packed = state["entries"].get(entry["name"])
+      if(packed is None or packed[2] != entry["sha256"] or entry["name"] in changed):
+        print("%s %s %s" % (name, pack_path, "missing" if packed is None else "changed"))
+        bad = bad + 1
+    print("%s: %s checked" % (name, pack_path))
+  return bad
+
+# pack the files of the manifest into dataset_dir.pack
+def pack_dataset(name, dataset_dir, manifest_path):
+  manifest = read_manifest(manifest_path)
+  paths = [os.path.join(dataset_dir, entry.get("file", entry["name"])) for entry in manifest["files"]]
+  count = pack.write_pack(dataset_dir + ".pack", paths)
+  print("%s: %d files packed into %s" % (name, count, dataset_dir + ".pack"))
+
+
+if __name__ == "__main__":
+
+  # the datasets are generated in output_dir/<name>, and their manifests are output_dir/<name>.manifest
+  output_dir = "."
+  workers = os.cpu_count() or 1
+  # by default the seed of a dataset is its name
+  seed = None
+  force = False
+  verify = False
+  unique = False
+  compression = None
+  packing = False
+
+  try:
+    opts, args = getopt.gnu_getopt(sys.argv[1:], "o:j:s:fvuz:Ph", ["ofile=", "jobs=", "seed=", "force", "verify", "unique", \
+      "compression=", "pack", "help"])
+  except getopt.GetoptError as err:
+    print("error on arguments")
+    print(usage)
+    sys.exit(1)
+
+  for opt, arg in opts:
+    if(opt in ("-o", "--ofile")):
+      output_dir = arg
+    elif(opt in ("-j", "--jobs")):
+      workers = int(arg)
+    elif(opt in ("-s", "--seed")):
+      seed = arg
+    elif(opt in ("-f", "--force")):
+      force = True
+    elif(opt in ("-v", "--verify")):
+      verify = True
+    elif(opt in ("-u", "--unique")):
+      unique = True
+    elif(opt in ("-z", "--compression")):
+      compression = arg
+    elif(opt in ("-P", "--pack")):
+      packing = True
+    elif(opt in ("-h", "--help")):
+      print(usage)
+      print("datasets: %s" % " ".join(sorted(datasets)))
+      sys.exit(1)
+
+  if(len(args) == 0):
+    print("too few arguments")
+    print(usage)
+    print("datasets: %s" % " ".join(sorted(datasets)))
+    sys.exit(1)
+
+  if(compression not in (None, "gzip", "zstd")):
+    print("compression should be gzip or zstd")
+    print(usage)
+    sys.exit(1)
+
+  if(compression == "zstd" and fuzzgen.zstandard is None):
+    print("-z zstd needs zstandard")
+    sys.exit(1)
+
+  for name in args:
+    if name not in datasets:
+      print("unknown dataset %s" % name)
+      print("datasets: %s" % " ".join(sorted(datasets)))
+      sys.exit(1)
+
+  bad = 0
+  pool = multiprocessing.Pool(workers)
+  for name in args:
+    dataset_dir = os.path.join(output_dir, name)
+    manifest_path = dataset_dir + ".manifest"
+    if(verify):
+      bad = bad + verify_dataset(pool, name, dataset_dir, manifest_path)
+    else:
+      generate_dataset(pool, name, dataset_dir, manifest_path, name if seed is None else seed, force, unique, \
+        compression)
+      if(packing):
+        pack_dataset(name, dataset_dir, manifest_path)
+  pool.close()
+  pool.join()
+
+  if(bad):
+    sys.exit(1)
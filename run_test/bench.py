@@ -0,0 +1,246 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# benchmark run.py itself. The synthetic targets of bench/target.c (an instant exit, a SIGSEGV crash, an abort, a
+# sleep-forever hang, a busy-loop hang, a slow stdin reader, a huge-output writer and an echo program) are run
+# through every test type (stdin, file, cp, two_files and pty) on a corpus made by ../generate_test/fuzzgen.py.
+# bench.py reports the runs per second, the p50/p99 latency of the instant exit (the cost of one run in the
+# harness) for every test type, how often the result of a target was the one expected, and how long the hangs took
+# to be found (the timeout, or less with run.py -w and --busy). The options after -- are given to run.py, so two
+# executors can be compared, e.g.:
+#
+#   python3 bench.py -o pool.json -- -j 4
+#   python3 bench.py -c pool.json -- -j 4 -e async
+
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import signal
+import sqlite3
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "generate_test"))
+import fuzzgen
+
+usage = "Usage: python3 bench.py [-n testcases] [-s size] [-t timeout] [-d work_dir] [-o result.json] [-c baseline.json] [-- run.py options]"
+
+# the result every target should get, and the signal of a failure
+expected = {
+  "bench_exit": ("ok", None),
+  "bench_segv": ("failed", signal.SIGSEGV),
+  "bench_abort": ("failed", signal.SIGABRT),
+  "bench_sleep": ("hung", None),
+  "bench_spin": ("hung", None),
+  "bench_slowread": ("ok", None),
+  "bench_flood": ("ok", None),
+  "bench_echo": ("ok", None),
+}
+
+test_types = ("stdin", "file", "cp", "two_files", "pty")
+
+# the target whose runs measure the latency of the harness
+latency_target = "bench_exit"
+
+# the p percentile of values, nearest rank
+def percentile(values, p):
+  if not values:
+    return None
+  values = sorted(values)
+  return values[max(0, min(len(values) - 1, int(len(values) * p / 100.0 + 0.5) - 1))]
+
+# compile bench/target.c into bin_dir and link it under the name of every target
+def build_targets(bin_dir):
+  source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "target.c")
+  target = os.path.join(bin_dir, "target")
+  os.makedirs(bin_dir)
+  subprocess.check_call([os.environ.get("CC", "cc"), "-O1", "-o", target, source])
+  for name in expected:
+    os.symlink(target, os.path.join(bin_dir, name))
+
+# count files of size bytes, in the three modes of fuzz
+def make_corpus(corpus_dir, count, size):
+  os.makedirs(corpus_dir)
+  for i in range(count):
+    fuzzgen.fuzz(os.path.join(corpus_dir, "t%d" % i), size, i, ("-a", "-0", "-p")[i % 3])
+
+# a line for every target and test type
+def write_configuration(path, bin_dir):
+  with open(path, "w") as f:
+    for test_type in test_types:
+      for name in expected:
+        program = os.path.join(bin_dir, name)
+        if(test_type == "cp"):
+          f.write("cp input.txt %s\n" % program)
+        else:
+          f.write("%s %s\n" % (test_type, program))
+
+# whether a run got the result expected for its target
+def detected(utility, result, signum):
+  want, want_signal = expected[utility]
+  return result == want and (want_signal is None or signum == want_signal)
+
+# the numbers of a campaign from its results.db
+def analyze(db_path, wall):
+  db = sqlite3.connect(db_path)
+  rows = db.execute("select utility, test_type, result, signal, duration from runs").fetchall()
+  db.close()
+
+  targets = {}
+  latency = {}
+  detection = {}
+  correct = 0
+  for utility, test_type, result, signum, duration in rows:
+    name = os.path.basename(utility)
+    target = targets.setdefault(name, {"runs": 0, "correct": 0, "results": {}})
+    target["runs"] += 1
+    target["results"][result] = target["results"].get(result, 0) + 1
+    if detected(name, result, signum):
+      target["correct"] += 1
+      correct += 1
+    if(name == latency_target):
+      latency.setdefault(test_type, []).append(duration)
+    if(expected[name][0] == "hung" and result == "hung"):
+      detection.setdefault(name, []).append(duration)
+
+  return {"runs": len(rows), "wall": wall, "runs_per_sec": len(rows) / wall if wall else 0, \
+    "accuracy": correct / float(len(rows)) if rows else 0, "targets": targets, \
+    "latency": dict((test_type, {"p50": percentile(values, 50), "p99": percentile(values, 99)}) \
+      for test_type, values in latency.items()), \
+    "detection": dict((name, {"p50": percentile(values, 50), "p99": percentile(values, 99)}) \
+      for name, values in detection.items())}
+
+def ms(seconds):
+  return "-" if seconds is None else "%.2f" % (seconds * 1000)
+
+def print_bench(bench):
+  print("%d runs in %.2f s, %.1f runs/s, detection accuracy %.1f%%" % (bench["runs"], bench["wall"], \
+    bench["runs_per_sec"], 100 * bench["accuracy"]))
+  print("")
+  print("%-16s %6s %8s  %s" % ("target", "runs", "accuracy", "results"))
+  for name in expected:
+    target = bench["targets"].get(name)
+    if(target is None):
+      continue
+    print("%-16s %6d %7.1f%%  %s" % (name, target["runs"], 100.0 * target["correct"] / target["runs"], \
+      " ".join("%s:%d" % item for item in sorted(target["results"].items()))))
+  print("")
+  print("%s latency (ms)" % latency_target)
+  print("%-10s %8s %8s" % ("type", "p50", "p99"))
+  for test_type in test_types:
+    if test_type in bench["latency"]:
+      print("%-10s %8s %8s" % (test_type, ms(bench["latency"][test_type]["p50"]), ms(bench["latency"][test_type]["p99"])))
+  if(bench["detection"]):
+    print("")
+    print("hang detection (s)")
+    print("%-16s %8s %8s" % ("target", "p50", "p99"))
+    for name in expected:
+      if name in bench["detection"]:
+        print("%-16s %8.2f %8.2f" % (name, bench["detection"][name]["p50"], bench["detection"][name]["p99"]))
+
+# the change from the baseline, for the numbers an executor change should move
+def print_comparison(baseline, bench):
+  def change(old, new):
+    if(old is None or new is None or old == 0):
+      return "-"
+    return "%+.1f%%" % (100.0 * (new - old) / old)
+  print("")
+  print("compared with %s" % " ".join(baseline.get("args", [])))
+  print("%-20s %10s %10s %8s" % ("", "baseline", "now", "change"))
+  print("%-20s %10.1f %10.1f %8s" % ("runs/s", baseline["runs_per_sec"], bench["runs_per_sec"], \
+    change(baseline["runs_per_sec"], bench["runs_per_sec"])))
+  print("%-20s %9.1f%% %9.1f%% %8s" % ("accuracy", 100 * baseline["accuracy"], 100 * bench["accuracy"], "-"))
+  for test_type in test_types:
+    for p in ("p50", "p99"):
+      old = baseline["latency"].get(test_type, {}).get(p)
+      new = bench["latency"].get(test_type, {}).get(p)
+      print("%-20s %10s %10s %8s" % ("%s %s ms" % (test_type, p), ms(old), ms(new), change(old, new)))
+  for name in expected:
+    old = baseline.get("detection", {}).get(name, {}).get("p50")
+    new = bench["detection"].get(name, {}).get("p50")
+    if(old is not None or new is not None):
+      print("%-20s %10s %10s %8s" % ("%s p50 s" % name, "-" if old is None else "%.2f" % old, \
+        "-" if new is None else "%.2f" % new, change(old, new)))
+
+
+if __name__ == "__main__":
+
+  count = 5
+  size = 1000
+  timeout = 3
+  work_dir = None
+  output = None
+  baseline = None
+
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "n:s:t:d:o:c:h", ["testcases=", "size=", "timeout=", "dir=", "output=", "compare=", "help"])
+  except getopt.GetoptError as err:
+    print("error on arguments")
+    print(usage)
+    sys.exit(1)
+
+  for opt, arg in opts:
+    if(opt in ("-n", "--testcases")):
+      count = int(arg)
+    elif(opt in ("-s", "--size")):
+      size = int(arg)
+    elif(opt in ("-t", "--timeout")):
+      timeout = int(arg)
+    elif(opt in ("-d", "--dir")):
+      work_dir = arg
+    elif(opt in ("-o", "--output")):
+      output = arg
+    elif(opt in ("-c", "--compare")):
+      baseline = arg
+    elif(opt in ("-h", "--help")):
+      print(usage)
+      sys.exit(1)
+
+  # a work_dir given by -d is kept
+  keep = work_dir is not None
+  if(work_dir is None):
+    work_dir = tempfile.mkdtemp(prefix="bench")
+  elif os.path.exists(work_dir):
+    print("%s already exists" % work_dir)
+    sys.exit(1)
+  work_dir = os.path.abspath(work_dir)
+
+  try:
+    bin_dir = os.path.join(work_dir, "bin")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    result_dir = os.path.join(work_dir, "result")
+    configuration_file = os.path.join(work_dir, "bench.conf")
+    build_targets(bin_dir)
+    make_corpus(corpus_dir, count, size)
+    write_configuration(configuration_file, bin_dir)
+
+    # run.py finds ptyjig and the end files from its own directory
+    cmd = [sys.executable, "run.py", configuration_file, "-i", corpus_dir, "-o", result_dir, "-t", str(timeout)] + args
+    print("running: %s" % " ".join(cmd))
+    start = time.monotonic()
+    with open(os.path.join(work_dir, "run.log"), "w") as log:
+      retcode = subprocess.call(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), stdout=log, stderr=subprocess.STDOUT)
+    wall = time.monotonic() - start
+    if(retcode != 0):
+      print("run.py failed with %d, see %s" % (retcode, os.path.join(work_dir, "run.log")))
+      keep = True
+      sys.exit(1)
+
+    bench = analyze(os.path.join(result_dir, "results.db"), wall)
+    bench["args"] = args
+    print_bench(bench)
+    if(baseline is not None):
+      with open(baseline, "r") as f:
+        print_comparison(json.load(f), bench)
+    if(output is not None):
+      with open(output, "w") as f:
+        json.dump(bench, f, indent=1)
+  finally:
+    if(not keep):
+      shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,131 @@
+/*
+ *  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+ *
+ *  This program is distributed in the hope that it will be useful, but
+ *  WITHOUT ANY WARRANTY; without even the implied warranty of
+ *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+ *
+ */
+
+/*
+ *  target -- the synthetic utilities of bench.py.
+ *
+ *  The behaviour is chosen by the name the program is run as, bench.py
+ *  links it under every name:
+ *
+ *     bench_exit      exit at once without reading its input
+ *     bench_segv      read its input, then crash with SIGSEGV
+ *     bench_abort     read its input, then abort (SIGABRT)
+ *     bench_sleep     sleep forever without reading its input
+ *     bench_spin      loop forever on the CPU
+ *     bench_slowread  read its input one byte every 100us, then exit
+ *     bench_flood     read its input, then write 16MB to stdout
+ *     bench_echo      copy its input to stdout
+ *
+ *  The input is the files named by the arguments, or stdin. On a tty it
+ *  ends with the byte ptyjig sends after its input (1), or ^D.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <fcntl.h>
+
+#define FLOOD_SIZE (16 << 20)
+
+static int on_tty;
+
+/* read fd to its end, copying it to stdout if echo, one byte every delay microseconds if delay */
+static int read_fd(int fd, int delay, int echo)
+{
+  char buf[4096];
+  ssize_t n, i;
+
+  for (;;) {
+    n = read(fd, buf, delay ? 1 : sizeof(buf));
+    if (n <= 0)
+      return 0;
+    if (echo && write(1, buf, n) < 0)
+      return -1;
+    if (on_tty)
+      for (i = 0; i < n; i++)
+        if (buf[i] == 1 || buf[i] == 4)
+          return 0;
+    if (delay)
+      usleep(delay);
+  }
+}
+
+/* read the files in argv, or stdin without one */
+static void read_input(int argc, char **argv, int delay, int echo)
+{
+  int i, fd;
+
+  if (argc < 2) {
+    on_tty = isatty(0);
+    read_fd(0, delay, echo);
+    return;
+  }
+  for (i = 1; i < argc; i++) {
+    fd = open(argv[i], O_RDONLY);
+    if (fd < 0) {
+      perror(argv[i]);
+      exit(1);
+    }
+    read_fd(fd, delay, echo);
+    close(fd);
+  }
+}
+
+int main(int argc, char **argv)
+{
+  const char *name = strrchr(argv[0], '/');
+  static char out[65536];
+  volatile unsigned long spins = 0;
+  long written, i;
+
+  name = name ? name + 1 : argv[0];
+
+  if (strcmp(name, "bench_exit") == 0)
+    return 0;
+
+  if (strcmp(name, "bench_segv") == 0) {
+    read_input(argc, argv, 0, 0);
+    *(volatile int *)0 = 0;
+  }
+  else if (strcmp(name, "bench_abort") == 0) {
+    read_input(argc, argv, 0, 0);
+    abort();
+  }
+  else if (strcmp(name, "bench_sleep") == 0) {
+    for (;;)
+      sleep(1000);
+  }
+  else if (strcmp(name, "bench_spin") == 0) {
+    for (;;)
+      spins++;
+  }
+  else if (strcmp(name, "bench_slowread") == 0) {
+    read_input(argc, argv, 100, 0);
+    return 0;
+  }
+  else if (strcmp(name, "bench_flood") == 0) {
+    read_input(argc, argv, 0, 0);
+    /* lines of 64 bytes */
+    memset(out, 'x', sizeof(out));
+    for (i = 63; i < (long)sizeof(out); i += 64)
+      out[i] = '\n';
+    for (written = 0; written < FLOOD_SIZE; written += sizeof(out))
+      if (write(1, out, sizeof(out)) < 0)
+        return 1;
+    return 0;
+  }
+  else if (strcmp(name, "bench_echo") == 0) {
+    read_input(argc, argv, 0, 1);
+    return 0;
+  }
+
+  fprintf(stderr, "%s: unknown target\n", name);
+  return 2;
+}
@@ -0,0 +1,239 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the coordinator of a distributed campaign (run.py -e distributed -l address). run.py makes the jobs of every
+# (line, test case) as usual, and instead of running them, leases them to the workers (worker.py) connected to
+# address, a TCP "host:port" or a Unix socket "unix:path". The results stream back and are merged into the logs,
+# the journal and the result store by run.py like the results of its own workers.
+#
+# The messages are JSON objects, one per line:
+#
+#   worker -> coordinator   {"type": "hello", "name": ..., "slots": n, "token": ...}
+#                           {"type": "want", "count": n}             n more jobs can be leased to the worker
+#                           {"type": "result", "lease": id, "result": [...]}, which also wants one more job
+#                           {"type": "heartbeat"}
+#   coordinator -> worker   {"type": "welcome", "settings": {...}, "heartbeat": seconds}
+#                           {"type": "lease", "lease": id, "job": {...}}
+#                           {"type": "cancel", "leases": [id, ...]}   jobs not to run if not started, the worker
+#                                                                     wants one more job for each one it drops
+#                           {"type": "done"}                          every job is done, the worker exits
+#
+# A worker sends a message at least every heartbeat seconds. Once it has been silent for lease_time seconds, or its
+# connection is closed, it is dropped and its jobs are leased again to the other workers (first the ones dropped).
+# A job without a result lease_deadline seconds after it was leased is leased again too, the worker may be alive
+# but stuck on it. A job has a single result: the result of a job leased twice is merged once. A job that run.py
+# skips (its utility was not found) is done without a result, and cancelled if it was leased already.
+#
+# The workers run the commands the coordinator sends them. A TCP address listens on the loopback interface unless
+# a host is given, and a worker connecting over TCP must send the token of the campaign in its hello (the
+# FUZZ_TOKEN environment variable, or a random token printed by run.py), otherwise it is turned away. Both must
+# still only be reachable from trusted hosts, the messages are not encrypted.
+
+import os
+import hmac
+import json
+import time
+import asyncio
+import secrets
+import collections
+
+# seconds without a message from a worker before its leases are given to others
+lease_time = 30
+heartbeat_interval = 5
+
+# seconds a new connection has to say hello
+hello_timeout = 10
+
+# the environment variable with the token of a campaign, shared by the coordinator and its workers
+token_variable = "FUZZ_TOKEN"
+
+# seconds a job may stay leased to a worker before it is leased again, for runs of at most timeout seconds: the job
+# may wait in the queue of the worker for the one before it (see worker.py), and a run takes a little longer than
+# its timeout to be prepared, killed and sent back
+def lease_deadline(timeout):
+  return 2 * (timeout + heartbeat_interval) + lease_time
+
+# the token of a campaign, from the environment or a new random one
+def campaign_token():
+  return os.environ.get(token_variable) or secrets.token_hex(16)
+
+# "unix:path" (or a path) or "host:port", as ("unix", path) or ("tcp", host, port). An empty host is the loopback
+# interface, 0.0.0.0 (or ::) is every interface
+def parse_address(text):
+  if text.startswith("unix:"):
+    return ("unix", text[len("unix:"):])
+  if "/" in text:
+    return ("unix", text)
+  host, _, port = text.rpartition(":")
+  return ("tcp", host, int(port))
+
+def encode(message):
+  return (json.dumps(message) + "\n").encode()
+
+# the next message of a connection, None once it is closed
+async def read_message(reader):
+  line = await reader.readline()
+  if not line:
+    return None
+  return json.loads(line)
+
+# serve jobs to the workers until every job has a result. on_result gets the result of every job, as returned by
+# run.run_job. The workers connecting over TCP must send token
+async def serve(jobs, address, settings, on_result, token=None, skip=None):
+  loop = asyncio.get_running_loop()
+  state = {"queue": collections.deque(range(len(jobs))), "done": set(), "workers": [], "finished": loop.create_future(), \
+    "handlers": set()}
+  if not jobs:
+    return
+  deadline = lease_deadline(settings["timeout"])
+
+  def send(worker, message):
+    if(not worker["lost"]):
+      worker["writer"].write(encode(message))
+
+  # lease the queued jobs to the workers that want them
+  def dispatch():
+    for worker in state["workers"]:
+      while worker["wanted"] > 0 and state["queue"]:
+        lease = state["queue"].popleft()
+        if lease in state["done"]:
+          continue
+        if(skip is not None and skip(jobs[lease])):
+          finish(lease)
+          continue
+        worker["leases"][lease] = time.monotonic() + deadline
+        worker["wanted"] -= 1
+        send(worker, {"type": "lease", "lease": lease, "job": jobs[lease]})
+
+  # drop a worker, its jobs without a result are leased again first
+  def lose(worker, why):
+    if(worker["lost"]):
+      return
+    worker["lost"] = True
+    state["workers"].remove(worker)
+    requeued = sorted(lease for lease in worker["leases"] if lease not in state["done"])
+    state["queue"].extendleft(reversed(requeued))
+    worker["writer"].close()
+    if(not state["finished"].done()):
+      print("worker %s %s, %d jobs requeued" % (worker["name"], why, len(requeued)))
+    dispatch()
+
+  # lease again the jobs of a worker leased too long ago, it goes on with its other jobs
+  def requeue_overdue(worker, now):
+    overdue = sorted(lease for lease, due in worker["leases"].items() if due < now)
+    for lease in overdue:
+      del worker["leases"][lease]
+    overdue = [lease for lease in overdue if lease not in state["done"]]
+    if overdue:
+      state["queue"].extendleft(reversed(overdue))
+      print("worker %s has %d overdue jobs, requeued" % (worker["name"], len(overdue)))
+      dispatch()
+
+  def finish_result(worker, lease, result):
+    worker["leases"].pop(lease, None)
+    worker["wanted"] += 1
+    if lease in state["done"] or not 0 <= lease < len(jobs):
+      return
+    on_result(tuple(result))
+    finish(lease)
+    cancel_skipped()
+
+  # a job is done, with a result or skipped. Once all of them are, the workers are told
+  def finish(lease):
+    state["done"].add(lease)
+    if(len(state["done"]) == len(jobs) and not state["finished"].done()):
+      for other in state["workers"]:
+        send(other, {"type": "done"})
+      state["finished"].set_result(True)
+
+  # the leased jobs skipped after the last result are done, their workers drop them if they did not start them
+  def cancel_skipped():
+    if(skip is None):
+      return
+    for worker in list(state["workers"]):
+      cancelled = [lease for lease in worker["leases"] if lease not in state["done"] and skip(jobs[lease])]
+      for lease in cancelled:
+        del worker["leases"][lease]
+        finish(lease)
+      if cancelled:
+        send(worker, {"type": "cancel", "leases": cancelled})
+
+  async def handle(reader, writer):
+    state["handlers"].add(asyncio.current_task())
+    try:
+      hello = await asyncio.wait_for(read_message(reader), hello_timeout)
+    except (asyncio.TimeoutError, ConnectionError, ValueError):
+      hello = None
+    if(hello is None or hello.get("type") != "hello"):
+      writer.close()
+      return
+    if(token is not None and not hmac.compare_digest(str(hello.get("token", "")).encode(), token.encode())):
+      print("worker %s turned away, bad token" % hello.get("name", "?"))
+      writer.close()
+      return
+    worker = {"name": hello.get("name", "?"), "writer": writer, "wanted": 0, "leases": {}, \
+      "last_seen": time.monotonic(), "lost": False}
+    if(state["finished"].done()):
+      writer.write(encode({"type": "done"}))
+      writer.close()
+      return
+    state["workers"].append(worker)
+    print("worker %s joined with %d slots" % (worker["name"], hello.get("slots", 0)))
+    send(worker, {"type": "welcome", "settings": settings, "heartbeat": heartbeat_interval})
+    why = "disconnected"
+    try:
+      while not worker["lost"]:
+        message = await read_message(reader)
+        if(message is None):
+          break
+        worker["last_seen"] = time.monotonic()
+        if(message["type"] == "want"):
+          worker["wanted"] += message["count"]
+        elif(message["type"] == "result"):
+          finish_result(worker, message["lease"], message["result"])
+        dispatch()
+        await writer.drain()
+    except (ConnectionError, ValueError, KeyError) as err:
+      why = "failed (%s)" % err
+    finally:
+      lose(worker, why)
+
+  # drop the workers that have been silent for too long, and lease again the jobs leased too long ago
+  async def expire():
+    while True:
+      await asyncio.sleep(heartbeat_interval)
+      now = time.monotonic()
+      for worker in list(state["workers"]):
+        if(now - worker["last_seen"] > lease_time):
+          lose(worker, "timed out")
+        else:
+          requeue_overdue(worker, now)
+
+  if(address[0] == "unix"):
+    if os.path.exists(address[1]):
+      os.unlink(address[1])
+    server = await asyncio.start_unix_server(handle, address[1])
+  else:
+    server = await asyncio.start_server(handle, address[1] or "localhost", address[2])
+  expiry = asyncio.ensure_future(expire())
+  try:
+    await state["finished"]
+  finally:
+    expiry.cancel()
+    server.close()
+    for worker in list(state["workers"]):
+      lose(worker, "closed")
+    await server.wait_closed()
+    # the connections closed above end their handlers
+    await asyncio.gather(*state["handlers"], return_exceptions=True)
+    if(address[0] == "unix" and os.path.exists(address[1])):
+      os.unlink(address[1])
+
+# lease jobs to the workers connecting to address (see parse_address) and pass every result to on_result.
+# settings are sent to the workers (the timeout of a run), the workers connecting over TCP must send token. A job
+# for which skip(job) is true when it would be leased is done without running
+def run_jobs(jobs, address, settings, on_result, token=None, skip=None):
+  asyncio.run(serve(jobs, address, settings, on_result, token, skip))
@@ -0,0 +1,304 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the test cases of run.py, identified by the sha256 of their content. The tiny files of the Small datasets (and
+# every empty file) are often identical, and running a utility twice on the same bytes tells nothing new, so only
+# the first test case in name order of every content is run and the others are its aliases: they are recorded with
+# its runs in results.db and listed in result_dir/duplicates.
+#
+# The digests of a dataset made by ../generate_test/generate.py are taken from its manifest (test_dir.manifest)
+# for the files whose size still matches it, the other files are hashed.
+#
+# A test case can be compressed, by gzip (t0.gz) or zstd (t0.zst, with the zstandard module). Its content is what
+# is tested: stdin gets it decompressed through a pipe (see launch.spawn), and the runs that need a file (file, cp,
+# two_files) stage it from a cache of decompressed test cases, whose least recently used files are removed once it
+# holds more than its budget.
+#
+# With run.py -m, every process running tests also keeps the content of the test cases it read last in memory, up
+# to a budget, so a test case given as stdin to many utilities is read from disk once and fed from memory through a
+# pipe (see launch.spawn).
+#
+# test_dir can also be a pack of test cases (see pack.py), whose test cases are named test_dir/name. They are read
+# from the mapping of the pack, so their content is always in memory like the ones of the memory cache, and they are
+# staged from the cache of decompressed test cases like the compressed ones.
+
+import io
+import os
+import json
+import gzip
+import stat
+import shutil
+import hashlib
+import threading
+import collections
+
+import staging
+import pack
+
+# zstandard is only needed by .zst test cases
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# the compression of a test case, by its suffix
+compressions = {".gz": "gzip", ".zst": "zstd"}
+
+chunk_size = 1 << 20
+
+# the content of the test cases in memory, by (path, size, mtime), the least recently used first, and their bytes.
+# Nothing is kept with a budget of 0
+memory_cache = collections.OrderedDict()
+memory_budget = 0
+memory_bytes = 0
+# the async engine of run.py prepares its jobs in threads (see scheduler.py), the cache is changed under this lock
+memory_lock = threading.Lock()
+
+# the packs opened by this process, by path
+packs = {}
+
+# the compression of the test case at path, None if it is not compressed
+def compression(path):
+  return compressions.get(os.path.splitext(path)[1])
+
+# the state of the pack (see pack.open_pack) holding the test case at path and its name in it, None if it is a file
+def packed(path):
+  pack_path, name = os.path.split(path)
+  if pack_path not in packs:
+    if(not pack_path.endswith(".pack") or not os.path.isfile(pack_path)):
+      return None
+    packs[pack_path] = pack.open_pack(pack_path)
+  if name not in packs[pack_path]["entries"]:
+    return None
+  return packs[pack_path], name
+
+# whether the test case at path is a file that can be used as it is, neither compressed nor in a pack
+def plain(path):
+  return compression(path) is None and packed(path) is None
+
+# the paths of the test cases in test_dir, a directory or a pack, whose name starts with prefix, sorted
+def list_testcases(test_dir, prefix=""):
+  if os.path.isfile(test_dir):
+    if(test_dir not in packs):
+      packs[test_dir] = pack.open_pack(test_dir)
+    names = packs[test_dir]["names"]
+  else:
+    names = os.listdir(test_dir)
+  return sorted(os.path.join(test_dir, name) for name in names if name.startswith(prefix))
+
+# the size of the content and the mtime of the test case at path, the ones of its pack if it is packed
+def testcase_stat(path):
+  member = packed(path)
+  if(member is not None):
+    return member[0]["entries"][member[1]][1], os.stat(member[0]["path"]).st_mtime_ns
+  st = os.stat(path)
+  return st.st_size, st.st_mtime_ns
+
+# the name of a test case without the suffix of its compression, which is also the name it is staged with
+def staged_name(path):
+  name = os.path.basename(path)
+  if(compression(path) is not None):
+    name = os.path.splitext(name)[0]
+  return name
+
+# open the test case at path for reading its content
+def open_testcase(path):
+  member = packed(path)
+  if(member is not None):
+    return io.BytesIO(pack.member(*member))
+  kind = compression(path)
+  if(kind == "gzip"):
+    return gzip.open(path, "rb")
+  if(kind == "zstd"):
+    if(zstandard is None):
+      raise OSError("%s: the zstandard module is needed for .zst test cases" % path)
+    return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+  return open(path, "rb")
+
+# the size and sha256 of the content of a test case
+def file_digest(path):
+  h = hashlib.sha256()
+  size = 0
+  with open_testcase(path) as f:
+    while True:
+      data = f.read(chunk_size)
+      if not data:
+        break
+      h.update(data)
+      size = size + len(data)
+  return size, h.hexdigest()
+
+# the (size of the file, sha256 of the content) of every file in the manifest of test_dir, by file name. Empty
+# without a manifest
+def manifest_digests(test_dir):
+  manifest_path = test_dir.rstrip(os.sep) + ".manifest"
+  if not os.path.isfile(manifest_path):
+    return {}
+  try:
+    with open(manifest_path, "r") as f:
+      manifest = json.load(f)
+    return dict((entry.get("file", entry["name"]), (entry.get("stored_size", entry["size"]), entry["sha256"])) \
+      for entry in manifest["files"])
+  except (ValueError, KeyError, TypeError):
+    return {}
+
+# the sha256 of the content of every test case of testcase_list (paths in test_dir), by path. What is not a
+# regular file has none
+def digests(testcase_list, test_dir):
+  known = manifest_digests(test_dir)
+  found = {}
+  for path in testcase_list:
+    member = packed(path)
+    if(member is None and not os.path.isfile(path)):
+      continue
+    entry = known.get(os.path.basename(path))
+    if(member is not None):
+      found[path] = member[0]["entries"][member[1]][2]
+    elif(entry is not None and entry[0] == os.path.getsize(path)):
+      found[path] = entry[1]
+    else:
+      found[path] = file_digest(path)[1]
+  return found
+
+# split testcase_list (sorted paths in test_dir) into the test cases to run, in the same order, and the aliases of
+# each one that has duplicates, {path: [paths of the same content]}. What is not a regular file is kept as it is.
+# testcase_digests are the digests of the test cases if they are known (see digests)
+def dedup(testcase_list, test_dir, testcase_digests=None):
+  if(testcase_digests is None):
+    testcase_digests = digests(testcase_list, test_dir)
+  first = {}
+  unique = []
+  aliases = {}
+  for path in testcase_list:
+    digest = testcase_digests.get(path)
+    if(digest is None):
+      unique.append(path)
+    elif digest in first:
+      aliases.setdefault(first[digest], []).append(path)
+    else:
+      first[digest] = path
+      unique.append(path)
+  return unique, aliases
+
+# list every test case run for its aliases, one line each: the test case then its aliases
+def write_duplicates(path, aliases):
+  with open(path, "w") as f:
+    for testcase in sorted(aliases):
+      f.write("%s %s\n" % (os.path.basename(testcase), " ".join(os.path.basename(alias) for alias in aliases[testcase])))
+
+# remove the least recently used files of cache_dir until it holds at most budget bytes, keeping keep
+def evict(cache_dir, budget, keep):
+  entries = []
+  total = 0
+  for entry in os.scandir(cache_dir):
+    if entry.name.endswith(".tmp"):
+      continue
+    try:
+      st = entry.stat()
+    except FileNotFoundError:
+      continue
+    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    total = total + st.st_size
+  entries.sort()
+  for mtime, size, path in entries:
+    if(total <= budget):
+      break
+    if(path == keep):
+      continue
+    try:
+      os.unlink(path)
+    except FileNotFoundError:
+      pass
+    total = total - size
+
+# the path of the content of the compressed or packed test case at path in cache_dir, writing it there if it is
+# not cached yet. A cached file is named after the test case, its size and its mtime, so a changed test case is
+# written again, and its mtime is the last time it was used. Like ptyinput.cached_input, the file is written
+# under a temporary name of its process and thread and renamed, and is read-only
+def materialize(cache_dir, path, budget):
+  size, mtime = testcase_stat(path)
+  key = "%s\0%d\0%d" % (os.path.abspath(path), size, mtime)
+  cached = os.path.join(cache_dir, "%s-%s" % (hashlib.sha256(key.encode()).hexdigest()[:32], staged_name(path)))
+  try:
+    os.utime(cached)
+    return cached
+  except FileNotFoundError:
+    pass
+  if not os.path.exists(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+  tmp_path = "%s.%d.%d.tmp" % (cached, os.getpid(), threading.get_ident())
+  member = packed(path)
+  with open(tmp_path, "wb") as out:
+    if(member is not None):
+      out.write(pack.member(*member))
+    else:
+      with open_testcase(path) as f:
+        shutil.copyfileobj(f, out, chunk_size)
+  os.chmod(tmp_path, 0o444)
+  os.replace(tmp_path, cached)
+  evict(cache_dir, budget, cached)
+  return cached
+
+# stage the content of the test case at path as dst (see staging.stage_file), from cache_dir if it is compressed
+# or packed
+def stage(cache_dir, path, dst, budget, writable=False):
+  if plain(path):
+    return staging.stage_file(path, dst, writable)
+  # another worker may remove the cached file before it is staged
+  for attempt in range(3):
+    try:
+      return staging.stage_file(materialize(cache_dir, path, budget), dst, writable)
+    except FileNotFoundError:
+      if not os.path.exists(path):
+        raise
+  return staging.stage_file(materialize(cache_dir, path, budget), dst, writable)
+
+# keep at most budget bytes of test cases in memory from now on
+def set_memory_budget(budget):
+  global memory_budget
+  with memory_lock:
+    memory_budget = budget
+    trim_memory()
+
+# forget the least recently used test cases until the memory cache fits its budget
+def trim_memory():
+  global memory_bytes
+  while memory_bytes > memory_budget:
+    key, content = memory_cache.popitem(last=False)
+    memory_bytes = memory_bytes - len(content)
+
+# the content of the test case at path from the memory cache, read into it if it is not there yet, or from the
+# mapping of its pack. None if there is no memory cache, or path is not a regular file or is larger than the budget
+def cached_content(path):
+  global memory_bytes
+  member = packed(path)
+  if(member is not None):
+    return pack.member(*member)
+  if(memory_budget <= 0):
+    return None
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  if(not stat.S_ISREG(st.st_mode) or st.st_size > memory_budget):
+    return None
+  key = (path, st.st_size, st.st_mtime_ns)
+  with memory_lock:
+    content = memory_cache.get(key)
+    if(content is not None):
+      memory_cache.move_to_end(key)
+      return content
+  with open_testcase(path) as f:
+    content = f.read(memory_budget + 1)
+  # a compressed test case can be larger than the budget once decompressed
+  if(len(content) > memory_budget):
+    return None
+  with memory_lock:
+    if key not in memory_cache:
+      memory_cache[key] = content
+      memory_bytes = memory_bytes + len(content)
+      trim_memory()
+  return content
@@ -0,0 +1,306 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# distill a corpus for utilities built with coverage: most test cases take the same paths through a utility, so
+# the test cases of test_dir are run once on every line of config_file, like run.py does, the coverage of every
+# run is collected, and for every line a small set of test cases covering everything the whole corpus covers is
+# chosen greedily (the test case covering the most that is not covered yet, until none covers more). The test cases
+# whose run failed or hung are kept too. The chosen test cases of all the lines are copied to output_dir, which a
+# regression campaign then runs instead of test_dir, and output_dir.distill lists the ones of every line.
+#
+# The coverage of a run is collected from
+#
+#   gcov     a utility built with --coverage (gcc or clang): the .gcda files of every run are written to its own
+#            directory (GCOV_PREFIX), and a counter of a function that is not 0 is a feature. A utility killed by a
+#            signal or a timeout writes no .gcda file, and covers nothing
+#   sancov   a utility built with -fsanitize-coverage and a sanitizer: the .sancov files of every run are written
+#            to its own directory (coverage=1:coverage_dir in ASAN_OPTIONS, UBSAN_OPTIONS and MSAN_OPTIONS), and
+#            a pc is a feature
+#
+# The runs are made in parallel, one per job, each in its own scratch directory. Like run.py, it is run from
+# ./run_test, e.g.
+#
+#   python3 distill.py ../test_Linux/run.coreutils -i ../../testcases/Large3 -o ../../testcases/Large3.min -c gcov -j 8
+
+import os
+import sys
+import json
+import heapq
+import getopt
+import shutil
+import struct
+import random
+import tempfile
+import multiprocessing
+
+import run
+import corpus
+
+usage = "Usage: python3 distill.py configuration_file -i test_dir -o output_dir [-c gcov|sancov] [-p prefix] [-t timeout] [-j jobs] [-b ptyjig|python] [-s seed]"
+
+coverage_modes = ("gcov", "sancov")
+
+# the sanitizers writing .sancov files
+sanitizer_options = ("ASAN_OPTIONS", "UBSAN_OPTIONS", "MSAN_OPTIONS")
+
+gcda_magic = 0x67636461
+gcda_function_tag = 0x01000000
+gcda_arcs_tag = 0x01a10000
+
+sancov_magic64 = 0xC0BFFFFFFFFFFF64
+sancov_magic32 = 0xC0BFFFFFFFFFFF32
+
+# the features of the .gcda file data, named name: (name, function, counter) for the arc counters that are not 0.
+# The header has a checksum and the lengths of the records are in bytes since gcc 12, in words before, so both are
+# tried. Empty if it is not a .gcda file
+def gcda_features(name, data):
+  for header_words, unit in ((4, 1), (3, 4)):
+    features = set()
+    pos = 4 * header_words
+    function = None
+    if(len(data) < pos or struct.unpack_from("<I", data, 0)[0] != gcda_magic):
+      return features
+    while pos + 8 <= len(data):
+      tag, length = struct.unpack_from("<Ii", data, pos)
+      if(tag == 0):
+        break
+      pos = pos + 8
+      # a record of counters that are all 0 has no data and a negative length
+      if(length < 0):
+        continue
+      length = length * unit
+      if(pos + length > len(data)):
+        break
+      if(tag == gcda_function_tag and length >= 4):
+        function = struct.unpack_from("<I", data, pos)[0]
+      elif(tag == gcda_arcs_tag):
+        for counter in range(length // 8):
+          if(struct.unpack_from("<q", data, pos + 8 * counter)[0] != 0):
+            features.add((name, function, counter))
+      pos = pos + length
+    # the file ends with a 0 word
+    if(pos == len(data) or data[pos:] == b"\0" * (len(data) - pos)):
+      return features
+  return set()
+
+# the features of the .sancov file data of module: (module, pc)
+def sancov_features(module, data):
+  if(len(data) < 8):
+    return set()
+  magic = struct.unpack_from("<Q", data, 0)[0]
+  if(magic == sancov_magic64):
+    pcs = struct.unpack_from("<%dQ" % ((len(data) - 8) // 8), data, 8)
+  elif(magic == sancov_magic32):
+    pcs = struct.unpack_from("<%dI" % ((len(data) - 8) // 4), data, 8)
+  else:
+    return set()
+  return set((module, pc) for pc in pcs)
+
+# the features of the files written to coverage_dir by a run
+def read_coverage(mode, coverage_dir):
+  features = set()
+  for root, dirs, files in os.walk(coverage_dir):
+    for name in files:
+      path = os.path.join(root, name)
+      if(mode == "gcov" and name.endswith(".gcda")):
+        with open(path, "rb") as f:
+          features |= gcda_features(os.path.relpath(path, coverage_dir), f.read())
+      elif(mode == "sancov" and name.endswith(".sancov")):
+        # named module.pid.sancov
+        with open(path, "rb") as f:
+          features |= sancov_features(name.rsplit(".", 2)[0], f.read())
+  return features
+
+# have the utilities run from now on write their coverage to coverage_dir
+def set_coverage_env(mode, coverage_dir, saved):
+  if(mode == "gcov"):
+    os.environ["GCOV_PREFIX"] = coverage_dir
+    os.environ["GCOV_PREFIX_STRIP"] = "0"
+  else:
+    for name in sanitizer_options:
+      options = [saved[name]] if saved.get(name) else []
+      os.environ[name] = ":".join(options + ["coverage=1", "coverage_dir=%s" % coverage_dir])
+
+# the environment of the worker before set_coverage_env
+saved_env = {}
+coverage_mode = "gcov"
+coverage_root = ""
+
+def init_worker(scratch_root, worker_timeout, mode, root):
+  global coverage_mode, coverage_root
+  run.init_worker(scratch_root, worker_timeout)
+  coverage_mode = mode
+  coverage_root = root
+  for name in sanitizer_options:
+    saved_env[name] = os.environ.get(name)
+
+# run a job like run.run_job with its coverage written to a directory of its own, return the line and position of
+# the job, its result in the result store (see run.store_row) and the features it covered
+def covered_job(job):
+  coverage_dir = os.path.join(coverage_root, "c%d" % os.getpid())
+  shutil.rmtree(coverage_dir, ignore_errors=True)
+  os.makedirs(coverage_dir)
+  set_coverage_env(coverage_mode, coverage_dir, saved_env)
+  line_no, index, records, not_found, result = run.run_job(job)
+  features = read_coverage(coverage_mode, coverage_dir)
+  shutil.rmtree(coverage_dir, ignore_errors=True)
+  return line_no, index, run.store_row(job, result, not_found, None)["result"], features
+
+# the smallest set of test cases the greedy way: features is the features of every test case, in the order ties
+# are broken in. Return the test cases chosen, in the order they were chosen, and the features they cover
+def greedy_cover(features):
+  covered = set()
+  chosen = []
+  # a max heap of the gain of every test case when it was last computed, which can only have shrunk since
+  heap = [(-len(found), order, testcase) for order, (testcase, found) in enumerate(features) if found]
+  heapq.heapify(heap)
+  found_by = dict(features)
+  while heap:
+    gain, order, testcase = heapq.heappop(heap)
+    gain = len(found_by[testcase] - covered)
+    if(gain == 0):
+      continue
+    if(heap and gain < -heap[0][0]):
+      heapq.heappush(heap, (-gain, order, testcase))
+      continue
+    chosen.append(testcase)
+    covered |= found_by[testcase]
+  return chosen, covered
+
+
+if __name__ == "__main__":
+
+  test_dir = None
+  output_dir = None
+  mode = "gcov"
+  prefix = ""
+  timeout = 10
+  workers = os.cpu_count() or 1
+  seed = None
+
+  if(len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help")):
+    print(usage)
+    sys.exit(1)
+
+  configuration_file = sys.argv[1]
+  try:
+    opts, args = getopt.getopt(sys.argv[2:], "i:o:c:p:t:j:b:s:", ["ifile=", "ofile=", "coverage=", "prefix=", \
+      "timeout=", "jobs=", "backend=", "seed="])
+  except getopt.GetoptError as err:
+    print("error on arguments")
+    print(usage)
+    sys.exit(1)
+
+  for opt, arg in opts:
+    if(opt in ("-i", "--ifile")):
+      test_dir = arg
+    elif(opt in ("-o", "--ofile")):
+      output_dir = arg
+    elif(opt in ("-c", "--coverage")):
+      mode = arg
+    elif(opt in ("-p", "--prefix")):
+      prefix = arg
+    elif(opt in ("-t", "--timeout")):
+      timeout = int(arg)
+    elif(opt in ("-j", "--jobs")):
+      workers = int(arg)
+    elif(opt in ("-b", "--backend")):
+      run.pty_backend = arg
+    elif(opt in ("-s", "--seed")):
+      seed = arg
+
+  if(test_dir is None or output_dir is None or mode not in coverage_modes):
+    print(usage)
+    sys.exit(1)
+  if not os.path.isfile(configuration_file):
+    print("%s does not exist" % configuration_file)
+    sys.exit(1)
+  if not os.path.exists(test_dir):
+    print("%s is not a directory or a pack" % test_dir)
+    sys.exit(1)
+  if os.path.exists(output_dir):
+    print("%s already exists" % output_dir)
+    sys.exit(1)
+  if(seed is None):
+    seed = str(random.randrange(2**32))
+
+  output_dir = os.path.abspath(output_dir)
+  run.ptyjig_path = os.path.abspath(run.ptyjig_path)
+  run.end_dir = os.path.abspath(run.end_dir)
+  work_root = tempfile.mkdtemp(prefix="distill.", dir=os.path.dirname(output_dir))
+  run.pty_input_dir = os.path.join(work_root, "pty_input")
+  run.corpus_cache_dir = os.path.join(work_root, "corpus_cache")
+  scratch_root = os.path.join(work_root, "scratch")
+  coverage_dir = os.path.join(work_root, "coverage")
+  os.makedirs(scratch_root)
+  os.makedirs(coverage_dir)
+
+  testcase_list, aliases = corpus.dedup(corpus.list_testcases(test_dir, prefix), test_dir)
+  print("Test cases are %d, %d with the content of another" % (len(testcase_list), \
+    sum(len(others) for others in aliases.values())))
+  print("Coverage is %s" % mode)
+  print("Seed is %s" % seed)
+
+  # the jobs of every line, and the line of every job
+  lines = {}
+  jobs = []
+  with open(configuration_file, "r") as f:
+    for line_no, line in enumerate(f):
+      line = line.strip()
+      if(line == "" or run.line_commented(line)):
+        continue
+      if not run.line_syntax_valid(line):
+        print("invalid syntax: %s" % line)
+        continue
+      try:
+        cmd, streams, test_type, utility_name, new_file_name, all_options_from_pool, log_name = run.parse_a_line(line)
+      except ValueError as err:
+        print("invalid syntax: %s (%s)" % (line, err))
+        continue
+      lines[line_no] = line
+      jobs.extend(run.make_jobs(line_no, line, seed, cmd, streams, test_type, utility_name, new_file_name, \
+        all_options_from_pool, testcase_list))
+
+  # the features and the result of every (line, test case)
+  features = dict((line_no, [(testcase, set()) for testcase in testcase_list]) for line_no in lines)
+  failing = dict((line_no, set()) for line_no in lines)
+  not_found = set()
+  try:
+    pool = multiprocessing.Pool(workers, init_worker, (scratch_root, timeout, mode, coverage_dir))
+    for line_no, index, result, found in pool.imap_unordered(covered_job, jobs):
+      features[line_no][index][1].update(found)
+      if(result in ("failed", "hung")):
+        failing[line_no].add(testcase_list[index])
+      elif(result == "not found"):
+        not_found.add(line_no)
+    pool.close()
+    pool.join()
+
+    distilled = {}
+    chosen_paths = set()
+    for line_no, line in sorted(lines.items()):
+      if line_no in not_found:
+        print("not found: %s" % line)
+        continue
+      chosen, covered = greedy_cover(features[line_no])
+      kept = chosen + sorted(failing[line_no] - set(chosen))
+      print("%s: %d test cases cover %d features, %d failed or hung" % (line, len(chosen), len(covered), \
+        len(failing[line_no])))
+      distilled[line] = {"testcases": [corpus.staged_name(path) for path in kept], "features": len(covered), \
+        "covering": len(chosen), "failing": len(failing[line_no])}
+      chosen_paths.update(kept)
+
+    # the test cases are saved under their names without the suffix of their compression
+    os.makedirs(output_dir)
+    for path in sorted(chosen_paths):
+      corpus.stage(run.corpus_cache_dir, path, os.path.join(output_dir, corpus.staged_name(path)), run.corpus_cache_size, \
+        writable=True)
+    with open(output_dir + ".distill", "w") as f:
+      json.dump({"test_dir": os.path.abspath(test_dir), "coverage": mode, "seed": seed, "lines": distilled}, f, \
+        indent=1)
+    print("%d of %d test cases saved to %s" % (len(chosen_paths), len(testcase_list), output_dir))
+  finally:
+    shutil.rmtree(work_root, ignore_errors=True)
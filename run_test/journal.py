@@ -0,0 +1,72 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the progress journal of a campaign (result_dir/journal). Every finished test case appends one JSON line with
+# its key (configuration line, test case, sampled options, and the digests of the content it ran on) and its
+# records for the log. A restarted run.py replays the journaled results instead of running those test cases again,
+# so an interrupted campaign resumes at the next test case. A test case whose content changed under the same name
+# (another dataset in the same test_dir, or the result_dir reused with another test_dir) is run again. The first line holds the seed of the campaign, which makes the sampled options the
+# same after a restart.
+#
+# Lines are written as soon as a result arrives, and fsync'ed at most every sync_interval seconds or
+# sync_count lines. A line cut by a crash is ignored.
+
+import os
+import json
+import time
+
+sync_interval = 1.0
+sync_count = 64
+
+# the key of a test case in the journal. digests are the sha256 of the files the job runs on (see corpus.digests),
+# None for what is not a file
+def job_key(line, testcase, options, digests):
+  return json.dumps([line, os.path.basename(testcase), options, digests])
+
+# read the journal at path, return its seed (None if there is no journal) and a dict key -> (records, not_found)
+def read_journal(path):
+  seed = None
+  results = {}
+  if not os.path.isfile(path):
+    return seed, results
+  with open(path, "r") as f:
+    for text in f:
+      try:
+        entry = json.loads(text)
+      except ValueError:
+        continue
+      if("seed" in entry):
+        seed = entry["seed"]
+      elif("key" in entry):
+        results[entry["key"]] = (entry["records"], entry["not_found"])
+  return seed, results
+
+# open the journal for appending. The seed is written if it is not the seed of the journal (old_seed), the last
+# seed of the journal is the one a restart uses
+def open_journal(path, seed, old_seed):
+  state = {"file": open(path, "a"), "unsynced": 0, "last_sync": time.monotonic()}
+  if(seed != old_seed):
+    state["file"].write(json.dumps({"seed": seed}) + "\n")
+    sync_journal(state)
+  return state
+
+def sync_journal(state):
+  state["file"].flush()
+  os.fsync(state["file"].fileno())
+  state["unsynced"] = 0
+  state["last_sync"] = time.monotonic()
+
+# append the result of a test case
+def write_result(state, key, records, not_found):
+  state["file"].write(json.dumps({"key": key, "records": records, "not_found": not_found}) + "\n")
+  state["file"].flush()
+  state["unsynced"] += 1
+  if(state["unsynced"] >= sync_count or time.monotonic() - state["last_sync"] >= sync_interval):
+    sync_journal(state)
+
+def close_journal(state):
+  sync_journal(state)
+  state["file"].close()
@@ -0,0 +1,597 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# launch the utilities under test without a shell. The argv is spawned directly with posix_spawn, stdin is the
+# test case opened by the harness, and the return code is reported the way /bin/sh did, so the result files
+# keep their meaning (127 not found, 128 + signal number for a crash).
+#
+# Every run is the leader of its own session and process group. A run that times out gets SIGTERM, then SIGKILL
+# kill_grace seconds later, sent to its whole process group and to its descendants that left the group (like the
+# utility run by ptyjig). Processes of the group still alive once the run is over are killed and reported as leaked.
+#
+# The resources of a run are accounted: its rusage comes from wait4 (peak RSS, user and system CPU, context
+# switches) and its stdout and stderr go to a pipe the harness drains and counts instead of /dev/null. exec does
+# not reset the peak RSS on Linux, the one of wait4 is at least the one of the harness, so it is only kept when
+# above. A run with an as limit, or with run.py --peak-rss, is started by ../src/peakrss when it is built instead:
+# peakrss forks the utility from a small process and reports its own peak RSS in a pipe, for one more fork and
+# exec. Limits can be set (run.py -r): RLIMIT_AS, RLIMIT_CPU, RLIMIT_FSIZE and RLIMIT_CORE before exec, and a
+# maximum of output bytes, after which the run is killed. A run over a limit is reported as exceeding it rather
+# than as a crash.
+#
+# A compressed test case (see corpus.py) given as stdin is decompressed by a thread of the harness into a pipe
+# that is the stdin of the child, so it is never written to disk. A test case in the memory cache of corpus.py is
+# fed the same way from memory, a small one is written into the pipe before the child starts, without a thread.
+#
+# A line of run.py can redirect stdout and stderr to files, or pipe stdout into another command (see
+# run.parse_streams). The command of a pipe is started before the utility in a session of its own, its output is
+# counted like the one of the utility, and it is waited for when the utility is reaped. The return code of the
+# run is the one of the utility, not of the last command like in a shell.
+
+import os
+import sys
+import select
+import signal
+import time
+import threading
+import subprocess
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+import watchdog
+import tracing
+import corpus
+
+# seconds between SIGTERM and SIGKILL
+kill_grace = 1
+
+# Popen objects of the children started with a cwd, kept until the child is reaped by reap(), otherwise
+# subprocess could reap them behind our back
+popen_children = {}
+
+# accounts of the children started with one, kept until the child is reaped by reaped()
+accounting = {}
+
+# the Popen objects of the commands the output of a child is piped into, by the pid of the child, kept until the
+# child is reaped by reaped()
+pipe_commands = {}
+
+# the limits of run.py -r, name -> (resource, unit of the value given to -r)
+rlimit_names = {"as": ("RLIMIT_AS", 1 << 20), "cpu": ("RLIMIT_CPU", 1), "fsize": ("RLIMIT_FSIZE", 1 << 20), \
+  "core": ("RLIMIT_CORE", 1 << 20)}
+# the output limit, in MB
+output_unit = 1 << 20
+
+# a run that failed with a peak RSS of at least this part of its RLIMIT_AS ran out of memory
+memory_ratio = 0.5
+
+# the shim reporting the peak RSS of a run, see peakrss.c
+peakrss_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "peakrss")
+
+# a buffer the output of the children is drained into
+drain_buffer = bytearray(65536)
+
+# parse "as=1024,cpu=60,fsize=256,core=0,output=64" (MB and seconds) into name -> bytes or seconds.
+# Raise ValueError on an unknown name or a bad value
+def parse_limits(text):
+  limits = {}
+  for item in text.split(","):
+    name, _, value = item.strip().partition("=")
+    name = name.lower()
+    if(name == "output"):
+      unit = output_unit
+    elif(name in rlimit_names):
+      unit = rlimit_names[name][1]
+    else:
+      raise ValueError("unknown limit %s" % name)
+    limits[name] = int(float(value) * unit)
+    if(limits[name] < 0):
+      raise ValueError("negative limit %s" % name)
+  return limits
+
+# the rlimits among limits, as (resource, soft, hard)
+def rlimits(limits):
+  result = []
+  if(resource is None or not limits):
+    return result
+  for name, (resource_name, unit) in rlimit_names.items():
+    if(name in limits and hasattr(resource, resource_name)):
+      soft = limits[name]
+      # past RLIMIT_CPU the child gets SIGXCPU, and SIGKILL one second later if it ignores it
+      hard = soft + 1 if name == "cpu" else soft
+      result.append((getattr(resource, resource_name), soft, hard))
+  return result
+
+# set the rlimits in the child, before exec. The hard limit can't be raised
+def set_limits(limits):
+  for res, soft, hard in limits:
+    old_hard = resource.getrlimit(res)[1]
+    if(old_hard != resource.RLIM_INFINITY):
+      hard = min(hard, old_hard)
+      soft = min(soft, hard)
+    resource.setrlimit(res, (soft, hard))
+
+# the account of a run: the pipe its output is read from, the bytes read, and its rusage once reaped, with
+# whether it is started by peakrss, the pipe peakrss reports into and its report. Without peakrss, the peak RSS
+# of wait4 is at least the one of the harness that started the child, kept in base_rss by start_account
+def new_account(output_limit=None, peak_rss=False):
+  return {"fd": None, "output": 0, "output_limit": output_limit, "rusage": None, "base_rss": 0, \
+    "peak_rss": peak_rss, "rss_fd": None, "maxrss": None}
+
+# the account of a run under limits (see parse_limits): the output limit, and peakrss for the memory class of
+# exceeded with an as limit or when asked for with the peak_rss entry (run.py --peak-rss)
+def limits_account(limits):
+  if not limits:
+    return new_account()
+  return new_account(limits.get("output"), "as" in limits or bool(limits.get("peak_rss")))
+
+# the argv running argv under peakrss, which writes to fd, or argv itself if the account of the run does not ask
+# for peakrss or it is not built. The read end of the pipe goes to the account, the write end is returned, -1 if
+# there is none
+def peakrss_argv(argv, acct, fd=None):
+  if(acct is None or not acct["peak_rss"] or not os.access(peakrss_path, os.X_OK)):
+    return argv, -1
+  acct["rss_fd"], rss_w = os.pipe()
+  return [peakrss_path, str(rss_w if fd is None else fd)] + list(argv), rss_w
+
+# read the peak RSS peakrss reported for a reaped child, None if it could not (it was killed by the harness)
+def read_peakrss(acct):
+  if(acct["rss_fd"] is None):
+    return
+  os.set_blocking(acct["rss_fd"], False)
+  try:
+    report = os.read(acct["rss_fd"], 64)
+  except BlockingIOError:
+    report = b""
+  os.close(acct["rss_fd"])
+  acct["rss_fd"] = None
+  if report.strip().isdigit():
+    acct["maxrss"] = int(report)
+
+# account for child pid from now on
+def start_account(pid, acct):
+  if(resource is not None):
+    acct["base_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  accounting[pid] = acct
+
+# read and count the output available in the pipe of acct, close it at end of file
+def drain(acct):
+  while acct["fd"] is not None:
+    try:
+      n = os.readv(acct["fd"], [drain_buffer])
+    except BlockingIOError:
+      return
+    if(n == 0):
+      close_account(acct)
+      return
+    acct["output"] = acct["output"] + n
+
+def close_account(acct):
+  if(acct["fd"] is not None):
+    os.close(acct["fd"])
+    acct["fd"] = None
+
+# whether the run wrote more than its output limit
+def output_exceeded(acct):
+  return acct is not None and acct["output_limit"] is not None and acct["output"] > acct["output_limit"]
+
+# what was used by the run of acct: peak RSS in KB (None if peakrss did not report it and the one of wait4 is not
+# above the harness, see new_account), user and system CPU seconds, voluntary and involuntary context switches,
+# and bytes of output
+def account_usage(acct):
+  usage = {"maxrss": acct["maxrss"], "utime": None, "stime": None, "nvcsw": None, "nivcsw": None, \
+    "output": acct["output"]}
+  ru = acct["rusage"]
+  if(ru is not None):
+    if(usage["maxrss"] is None and ru.ru_maxrss > acct["base_rss"]):
+      usage["maxrss"] = ru.ru_maxrss
+    # MacOS counts ru_maxrss in bytes
+    if(sys.platform == "darwin" and usage["maxrss"] is not None):
+      usage["maxrss"] = usage["maxrss"] // 1024
+    usage["utime"] = ru.ru_utime
+    usage["stime"] = ru.ru_stime
+    usage["nvcsw"] = ru.ru_nvcsw
+    usage["nivcsw"] = ru.ru_nivcsw
+  return usage
+
+# the limit a run exceeded, "memory", "cpu", "file size" or "output", or None
+def exceeded(limits, retcode, acct):
+  if output_exceeded(acct):
+    return "output"
+  if(retcode is None or not limits):
+    return None
+  usage = account_usage(acct)
+  if("cpu" in limits and (retcode == 128 + signal.SIGXCPU or \
+    (retcode == 128 + signal.SIGKILL and usage["utime"] is not None and usage["utime"] + usage["stime"] >= limits["cpu"]))):
+    return "cpu"
+  if("fsize" in limits and retcode == 128 + signal.SIGXFSZ):
+    return "file size"
+  if("as" in limits and retcode != 0 and usage["maxrss"] is not None and usage["maxrss"] * 1024 >= memory_ratio * limits["as"]):
+    return "memory"
+  return None
+
+# the status of a child, converted to the return code a shell would report
+def shell_retcode(status):
+  if os.WIFSIGNALED(status):
+    return 128 + os.WTERMSIG(status)
+  return os.waitstatus_to_exitcode(status)
+
+# wait for the child for at most timeout seconds, return its status or None if it is still running.
+# The output of a child with an account is drained meanwhile, None is also returned once it is over its limit
+def wait_child(pid, timeout):
+  acct = accounting.get(pid)
+  deadline = None if timeout is None else time.monotonic() + timeout
+
+  # a pidfd becomes readable when the child exits, so there is no polling on Linux
+  if hasattr(os, "pidfd_open"):
+    fd = os.pidfd_open(pid)
+    try:
+      while True:
+        fds = [fd]
+        if(acct is not None and acct["fd"] is not None):
+          fds.append(acct["fd"])
+        wait = None if deadline is None else max(0, deadline - time.monotonic())
+        ready, _, _ = select.select(fds, [], [], wait)
+        if(acct is not None and acct["fd"] in ready):
+          drain(acct)
+          if output_exceeded(acct):
+            return None
+        if(fd in ready):
+          break
+        if not ready:
+          return None
+    finally:
+      os.close(fd)
+    return reap(pid)
+
+  # elsewhere poll, with a delay growing up to 50ms
+  delay = 0.0005
+  while True:
+    wpid, status, ru = os.wait4(pid, os.WNOHANG)
+    if(wpid == pid):
+      return reaped(pid, status, ru)
+    if(acct is not None):
+      drain(acct)
+      if output_exceeded(acct):
+        return None
+    if(deadline is not None and time.monotonic() >= deadline):
+      return None
+    time.sleep(delay)
+    delay = min(delay * 2, 0.05)
+
+# write content (the content of the test case at path if None) to the pipe feed_fd from a thread, and close it at
+# the end or once the child stops reading
+def feed_stdin(feed_fd, path, content=None):
+  def copy():
+    try:
+      if(content is not None):
+        write_all(feed_fd, content)
+        return
+      with corpus.open_testcase(path) as f:
+        while True:
+          data = f.read(corpus.chunk_size)
+          if not data:
+            break
+          write_all(feed_fd, data)
+    except OSError:
+      # EPIPE once the child exited or closed its stdin
+      pass
+    finally:
+      os.close(feed_fd)
+  threading.Thread(target=copy, daemon=True).start()
+
+def write_all(fd, data):
+  data = memoryview(data)
+  while data:
+    data = data[os.write(fd, data):]
+
+# write as much of content to the empty pipe feed_fd as it takes without blocking, return the rest
+def prefill(feed_fd, content):
+  os.set_blocking(feed_fd, False)
+  try:
+    written = os.write(feed_fd, content)
+  except BlockingIOError:
+    written = 0
+  finally:
+    os.set_blocking(feed_fd, True)
+  return memoryview(content)[written:]
+
+# open the file a stream is redirected to, relative to cwd
+def open_redirect(path, append, cwd):
+  flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+  return os.open(os.path.join(cwd or ".", path), flags, 0o666)
+
+# wait for the command the output of a child is piped into, it ends once every writer of the pipe is gone. It is
+# killed after kill_grace seconds, e.g. if a leaked process of the child still holds the pipe
+def finish_pipe_command(p, acct):
+  deadline = time.monotonic() + kill_grace
+  while p.poll() is None:
+    if(acct is not None):
+      drain(acct)
+    if(time.monotonic() >= deadline):
+      p.kill()
+      p.wait()
+      break
+    time.sleep(0.005)
+
+# start argv with stdin read from stdin_path (inherited if None), return its pid. The output goes to the pipe of
+# acct, or is discarded without an account, unless redirects (see run.parse_streams) send stdout or stderr to a
+# file or stdout to a command. limits are set before exec (see rlimits).
+# posix_spawn can't change the directory nor set rlimits, so such a child is started by subprocess (vfork + exec,
+# fork + exec with rlimits)
+def spawn(argv, stdin_path=None, cwd=None, limits=None, acct=None, redirects=None):
+  stdin_fd = -1
+  feed_fd = -1
+  content = None
+  out_r = out_w = -1
+  # the stdout and stderr of the child, and the fds to close once it started
+  stdout_fd = stderr_fd = -1
+  opened = []
+  pipe_command = None
+  rss_w = -1
+  if(stdin_path is not None):
+    content = corpus.cached_content(stdin_path)
+    if(content is not None):
+      stdin_fd, feed_fd = os.pipe()
+      content = prefill(feed_fd, content)
+      if not content:
+        os.close(feed_fd)
+        feed_fd = -1
+    elif(corpus.compression(stdin_path) is not None):
+      # a missing test case fails like a bad redirection
+      os.stat(stdin_path)
+      stdin_fd, feed_fd = os.pipe()
+    else:
+      stdin_fd = os.open(stdin_path, os.O_RDONLY)
+  try:
+    if(acct is not None):
+      out_r, out_w = os.pipe()
+    else:
+      out_w = os.open(os.devnull, os.O_WRONLY)
+    stdout_fd = stderr_fd = out_w
+    if(redirects is not None):
+      if(redirects["stdout"] is not None):
+        stdout_fd = open_redirect(redirects["stdout"], redirects["append"], cwd)
+        opened.append(stdout_fd)
+      elif(redirects["pipe"] is not None):
+        pipe_r, stdout_fd = os.pipe()
+        opened.append(stdout_fd)
+        try:
+          pipe_command = subprocess.Popen(redirects["pipe"], cwd=cwd, stdin=pipe_r, stdout=out_w, \
+            stderr=subprocess.STDOUT, start_new_session=True)
+        finally:
+          os.close(pipe_r)
+      if(redirects["stderr"] == "stdout"):
+        stderr_fd = stdout_fd
+      elif(redirects["stderr"] is not None):
+        stderr_fd = open_redirect(redirects["stderr"], False, cwd)
+        opened.append(stderr_fd)
+    limits = rlimits(limits)
+    if(cwd is not None or limits):
+      argv, rss_w = peakrss_argv(argv, acct)
+      p = subprocess.Popen(argv, cwd=cwd, stdin=stdin_fd if stdin_fd >= 0 else None, \
+        stdout=stdout_fd, stderr=stderr_fd, start_new_session=True, pass_fds=(rss_w,) if rss_w >= 0 else (), \
+        preexec_fn=(lambda: set_limits(limits)) if limits else None)
+      popen_children[p.pid] = p
+      pid = p.pid
+    else:
+      # peakrss writes to fd 3 of the child
+      argv, rss_w = peakrss_argv(argv, acct, 3)
+      file_actions = []
+      if(stdin_fd >= 0):
+        file_actions.append((os.POSIX_SPAWN_DUP2, stdin_fd, 0))
+      file_actions.append((os.POSIX_SPAWN_DUP2, stdout_fd, 1))
+      file_actions.append((os.POSIX_SPAWN_DUP2, stderr_fd, 2))
+      if(rss_w >= 0):
+        file_actions.append((os.POSIX_SPAWN_DUP2, rss_w, 3))
+      pid = os.posix_spawnp(argv[0], argv, os.environ, file_actions=file_actions, setsid=True)
+  except BaseException:
+    if(out_r >= 0):
+      os.close(out_r)
+    if(acct is not None and acct["rss_fd"] is not None):
+      os.close(acct["rss_fd"])
+      acct["rss_fd"] = None
+    if(feed_fd >= 0):
+      os.close(feed_fd)
+    for fd in opened:
+      os.close(fd)
+    opened = []
+    if(pipe_command is not None):
+      # its stdin is closed, it ends
+      finish_pipe_command(pipe_command, None)
+    raise
+  finally:
+    if(stdin_fd >= 0):
+      os.close(stdin_fd)
+    if(out_w >= 0):
+      os.close(out_w)
+    if(rss_w >= 0):
+      os.close(rss_w)
+    for fd in opened:
+      os.close(fd)
+
+  if(feed_fd >= 0):
+    feed_stdin(feed_fd, stdin_path, content)
+  if(pipe_command is not None):
+    pipe_commands[pid] = pipe_command
+  if(acct is not None):
+    os.set_blocking(out_r, False)
+    acct["fd"] = out_r
+    start_account(pid, acct)
+  return pid
+
+# the return code a shell reports when it can't start a command
+def spawn_error_retcode(err, stdin_path=None):
+  # the shell fails the same way on a bad redirection
+  if(stdin_path is not None and not os.path.exists(stdin_path)):
+    print("%s: %s" % (stdin_path, err.strerror))
+    return 1
+  if(isinstance(err, FileNotFoundError)):
+    return 127
+  if(isinstance(err, PermissionError)):
+    return 126
+  print("%s" % err)
+  return 1
+
+# forget the Popen object of a reaped child and keep its rusage in its account, return its status
+def reaped(pid, status, rusage=None):
+  p = popen_children.pop(pid, None)
+  if(p is not None):
+    p.returncode = shell_retcode(status)
+  acct = accounting.pop(pid, None)
+  pipe_command = pipe_commands.pop(pid, None)
+  if(pipe_command is not None):
+    finish_pipe_command(pipe_command, acct)
+  if(acct is not None):
+    acct["rusage"] = rusage
+    read_peakrss(acct)
+    # what it wrote just before exiting
+    drain(acct)
+  return status
+
+# wait for a child that has exited, return its status
+def reap(pid):
+  wpid, status, rusage = os.wait4(pid, 0)
+  return reaped(pid, status, rusage)
+
+# the descendants of pid, which may have left its process group. Only known with /proc
+def descendants(pid):
+  if not os.path.isdir("/proc/%d" % pid):
+    return []
+  return watchdog.tree(pid)[1:]
+
+# send sig to the process group of pid and to pids
+def signal_tree(pid, pids, sig):
+  try:
+    os.killpg(pid, sig)
+  except OSError:
+    pass
+  for p in pids:
+    try:
+      os.kill(p, sig)
+    except OSError:
+      pass
+
+# stop a run that hung: SIGTERM to its group and descendants, SIGKILL if it is still running after grace seconds.
+# Return the status of the reaped child
+def terminate(pid, grace=None):
+  if(grace is None):
+    grace = kill_grace
+  pids = descendants(pid)
+  signal_tree(pid, pids, signal.SIGTERM)
+  status = wait_child(pid, grace)
+  # the descendants get SIGKILL anyway, they may ignore SIGTERM
+  signal_tree(pid, pids, signal.SIGKILL)
+  if(status is None):
+    status = reap(pid)
+  return status
+
+# the processes in the process group of pid, or in its session if session is True, as "pid name", from /proc
+def group_members(pid, session=False):
+  members = []
+  # the fields after the name in /proc/pid/stat: state, ppid, pgrp, session
+  field = 3 if session else 2
+  for name in os.listdir("/proc"):
+    if not name.isdigit():
+      continue
+    stat = watchdog.read_file("/proc/%s/stat" % name)
+    if(stat is None):
+      continue
+    fields = stat[stat.rfind(")") + 2:].split()
+    if(int(fields[field]) == pid):
+      members.append("%s %s" % (name, stat[stat.find("(") + 1:stat.rfind(")")]))
+  return members
+
+# once the run of session leader pid is over, kill what is left of its process group and return it.
+# The session is searched too if session is True (shells on a pty put their jobs in other process groups)
+def leaked(pid, session=False):
+  if(not session):
+    try:
+      os.killpg(pid, 0)
+    except ProcessLookupError:
+      return []
+    except PermissionError:
+      pass
+  if os.path.isdir("/proc"):
+    members = group_members(pid, session)
+  else:
+    members = ["process group %d" % pid]
+  for member in members:
+    try:
+      os.kill(int(member.split()[0]), signal.SIGKILL)
+    except (OSError, ValueError):
+      pass
+  try:
+    os.killpg(pid, signal.SIGKILL)
+  except OSError:
+    pass
+  return members
+
+# wait for the child like wait_child, and if window is not None, declare it hung once its process tree made no
+# progress for window seconds, or was busy for busy windows (see watchdog.py). Return its status, or None and how
+# it hangs ("timeout" if it did not finish in timeout seconds, None if it is over its output limit)
+def wait_watched(pid, timeout, window=None, busy=None):
+  acct = accounting.get(pid)
+  if(window is None):
+    status = wait_child(pid, timeout)
+    if(status is None and output_exceeded(acct)):
+      return None, None
+    return status, None if status is not None else "timeout"
+
+  watch = watchdog.new_watch(pid, window, busy)
+  deadline = None if timeout is None else time.monotonic() + timeout
+  while True:
+    wait = watchdog.next_interval(watch)
+    if(deadline is not None):
+      wait = max(0, deadline - time.monotonic()) if wait is None else min(wait, max(0, deadline - time.monotonic()))
+    status = wait_child(pid, wait)
+    if(status is not None):
+      return status, None
+    if output_exceeded(acct):
+      return None, None
+    if(deadline is not None and time.monotonic() >= deadline):
+      return None, watchdog.timed_out(watch)
+    hang = watchdog.check(watch)
+    if(hang is not None):
+      return None, hang
+
+# what a run reports besides its return code: how it hung, the leaked processes, the limit it exceeded and what
+# it used (see account_usage)
+def run_info(acct, limits, retcode, hang=None, leaked_processes=()):
+  info = account_usage(acct)
+  info["hang"] = hang
+  info["leaked"] = leaked_processes
+  info["exceeded"] = exceeded(limits, retcode, acct)
+  return info
+
+# run argv with stdin read from stdin_path (inherited if None) under limits (see parse_limits), its output counted.
+# Return the return code like a shell (None if it hung or wrote more than its output limit) and its run_info.
+# The stages of the run are recorded in trace (see tracing.py)
+def run(argv, stdin_path=None, timeout=None, cwd=None, window=None, limits=None, trace=None, redirects=None, busy=None):
+  acct = limits_account(limits)
+  t = tracing.now(trace)
+  try:
+    pid = spawn(argv, stdin_path, cwd, limits, acct, redirects)
+  except OSError as err:
+    return spawn_error_retcode(err, stdin_path), run_info(acct, limits, None)
+  t = tracing.span(trace, "spawn", t)
+
+  try:
+    status, hang = wait_watched(pid, timeout, window, busy)
+    t = tracing.span(trace, "utility", t)
+    if(status is None):
+      terminate(pid)
+      t = tracing.span(trace, "kill", t)
+      retcode = None
+    else:
+      retcode = shell_retcode(status)
+    leaked_processes = leaked(pid)
+    tracing.span(trace, "leaked", t)
+    return retcode, run_info(acct, limits, retcode, hang, leaked_processes)
+  finally:
+    close_account(acct)
@@ -0,0 +1,322 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# shrink the test case of a failing run recorded by run.py (see report.py -l for the ids) with delta debugging
+# (ddmin): chunks of the test case are removed as long as the utility still fails the same way, i.e. it is killed
+# by the same signal or it hangs again. The sampled options, and the second file of two_files, are minimized the
+# same way.
+#
+# The candidates of every step are run in parallel, one per job, each in its own scratch directory. As soon as one
+# candidate reproduces the failure the others are killed, and the outcome of every candidate is cached, so no
+# candidate is run twice. The smallest test case found so far is saved after every step, e.g. t150.min in
+# output_dir, so minimize.py can be interrupted at any time.
+#
+# Like run.py, it is run from ./run_test, e.g. python3 minimize.py ./result 42 -j 8 -t 10
+
+import os
+import sys
+import time
+import json
+import getopt
+import shutil
+import hashlib
+import itertools
+import threading
+import queue
+import tempfile
+import concurrent.futures
+
+import run
+import launch
+import ptydriver
+import store
+import corpus
+
+usage = "Usage: python3 minimize.py result_dir run_id [-j jobs] [-t timeout] [-b ptyjig|python] [-o output_dir]"
+
+# what is minimized is a list of ranges (start, end) over the units of a part: the bytes of a file or the options
+
+def ranges_size(ranges):
+  return sum(end - start for start, end in ranges)
+
+# join adjacent ranges
+def merge_ranges(ranges):
+  merged = []
+  for start, end in ranges:
+    if(merged and merged[-1][1] == start):
+      merged[-1] = (merged[-1][0], end)
+    else:
+      merged.append((start, end))
+  return merged
+
+# cut ranges into n chunks of (almost) the same size
+def split_ranges(ranges, n):
+  total = ranges_size(ranges)
+  chunks = [[] for i in range(n)]
+  pos = 0
+  for start, end in ranges:
+    while start < end:
+      i = pos * n // total
+      # the first position of chunk i + 1
+      chunk_end = ((i + 1) * total + n - 1) // n
+      take = min(end - start, chunk_end - pos)
+      chunks[i].append((start, start + take))
+      start = start + take
+      pos = pos + take
+  return [merge_ranges(chunk) for chunk in chunks if chunk]
+
+# everything but chunk i
+def complement(chunks, i):
+  return merge_ranges([r for j, chunk in enumerate(chunks) if j != i for r in chunk])
+
+# the key of a candidate in the cache
+def parts_key(parts):
+  return hashlib.sha1(json.dumps(sorted(parts.items())).encode()).hexdigest()
+
+# the result of a run compared with the failure: "failed" and its return code, or "hung"
+def outcome(job, retcode):
+  info = launch.run_info(launch.new_account(), None, retcode)
+  info.update({"retcode": retcode, "leaked": 0, "duration": 0, "timestamp": 0})
+  result = run.store_row(job, info, False, None)["result"]
+  if(result == "failed"):
+    return (result, retcode)
+  return (result, None)
+
+# run a prepared job in work_dir, killing it if stop is set. Return its return code, or None if it hung or was stopped
+def launch_job(job, work_dir, timeout, stop):
+  run.prepare_job(job, work_dir)
+  stdin_path = run.job_stdin(job, work_dir)
+  try:
+    if(job["pty_driver"]):
+      return ptydriver.run(job["argv"], stdin_path, job["delay"], job["idle_timeout"], timeout, work_dir, stop=stop)[0]
+    try:
+      pid = launch.spawn(job["argv"], stdin_path, work_dir, redirects=job["redirects"])
+    except OSError as err:
+      return launch.spawn_error_retcode(err, stdin_path)
+    deadline = time.monotonic() + timeout
+    while True:
+      status = launch.wait_child(pid, 0.05)
+      if(status is not None):
+        launch.leaked(pid)
+        return launch.shell_retcode(status)
+      if(stop.is_set() or time.monotonic() >= deadline):
+        launch.terminate(pid)
+        launch.leaked(pid)
+        return None
+  finally:
+    run.cleanup_job(job, work_dir)
+
+# write the units of a file in ranges to path
+def write_ranges(data, ranges, path):
+  with open(path, "wb") as f:
+    for start, end in ranges:
+      f.write(data[start:end])
+
+# the job of the failing run with the parts replaced by the candidate files in directory
+def make_job(ctx, parts, directory, name):
+  paths = []
+  for i, data in enumerate(ctx["files"]):
+    path = os.path.join(directory, "%s%s" % (name, ctx["suffixes"][i]))
+    write_ranges(data, parts["file%d" % i], path)
+    paths.append(path)
+  options = [option for start, end in parts["options"] for option in ctx["options"][start:end]]
+  cmd, streams, test_type, utility_name, new_file_name = ctx["template"]
+  return run.make_job(0, 0, ctx["line"], cmd, streams, test_type, utility_name, new_file_name, options, paths[0], \
+    paths if test_type == "two_files" else None)
+
+# run a candidate in a free slot. Return whether it reproduces the failure, or None if it was stopped
+def test_parts(ctx, parts, stop):
+  if(stop.is_set()):
+    return None
+  slot = ctx["slots"].get()
+  candidate_dir = os.path.join(ctx["root"], "c%d" % slot)
+  try:
+    os.makedirs(candidate_dir, exist_ok=True)
+    job = make_job(ctx, parts, candidate_dir, "candidate%d" % next(ctx["counter"]))
+    # the sanitized pty inputs of the candidates are not kept
+    job["input_cache"] = os.path.join(candidate_dir, "pty_input")
+    retcode = launch_job(job, os.path.join(ctx["root"], "s%d" % slot), ctx["timeout"], stop)
+    ctx["runs"] += 1
+    if(retcode is None and stop.is_set()):
+      return None
+    return outcome(job, retcode) == ctx["target"]
+  finally:
+    shutil.rmtree(candidate_dir, ignore_errors=True)
+    ctx["slots"].put(slot)
+
+# run the candidates in parallel, return the index of the first one found to reproduce the failure, or None
+def first_reproducing(ctx, candidates):
+  stop = threading.Event()
+  futures = {}
+  for i, parts in enumerate(candidates):
+    key = parts_key(parts)
+    if key in ctx["cache"]:
+      ctx["cached"] += 1
+      if(ctx["cache"][key]):
+        return i
+      continue
+    futures[ctx["executor"].submit(test_parts, ctx, parts, stop)] = (i, key)
+
+  winner = None
+  for future in concurrent.futures.as_completed(futures):
+    i, key = futures[future]
+    reproduces = future.result()
+    if(reproduces is None):
+      continue
+    ctx["cache"][key] = reproduces
+    if(reproduces and winner is None):
+      winner = i
+      # the failure reproduces, stop the other candidates
+      stop.set()
+  return winner
+
+# save the smallest files found so far in output_dir
+def save(ctx, parts):
+  for i, data in enumerate(ctx["files"]):
+    write_ranges(data, parts["file%d" % i], ctx["outputs"][i])
+
+def describe(ctx, parts):
+  sizes = ["%s %d bytes" % (os.path.basename(ctx["paths"][i]), ranges_size(parts["file%d" % i])) \
+    for i in range(len(ctx["files"]))]
+  options = [option for start, end in parts["options"] for option in ctx["options"][start:end]]
+  return "%s, options: %s" % (", ".join(sizes), " ".join(options))
+
+# ddmin on one part, return the parts with the smallest part that still fails
+def ddmin(ctx, parts, part):
+  ranges = parts[part]
+  if(ranges_size(ranges) == 0):
+    return parts
+  # removing all of it is the cheapest try
+  if(first_reproducing(ctx, [dict(parts, **{part: []})]) is not None):
+    parts = dict(parts, **{part: []})
+    save(ctx, parts)
+    print("minimized: %s" % describe(ctx, parts))
+    return parts
+
+  n = 2
+  while ranges_size(ranges) >= 2:
+    chunks = split_ranges(ranges, n)
+    candidates = list(chunks)
+    # with two chunks the complements are the chunks
+    if(len(chunks) > 2):
+      candidates = candidates + [complement(chunks, i) for i in range(len(chunks))]
+    winner = first_reproducing(ctx, [dict(parts, **{part: candidate}) for candidate in candidates])
+    if(winner is not None):
+      ranges = candidates[winner]
+      parts = dict(parts, **{part: ranges})
+      n = 2 if winner < len(chunks) else max(n - 1, 2)
+      save(ctx, parts)
+      print("minimized: %s" % describe(ctx, parts))
+    elif(n < ranges_size(ranges)):
+      n = min(n * 2, ranges_size(ranges))
+    else:
+      break
+  return parts
+
+
+if __name__ == "__main__":
+
+  workers = os.cpu_count() or 1
+  timeout = 10
+  output_dir = "."
+
+  if(len(sys.argv) < 3 or sys.argv[1] in ("-h", "--help")):
+    print(usage)
+    sys.exit(1)
+
+  result_dir = sys.argv[1]
+  run_id = int(sys.argv[2])
+
+  try:
+    opts, args = getopt.getopt(sys.argv[3:], "j:t:b:o:", ["jobs=", "timeout=", "backend=", "ofile="])
+  except getopt.GetoptError as err:
+    print("error on arguments")
+    print(usage)
+    sys.exit(1)
+
+  for opt, arg in opts:
+    if(opt in ("-j", "--jobs")):
+      workers = int(arg)
+    elif(opt in ("-t", "--timeout")):
+      timeout = int(arg)
+    elif(opt in ("-b", "--backend")):
+      run.pty_backend = arg
+    elif(opt in ("-o", "--ofile")):
+      output_dir = arg
+
+  db_path = os.path.join(result_dir, "results.db")
+  if not os.path.isfile(db_path):
+    print("%s does not exist" % db_path)
+    sys.exit(1)
+  db = store.open_db(db_path)
+  row = db.execute("select line, path, files, options, result, retcode from runs where id = ?", (run_id,)).fetchone()
+  db.close()
+  if(row is None):
+    print("no run %d in %s" % (run_id, db_path))
+    sys.exit(1)
+  line, path, files, options, result, retcode = row
+  if(result not in ("failed", "hung")):
+    print("run %d did not fail: %s" % (run_id, result))
+    sys.exit(1)
+
+  run.ptyjig_path = os.path.abspath(run.ptyjig_path)
+  run.end_dir = os.path.abspath(run.end_dir)
+  cmd, streams, test_type, utility_name, new_file_name, all_options_from_pool, log_name = run.parse_a_line(line)
+
+  paths = [path] if files is None else json.loads(files)
+  file_data = []
+  for p in paths:
+    with corpus.open_testcase(p) as f:
+      file_data.append(f.read())
+  if not os.path.exists(output_dir):
+    os.makedirs(output_dir)
+  suffixes = [".min", ".min2"][:len(paths)]
+
+  ctx = {"line": line, "template": (cmd, streams, test_type, utility_name, new_file_name), "paths": paths, \
+    "files": file_data, "suffixes": suffixes, "options": options.split(), "timeout": timeout, \
+    "target": (result, retcode if result == "failed" else None), "cache": {}, "runs": 0, "cached": 0, \
+    "counter": itertools.count(), "slots": queue.Queue(), \
+    "outputs": [os.path.join(output_dir, corpus.staged_name(p) + suffixes[i]) for i, p in enumerate(paths)], \
+    "root": tempfile.mkdtemp(prefix="minimize.", dir=os.path.abspath(output_dir))}
+  for i in range(workers):
+    os.makedirs(os.path.join(ctx["root"], "s%d" % i))
+    ctx["slots"].put(i)
+  ctx["executor"] = concurrent.futures.ThreadPoolExecutor(workers)
+
+  parts = {"options": [(0, len(ctx["options"]))] if ctx["options"] else []}
+  for i, data in enumerate(file_data):
+    parts["file%d" % i] = [(0, len(data))] if data else []
+
+  print("minimizing: %s (%s)" % (line, describe(ctx, parts)))
+  try:
+    if(first_reproducing(ctx, [parts]) is None):
+      print("the failure of run %d does not reproduce" % run_id)
+      sys.exit(1)
+
+    # minimize the options first, the input is often easier to shrink without them. Repeat until nothing shrinks,
+    # since a smaller file may make more options useless and the other way around
+    order = ["options"] + ["file%d" % i for i in range(len(file_data))]
+    changed = True
+    while changed:
+      changed = False
+      for part in order:
+        new_parts = ddmin(ctx, parts, part)
+        if(new_parts != parts):
+          parts = new_parts
+          changed = True
+  finally:
+    ctx["executor"].shutdown()
+    shutil.rmtree(ctx["root"], ignore_errors=True)
+
+  save(ctx, parts)
+  print("runs: %d, cached: %d" % (ctx["runs"], ctx["cached"]))
+  print("result: %s" % describe(ctx, parts))
+  for output in ctx["outputs"]:
+    print("saved: %s" % output)
+  final = run.make_job(0, 0, line, cmd, streams, test_type, utility_name, new_file_name, \
+    [option for start, end in parts["options"] for option in ctx["options"][start:end]], ctx["outputs"][0], \
+    ctx["outputs"] if test_type == "two_files" else None)
+  print("command: %s" % final["final_cmd"])
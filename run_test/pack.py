@@ -0,0 +1,151 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# a corpus pack: the test cases of a dataset in one file, so a campaign on thousands of tiny files opens one file
+# instead of listing, sorting and opening every test case. run.py takes a pack as test_dir (-i Small1.pack), its
+# test cases are named like files in it (Small1.pack/t0). The pack is mapped in memory, stdin tests get their test
+# case written from the mapping into their pipe, and the tests that need a file get one made from it (see corpus.py).
+#
+# The format is a header, the contents of the test cases one after the other, then the index:
+#
+#   header   magic "FUZZPACK", version, number of test cases, offset of the index (little endian, 24 bytes)
+#   index    for every test case in name order: offset and length of its content, its sha256 and its name
+#            (utf-8, NUL padded), 80 bytes each
+#
+#   python3 pack.py create ./Small1 -o Small1.pack
+#   python3 pack.py list Small1.pack
+#   python3 pack.py verify Small1.pack
+
+import os
+import sys
+import mmap
+import getopt
+import struct
+import hashlib
+
+import corpus
+
+usage = "Usage: python3 pack.py create test_dir [-o pack_file] [-p prefix] | list pack_file | verify pack_file"
+
+magic = b"FUZZPACK"
+version = 1
+header_format = "<8sIIQ"
+entry_format = "<QQ32s32s"
+header_size = struct.calcsize(header_format)
+entry_size = struct.calcsize(entry_format)
+name_size = 32
+
+# write the test cases at paths (their content if compressed) to a pack at pack_path, named after their file name
+# without the compression suffix. Written under a temporary name and renamed, return the number of test cases
+def write_pack(pack_path, paths):
+  members = sorted((corpus.staged_name(path), path) for path in paths)
+  tmp_path = "%s.%d.tmp" % (pack_path, os.getpid())
+  index = []
+  with open(tmp_path, "wb") as out:
+    out.write(b"\0" * header_size)
+    offset = header_size
+    for name, path in members:
+      encoded = name.encode()
+      if(len(encoded) > name_size):
+        raise ValueError("%s: names of packed test cases have at most %d bytes" % (name, name_size))
+      h = hashlib.sha256()
+      length = 0
+      with corpus.open_testcase(path) as f:
+        while True:
+          data = f.read(corpus.chunk_size)
+          if not data:
+            break
+          h.update(data)
+          out.write(data)
+          length = length + len(data)
+      index.append(struct.pack(entry_format, offset, length, h.digest(), encoded))
+      offset = offset + length
+    out.write(b"".join(index))
+    out.seek(0)
+    out.write(struct.pack(header_format, magic, version, len(index), offset))
+  os.replace(tmp_path, pack_path)
+  return len(index)
+
+# map the pack at pack_path, return its state: the mapping and the (offset, length, sha256) of every test case by
+# name, and the names in order. Raise ValueError if it is not a pack
+def open_pack(pack_path):
+  with open(pack_path, "rb") as f:
+    size = os.fstat(f.fileno()).st_size
+    if(size < header_size):
+      raise ValueError("%s is not a pack" % pack_path)
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  found, file_version, count, index_offset = struct.unpack_from(header_format, data, 0)
+  if(found != magic or file_version != version or index_offset + count * entry_size > size):
+    raise ValueError("%s is not a pack" % pack_path)
+  entries = {}
+  names = []
+  for i in range(count):
+    offset, length, digest, name = struct.unpack_from(entry_format, data, index_offset + i * entry_size)
+    name = name.rstrip(b"\0").decode()
+    entries[name] = (offset, length, digest.hex())
+    names.append(name)
+  return {"path": pack_path, "data": data, "entries": entries, "names": names}
+
+# the content of the test case name of a pack, a view of the mapping
+def member(state, name):
+  offset, length, digest = state["entries"][name]
+  return memoryview(state["data"])[offset:offset + length]
+
+# the test cases of the pack whose sha256 is not the one in the index
+def verify_pack(state):
+  return [name for name in state["names"] if hashlib.sha256(member(state, name)).hexdigest() != state["entries"][name][2]]
+
+
+if __name__ == "__main__":
+
+  if(len(sys.argv) < 3 or sys.argv[1] not in ("create", "list", "verify")):
+    print(usage)
+    sys.exit(1)
+
+  command = sys.argv[1]
+  try:
+    opts, args = getopt.getopt(sys.argv[3:], "o:p:", ["ofile=", "prefix="])
+  except getopt.GetoptError as err:
+    print("error on arguments")
+    print(usage)
+    sys.exit(1)
+
+  pack_path = None
+  prefix = ""
+  for opt, arg in opts:
+    if(opt in ("-o", "--ofile")):
+      pack_path = arg
+    elif(opt in ("-p", "--prefix")):
+      prefix = arg
+
+  if(command == "create"):
+    test_dir = sys.argv[2]
+    if not os.path.isdir(test_dir):
+      print("%s is not a directory" % test_dir)
+      sys.exit(1)
+    if(pack_path is None):
+      pack_path = test_dir.rstrip(os.sep) + ".pack"
+    paths = [os.path.join(test_dir, name) for name in os.listdir(test_dir) if name.startswith(prefix)]
+    count = write_pack(pack_path, [path for path in paths if os.path.isfile(path)])
+    print("%s: %d test cases" % (pack_path, count))
+    sys.exit(0)
+
+  try:
+    state = open_pack(sys.argv[2])
+  except (OSError, ValueError) as err:
+    print("%s" % err)
+    sys.exit(1)
+  if(command == "list"):
+    for name in state["names"]:
+      offset, length, digest = state["entries"][name]
+      print("%s %d %d %s" % (name, offset, length, digest))
+  else:
+    bad = verify_pack(state)
+    for name in bad:
+      print("%s changed" % name)
+    print("%s: %d test cases, %d bad" % (state["path"], len(state["names"]), len(bad)))
+    if(bad):
+      sys.exit(1)
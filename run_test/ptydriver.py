@@ -0,0 +1,287 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the python pty backend of run.py (-b python), it does what ../src/ptyjig does for "ptyjig -d delay -x cmd < input"
+# without forking a reader, a writer and a shell: the utility runs on the slave side of a pseudo-terminal, and
+# one loop types the input into the master with the keystroke delay and reads the output.
+#
+# Like ptyjig, once the input is exhausted the utility is killed if it sends no output for idle_timeout seconds
+# (ptyjig's -t), and a utility stopped by ^Z is continued. The output read from the pty is counted and the limits
+# of run.py -r apply like in launch.py.
+#
+# Without a keystroke delay (run.py --pace adaptive), the input is typed at the pace the utility reads it: the
+# bytes typed but not read yet are counted on the slave (FIONREAD), bursts grow while the utility reads everything
+# typed before the next one, and the wait between them grows while it reads nothing, so a utility that reads fast
+# is not typed to one byte per millisecond, and one that stops reading is not flooded.
+
+import os
+import sys
+import time
+import fcntl
+import struct
+import signal
+import termios
+import tty
+import selectors
+
+import launch
+
+# ptyjig sends its flage byte (1) after the input unless -e is given
+eof_byte = b"\x01"
+
+# number of bytes written at once when there is no keystroke delay
+write_chunk_size = 1024
+
+# the input is read in chunks of this many bytes while it is typed, so a huge input is never held in memory
+read_chunk_size = 1 << 16
+
+# the adaptive pace: the smallest and largest bursts typed at once (the line discipline of the slave holds 4096
+# bytes) and the shortest and longest waits between two bursts
+pace_window = (16, 4095)
+pace_backoff = (0.001, 0.05)
+
+# make the pty as raw as possible but keep echo, like ptyjig
+def setup_pty(master):
+  tty.setraw(master)
+  attrs = termios.tcgetattr(master)
+  attrs[3] = attrs[3] | termios.ECHO
+  termios.tcsetattr(master, termios.TCSANOW, attrs)
+
+# fork and exec argv in cwd with the slave as its controlling terminal, stdin, stdout and stderr.
+# posix_spawn can't change the directory nor set a controlling terminal, so this forks. limits are the rlimits
+# of the child (see launch.rlimits), pass_fd is kept open in the child if it is not -1
+def spawn_on_tty(argv, slave, cwd, limits=(), pass_fd=-1):
+  pid = os.fork()
+  if(pid == 0):
+    try:
+      if(pass_fd >= 0):
+        os.set_inheritable(pass_fd, True)
+      if(cwd is not None):
+        os.chdir(cwd)
+      os.login_tty(slave)
+      launch.set_limits(limits)
+      os.execvp(argv[0], argv)
+    except OSError as err:
+      os.write(2, ("%s: %s\n" % (argv[0], err.strerror)).encode())
+      # like a shell, 127 if the utility is not found
+      os._exit(127 if isinstance(err, FileNotFoundError) else 126)
+  return pid
+
+# check if the child has exited, return its status or None. A child stopped by ^Z is continued
+def poll_child(pid):
+  wpid, status, rusage = os.wait4(pid, os.WNOHANG | os.WUNTRACED)
+  if(wpid != pid):
+    return None
+  if(os.WIFSTOPPED(status)):
+    os.kill(pid, signal.SIGCONT)
+    return None
+  return launch.reaped(pid, status, rusage)
+
+# the input typed into a pty, read from the file f a chunk at a time, then eof_byte once f is exhausted
+def new_input(f):
+  return {"file": f, "chunk": b"", "pos": 0, "eof": False}
+
+# the next bytes to type, at most size, empty once everything has been typed
+def next_bytes(feed, size):
+  if(feed["pos"] >= len(feed["chunk"]) and not feed["eof"]):
+    feed["chunk"] = feed["file"].read(read_chunk_size)
+    feed["pos"] = 0
+    if not feed["chunk"]:
+      feed["chunk"] = eof_byte
+      feed["eof"] = True
+  return memoryview(feed["chunk"])[feed["pos"]: feed["pos"] + size]
+
+# count n more bytes as typed
+def typed(feed, n):
+  feed["pos"] = feed["pos"] + n
+
+# stop typing, the utility can't read anymore
+def drop_input(feed):
+  feed["chunk"] = b""
+  feed["eof"] = True
+
+# whether everything has been typed
+def exhausted(feed):
+  return feed["eof"] and feed["pos"] >= len(feed["chunk"])
+
+# the bytes typed into the pty that the utility has not read yet
+def input_queued(slave):
+  return struct.unpack("i", fcntl.ioctl(slave, termios.FIONREAD, b"\0\0\0\0"))[0]
+
+# type the next burst of feed into master, pace is the state of the adaptive pace. The burst tops up the input not
+# read yet to the window, which doubles when the utility read everything typed before and halves when it read
+# nothing, and the wait until the next burst is reset or doubled the same way. Return the time of the next burst
+def type_burst(master, slave, feed, pace, now):
+  queued = input_queued(slave)
+  if(queued == 0):
+    pace["window"] = min(pace["window"] * 2, pace_window[1])
+    pace["backoff"] = pace_backoff[0]
+  elif(queued >= pace["queued"]):
+    pace["window"] = max(pace["window"] // 2, pace_window[0])
+    pace["backoff"] = min(pace["backoff"] * 2, pace_backoff[1])
+  else:
+    pace["backoff"] = pace_backoff[0]
+  size = pace["window"] - queued
+  # a burst may span the end of a chunk of the file
+  while size > 0 and not exhausted(feed):
+    try:
+      written = os.write(master, next_bytes(feed, size))
+    except BlockingIOError:
+      # the input queue of the tty is full
+      pace["backoff"] = min(pace["backoff"] * 2, pace_backoff[1])
+      break
+    typed(feed, written)
+    queued = queued + written
+    size = size - written
+  pace["queued"] = queued
+  return now + pace["backoff"]
+
+# run argv on a pty and type the content of input_path into it, waiting delay seconds after each byte, or at the
+# pace the utility reads it if delay is None.
+# Output is written to output (a binary file) or discarded if None.
+# Return the return code like ptyjig: the exit code or 128 + signal number, 137 if it was killed after idle_timeout
+# seconds without output once the input was exhausted, or None if it did not finish in timeout seconds or wrote
+# more than its output limit. If stop (a threading.Event) is set while the utility runs, it is killed and None
+# is returned.
+# The return code comes with its launch.run_info: how it hung ("no output", "timeout" or "stopped"), the processes
+# of its session left once it was over, which are killed (see launch.leaked), what it used and the limit it exceeded
+def run(argv, input_path, delay, idle_timeout=2, timeout=None, cwd=None, output=None, stop=None, limits=None):
+  with open(input_path, "rb") as f:
+    return run_input(argv, new_input(f), delay, idle_timeout, timeout, cwd, output, stop, limits)
+
+# run argv like run, typing feed (see new_input)
+def run_input(argv, feed, delay, idle_timeout, timeout, cwd, output, stop, limits):
+  master, slave = os.openpty()
+  setup_pty(master)
+  acct = launch.limits_account(limits)
+  argv, rss_w = launch.peakrss_argv(argv, acct)
+  try:
+    pid = spawn_on_tty(argv, slave, cwd, launch.rlimits(limits), rss_w)
+  except OSError:
+    os.close(master)
+    os.close(slave)
+    if(acct["rss_fd"] is not None):
+      os.close(acct["rss_fd"])
+    raise
+  finally:
+    if(rss_w >= 0):
+      os.close(rss_w)
+  # the adaptive pace counts the input the utility has not read on the slave
+  pace = None
+  if(delay is None):
+    pace = {"window": pace_window[0], "backoff": pace_backoff[0], "queued": 0}
+  else:
+    os.close(slave)
+    slave = None
+  launch.start_account(pid, acct)
+  os.set_blocking(master, False)
+
+  sel = selectors.DefaultSelector()
+  sel.register(master, selectors.EVENT_READ)
+
+  start = time.monotonic()
+  deadline = None if timeout is None else start + timeout
+  next_write = start
+  # time of the last output after the input was exhausted
+  last_output = None
+  status = None
+  retcode = None
+  hang = None
+  try:
+    while True:
+      now = time.monotonic()
+
+      status = poll_child(pid)
+      if(status is not None):
+        break
+      if(deadline is not None and now >= deadline):
+        hang = "timeout"
+        break
+      if(stop is not None and stop.is_set()):
+        hang = "stopped"
+        break
+      if(last_output is not None and now - last_output >= idle_timeout):
+        # killed like ptyjig's timer does
+        hang = "no output"
+        retcode = 128 + signal.SIGKILL
+        break
+
+      # type the next keystroke(s)
+      if(not exhausted(feed) and now >= next_write):
+        size = 1 if delay is not None and delay > 0 else write_chunk_size
+        try:
+          if(pace is not None):
+            next_write = type_burst(master, slave, feed, pace, now)
+          else:
+            typed(feed, os.write(master, next_bytes(feed, size)))
+        except BlockingIOError:
+          # the input queue of the tty is full, wait for the utility to read it
+          pass
+        except OSError:
+          # the slave side is gone
+          drop_input(feed)
+        if(pace is None):
+          next_write = now + delay
+        if exhausted(feed):
+          last_output = now
+
+      # wait for output until the next keystroke, or for a while once the input is exhausted
+      if not exhausted(feed):
+        wait = max(0, next_write - time.monotonic())
+      else:
+        wait = 0.05
+      if(stop is not None):
+        wait = min(wait, 0.05)
+      if(deadline is not None):
+        wait = min(wait, max(0, deadline - time.monotonic()))
+      for key, events in sel.select(wait):
+        try:
+          out = os.read(master, 65536)
+        except BlockingIOError:
+          continue
+        except OSError:
+          # EIO: every process closed the slave, the child is about to exit
+          out = b""
+        if(out == b""):
+          sel.unregister(master)
+          break
+        if(output is not None):
+          output.write(out)
+        acct["output"] = acct["output"] + len(out)
+        if exhausted(feed):
+          last_output = time.monotonic()
+        elif(pace is not None and input_queued(slave) == 0):
+          # the utility answered and read everything typed, type the next burst now
+          next_write = 0
+
+      if launch.output_exceeded(acct):
+        break
+
+      # once the pty is closed, wait for the child without spinning
+      if(not sel.get_map()):
+        time.sleep(0.001)
+  finally:
+    sel.close()
+    os.close(master)
+    if(slave is not None):
+      os.close(slave)
+    if(status is None):
+      launch.terminate(pid)
+    # like ptyjig, make sure nothing of the session outlives the utility
+    leaked = launch.leaked(pid, session=True)
+
+  if(status is not None and hang is None):
+    retcode = launch.shell_retcode(status)
+  return retcode, launch.run_info(acct, limits, retcode, hang, leaked)
+
+
+if __name__ == "__main__":
+  # a small ptyjig replacement for trying a utility by hand: python3 ptydriver.py delay|adaptive input_file cmd [args]
+  if(len(sys.argv) < 4):
+    print("Usage: python3 ptydriver.py delay|adaptive input_file cmd [args]")
+    sys.exit(1)
+  delay = None if sys.argv[1] == "adaptive" else float(sys.argv[1])
+  sys.exit(run(sys.argv[3:], sys.argv[2], delay, output=sys.stdout.buffer)[0])
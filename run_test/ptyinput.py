@@ -0,0 +1,95 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the input typed into a pty utility: the test case followed by the end sequence of the utility, without the
+# characters that would suspend or interrupt it. The file is made in one pass over fixed-size chunks, and cached
+# in a directory by (test case, end sequence, filtered characters), so every other run with the same test case
+# and filter set reuses it. Like the cache of corpus.py, the least recently used inputs are removed once the
+# directory holds more than its budget.
+
+import os
+import hashlib
+import threading
+
+import corpus
+import staging
+
+chunk_size = 1 << 20
+
+# ^z, ^c, ^\, \x9a and \xc0 are removed for every utility
+default_filter = b"\x1a\x03\x1c\x9a\xc0"
+
+# more characters removed for some utilities
+utility_filters = {
+  # Z or z will suspend telnet
+  "telnet": b"Zz",
+  # command F will make less show the file updates in real time, it requires an interrupt to quit.
+  "less": b"F",
+}
+
+# the characters removed from the input of a utility
+def utility_filter(utility_name):
+  return default_filter + utility_filters.get(utility_name, b"")
+
+# copy the content of the file at path (a test case may be compressed) to out without the characters in delete
+def copy_filtered(path, out, delete):
+  with corpus.open_testcase(path) as f:
+    while True:
+      data = f.read(chunk_size)
+      if not data:
+        break
+      out.write(data.translate(None, delete))
+
+# write the input of a utility to out_path: testcase then end_path (if not None), without the characters in delete
+def sanitize(testcase, end_path, delete, out_path):
+  with open(out_path, "wb") as out:
+    copy_filtered(testcase, out, delete)
+    if(end_path is not None):
+      copy_filtered(end_path, out, delete)
+
+# the name of the cached input, it changes with the test case file, the end file and the filter
+def cache_key(testcase, end_path, delete):
+  h = hashlib.sha256()
+  for path in (testcase, end_path):
+    if(path is None):
+      h.update(b"-\0")
+      continue
+    size, mtime = corpus.testcase_stat(path)
+    h.update(("%s\0%d\0%d\0" % (os.path.abspath(path), size, mtime)).encode())
+  h.update(delete)
+  return h.hexdigest()
+
+# return the path of the sanitized input in cache_dir, making it if it is not cached yet, then keep at most budget
+# bytes in cache_dir. The file is written under a temporary name and renamed, so workers (processes, or the threads
+# of the async engine) racing on the same input never see half of it, and its mtime is the last time it was used
+# (see corpus.evict)
+def cached_input(cache_dir, testcase, end_path, delete, budget):
+  path = os.path.join(cache_dir, cache_key(testcase, end_path, delete))
+  try:
+    os.utime(path)
+    return path
+  except FileNotFoundError:
+    pass
+  if not os.path.exists(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+  tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+  sanitize(testcase, end_path, delete, tmp_path)
+  # runs get copies of the file, it is only read
+  os.chmod(tmp_path, 0o444)
+  os.replace(tmp_path, path)
+  corpus.evict(cache_dir, budget, path)
+  return path
+
+# stage the sanitized input as dst (see staging.stage_file), writable since the utility may write to it
+def stage_input(cache_dir, testcase, end_path, delete, budget, dst):
+  # another worker may remove the cached input before it is staged
+  for attempt in range(3):
+    try:
+      return staging.stage_file(cached_input(cache_dir, testcase, end_path, delete, budget), dst, writable=True)
+    except FileNotFoundError:
+      if not os.path.exists(testcase):
+        raise
+  return staging.stage_file(cached_input(cache_dir, testcase, end_path, delete, budget), dst, writable=True)
@@ -0,0 +1,137 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# query the result store written by run.py. By default print the crash/hang summary of every utility, with -l list
+# the matching runs with their id, which minimize.py takes. For example, the utilities that crashed on Large3 with
+# SIGSEGV:
+#
+#   python3 report.py ./result -d Large3 -s SIGSEGV
+
+import os
+import sys
+import getopt
+import json
+import signal
+
+import store
+
+usage = "Usage: python3 report.py result_dir|results.db [-u utility] [-t test_type] [-d dataset] [-r ok|failed|hung|exceeded|not_found] [-s signal] [-l]"
+
+def signal_name(signum):
+  try:
+    return signal.Signals(signum).name
+  except ValueError:
+    return "%d" % signum
+
+# accept 11, SEGV or SIGSEGV
+def signal_number(arg):
+  if arg.isdigit():
+    return int(arg)
+  name = arg.upper()
+  if not name.startswith("SIG"):
+    name = "SIG" + name
+  return signal.Signals[name].value
+
+def print_table(header, rows):
+  widths = [len(h) for h in header]
+  for row in rows:
+    widths = [max(w, len(str(v))) for w, v in zip(widths, row)]
+  print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+  for row in rows:
+    print("  ".join(str(v).ljust(w) for v, w in zip(row, widths)))
+
+# runs, failures, hangs, runs over a limit, the resources used and the signals of the failures for every utility
+def summary(db, where, params):
+  rows = db.execute("select utility, test_type, count(*), sum(result = 'failed'), sum(result = 'hung'), " \
+    "sum(result = 'exceeded'), sum(result = 'not found'), sum(leaked), avg(duration), avg(utime + stime), max(maxrss), " \
+    "max(output) from runs %s group by utility, test_type order by utility, test_type" % where, params).fetchall()
+  signals = {}
+  for utility, test_type, signum, count in db.execute("select utility, test_type, signal, count(*) from runs %s " \
+    "%s signal is not null group by utility, test_type, signal" % (where, "and" if where else "where"), params):
+    signals.setdefault((utility, test_type), []).append("%s:%d" % (signal_name(signum), count))
+  table = []
+  for utility, test_type, runs, failed, hung, exceeded, not_found, leaked, duration, cpu, maxrss, output in rows:
+    table.append((utility, test_type, runs, failed, hung, exceeded, not_found, leaked or 0, "%.3f" % (duration or 0), \
+      "%.3f" % (cpu or 0), "%.1f" % ((maxrss or 0) / 1024.0), "%.1f" % ((output or 0) / 1048576.0), \
+      " ".join(signals.get((utility, test_type), []))))
+  print_table(("utility", "type", "runs", "failed", "hung", "exceeded", "not found", "leaked", "avg sec", "avg cpu", \
+    "max rss MB", "max out MB", "signals"), table)
+
+# the runs, a test case with aliases (the same content, see corpus.py) is shown with them, e.g. "Small1/t3 (=t7,t9)"
+def list_runs(db, where, params):
+  rows = db.execute("select id, utility, test_type, dataset, testcase, aliases, result, hang, exceeded, retcode, duration, " \
+    "maxrss, cmd from runs %s order by utility, test_type, dataset, testcase" % where, params).fetchall()
+  table = []
+  for run_id, utility, test_type, dataset, testcase, aliases, result, hang, exceeded, retcode, duration, maxrss, cmd in rows:
+    testcase = "%s/%s" % (dataset, testcase)
+    if(aliases is not None):
+      testcase = "%s (=%s)" % (testcase, ",".join(os.path.basename(alias) for alias in json.loads(aliases)))
+    if(hang is not None):
+      result = "%s (%s)" % (result, hang)
+    elif(exceeded is not None):
+      result = "%s (%s)" % (result, exceeded)
+    table.append((run_id, utility, test_type, testcase, result, "-" if retcode is None else retcode, \
+      "%.3f" % duration, "-" if maxrss is None else "%.1f" % (maxrss / 1024.0), cmd))
+  print_table(("id", "utility", "type", "testcase", "result", "retcode", "sec", "rss MB", "command"), table)
+
+
+if __name__ == "__main__":
+
+  if(len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help")):
+    print(usage)
+    sys.exit(1)
+
+  db_path = sys.argv[1]
+  if os.path.isdir(db_path):
+    db_path = os.path.join(db_path, "results.db")
+  if not os.path.isfile(db_path):
+    print("%s does not exist" % db_path)
+    print(usage)
+    sys.exit(1)
+
+  try:
+    opts, args = getopt.getopt(sys.argv[2:], "u:t:d:r:s:l", ["utility=", "type=", "dataset=", "result=", "signal=", "list"])
+  except getopt.GetoptError as err:
+    print("error on arguments")
+    print(usage)
+    sys.exit(1)
+
+  conditions = []
+  params = []
+  listing = False
+  for opt, arg in opts:
+    if(opt in ("-u", "--utility")):
+      conditions.append("utility = ?")
+      params.append(arg)
+    elif(opt in ("-t", "--type")):
+      conditions.append("test_type = ?")
+      params.append(arg)
+    elif(opt in ("-d", "--dataset")):
+      conditions.append("dataset = ?")
+      params.append(arg)
+    elif(opt in ("-r", "--result")):
+      conditions.append("result = ?")
+      params.append(arg.replace("_", " "))
+    elif(opt in ("-s", "--signal")):
+      try:
+        conditions.append("signal = ?")
+        params.append(signal_number(arg))
+      except KeyError:
+        print("unknown signal %s" % arg)
+        sys.exit(1)
+    elif(opt in ("-l", "--list")):
+      listing = True
+
+  where = ""
+  if(conditions):
+    where = "where " + " and ".join(conditions)
+
+  db = store.open_db(db_path)
+  if(listing):
+    list_runs(db, where, params)
+  else:
+    summary(db, where, params)
+  db.close()
@@ -7,12 +7,28 @@
 # this script is used to generate big test cases.
 
 import os
-import subprocess
 import sys
 import random
 import getopt
 import re
 import datetime
+import time
+import shutil
+import shlex
+import json
+import multiprocessing
+
+import launch
+import ptydriver
+import ptyinput
+import staging
+import journal
+import store
+import scheduler
+import coordinator
+import tracing
+import corpus
+import sampling
 
 # define variables
 
@@ -21,20 +37,82 @@ return_value = 126
 float_rand = 0.5
 arg_num = 6
 
-# redirect the output to /dev/null, otherwise the shell will be overwhelmed by outputs
-fnull = open(os.devnull, 'w')
 ptyjig_path = "../src/ptyjig"
+# pty lines are run by ptyjig, or by ptydriver.py inside the harness if the backend is "python"
+pty_backend = "ptyjig"
+# like ptyjig -t, a pty utility is killed if it sends no output for pty_idle_timeout seconds after its input
+pty_idle_timeout = 2
+# the python backend types the input with the keystroke delay of the utility ("fixed"), or at the pace the utility
+# reads it ("adaptive", see ptydriver.py)
+pty_pacing = "fixed"
+end_dir = "./end"
 
 first_file_for_more = "/p/paradyn/papers/fuzz2020/testcases/Large3/t150"
-
-usage = "Usage: python3 run.py configuration_file [-i inputfile] [-p prefix] [-t timeout] [-o outputfile]"
+# more and less read first_file_for_more staged as more_file_name in the scratch directory of the run
+more_file_name = "tmp_more"
+
+# if the cmd does not finish in timeout(300 by default) seconds, the test result will be considered as a hang
+timeout = 300
+# with -w, a cmd whose processes make no progress for watch_window seconds is considered as a hang (see watchdog.py)
+watch_window = None
+# with --busy, a cmd busy without progress for busy_windows consecutive windows is a hang before the timeout
+busy_windows = None
+# with -r, the limits of every cmd: rlimits and the bytes of output (see launch.parse_limits)
+limits = None
+# with --profile, the stages of every run are timed (see tracing.py)
+profiling = False
+
+# the test cases with the same content as a test case that is run, by its path (see corpus.py)
+testcase_aliases = {}
+# the sha256 of the content of every test case, by its path, for the keys of the journal (see journal.py)
+testcase_digests = {}
+
+# compressed test cases are decompressed into this cache (result_dir/corpus_cache) for the runs that need a file,
+# its least recently used files are removed once it holds more than corpus_cache_size bytes (see corpus.py)
+corpus_cache_dir = ""
+corpus_cache_size = 1 << 30
+# with -m, every process running tests keeps up to memory_cache_size bytes of test cases in memory (see corpus.py)
+memory_cache_size = 0
+
+# the order the jobs are run in: "line" runs every test case on a line before the next line, "testcase" every line
+# on a test case before the next test case, "block" every line on as many test cases as fit in the memory cache
+job_orders = ("line", "testcase", "block")
+
+# the sanitized input of the pty tests is cached here (result_dir/pty_input), so other runs of the same test case reuse it.
+# Like the corpus cache, its least recently used files are removed once it holds more than pty_input_size bytes
+pty_input_dir = ""
+pty_input_size = 1 << 30
+
+# every worker runs its test cases inside its own scratch directory, because cp and pty create temporary files in the current directory
+scratch_dir = ""
+# in the workers of the pool engine, a flag for every line of the configuration file, set once its utility was not
+# found (see run_jobs)
+missing_flags = None
+
+# placeholders in the argv template of a line, filled in for every run
+options_slot = "{options}"
+testcase_slot = "{testcase}"
+testcase2_slot = "{testcase2}"
+delay_slot = "{delay}"
+
+# the redirections of a line: < file (the stdin of the utility), > file and >> file (its stdout), 2> file and
+# 2>&1 (its stderr) and | cmd (a command its stdout is piped into). In a line they are operators, in an argv
+# template the tuples (operator,), and the other shell metacharacters are errors, since no shell runs the line
+redirections = ("<", ">", ">>", "2>", "2>&1", "|")
+shell_metacharacters = ";&$`()*?"
+
+usage = "Usage: python3 run.py configuration_file [-i inputfile] [-p prefix] [-t timeout] [-o outputfile] [-j jobs] [-e pool|async|distributed] [-l address] [-b ptyjig|python] [-s seed] [-w window] [--busy windows] [-r limits] [-m MB] [--order line|testcase|block] [--pace fixed|adaptive] [--strength t] [--profile] [--keep-duplicates] [--peak-rss]"
+
+# the strength of the covering arrays the options of a pool are sampled from (see sampling.py), 0 to flip a coin
+# for every option of every run
+sampling_strength = 2
 
 # return a random subset of s, each element has 0.5 probability
-def random_subset(s):
+def random_subset(s, rng=random):
   out = ""
   for el in s:
     # random coin flip
-    if random.random() > float_rand:
+    if rng.random() > float_rand:
       out = out + el + " "
   return out
 
@@ -71,15 +149,174 @@ def get_options_from_pool(option_part_of_line):
   else:
     return ""
 
+# split text into words like the shell did, quotes and backslashes included, with the redirections as (operator,).
+# Raise ValueError on a shell metacharacter outside of quotes, or an unterminated quote
+def split_words(text):
+  words = []
+  word = None
+  # whether the word so far has been quoted, "2" only starts 2> unquoted
+  quoted = False
+  i = 0
+  while i < len(text):
+    c = text[i]
+    if c.isspace():
+      if(word is not None):
+        words.append(word)
+      word = None
+      quoted = False
+      i = i + 1
+      continue
+    if(c in "<>|"):
+      op = c
+      if(c == ">" and word == "2" and not quoted):
+        op = "2>"
+        word = None
+      elif(word is not None):
+        words.append(word)
+        word = None
+      if(op == ">" and text[i + 1: i + 2] == ">"):
+        op = ">>"
+        i = i + 1
+      elif(op == "2>" and text[i + 1: i + 3] == "&1"):
+        op = "2>&1"
+        i = i + 2
+      words.append((op,))
+      quoted = False
+      i = i + 1
+      continue
+    if(c in shell_metacharacters):
+      raise ValueError("%s is not supported, the line is not run by a shell" % c)
+    if(word is None):
+      word = ""
+    if(c == "'"):
+      end = text.find("'", i + 1)
+      if(end < 0):
+        raise ValueError("unterminated quote")
+      word = word + text[i + 1: end]
+      quoted = True
+      i = end + 1
+    elif(c == '"'):
+      i = i + 1
+      while i < len(text) and text[i] != '"':
+        if(text[i] == "\\" and text[i + 1: i + 2] in ('"', "\\", "$", "`")):
+          i = i + 1
+        elif(text[i] in "$`"):
+          raise ValueError("%s is not supported, the line is not run by a shell" % text[i])
+        word = word + text[i: i + 1]
+        i = i + 1
+      if(i >= len(text)):
+        raise ValueError("unterminated quote")
+      quoted = True
+      i = i + 1
+    elif(c == "\\"):
+      word = word + text[i + 1: i + 2]
+      quoted = True
+      i = i + 2
+    else:
+      word = word + c
+      i = i + 1
+  if(word is not None):
+    words.append(word)
+  return words
+
+# split an argv template with redirections (see split_words) into the argv and the streams of the utility:
+# {"stdin": file or None, "stdout": file or None, "append": whether stdout is appended to, "stderr": file, "stdout"
+# or None, "pipe": the argv stdout is piped into or None}. None is the default of run.py: the test case or nothing
+# for stdin, and the pipe counting the output for stdout and stderr. Raise ValueError on a bad redirection
+def parse_streams(words):
+  argv = []
+  streams = {"stdin": None, "stdout": None, "append": False, "stderr": None, "pipe": None}
+  i = 0
+  while i < len(words):
+    word = words[i]
+    if not isinstance(word, tuple):
+      argv.append(word)
+      i = i + 1
+      continue
+    op = word[0]
+    if(op == "|"):
+      pipe = words[i + 1:]
+      if(not pipe or any(isinstance(arg, tuple) for arg in pipe)):
+        raise ValueError("| needs a command without redirections")
+      if(streams["stdout"] is not None):
+        raise ValueError("stdout is redirected twice")
+      streams["pipe"] = pipe
+      break
+    if(op == "2>&1"):
+      streams["stderr"] = "stdout"
+      i = i + 1
+      continue
+    # the sampled options stay with the utility, the file is the word after them, like the test case of "file
+    # mail user <"
+    target_at = i + 1
+    if(target_at < len(words) and words[target_at] == options_slot):
+      argv.append(options_slot)
+      target_at = target_at + 1
+    if(target_at >= len(words) or isinstance(words[target_at], tuple) or words[target_at] == testcase2_slot):
+      raise ValueError("%s needs a file" % op)
+    target = words[target_at]
+    if(op == "<"):
+      key = "stdin"
+    elif(op in (">", ">>")):
+      key = "stdout"
+      streams["append"] = op == ">>"
+    else:
+      key = "stderr"
+    if(streams[key] is not None):
+      raise ValueError("%s is redirected twice" % key)
+    streams[key] = target
+    i = target_at + 1
+  return argv, streams
+
 # leave a space for randomly selected options
 def get_other_options(option_part_of_line):
-  # return string on the left of [ and string on the right of ]
+  # return the arguments on the left of [ and the arguments on the right of ], split like the shell did
   idx_left = option_part_of_line.find("[")
   idx_right = option_part_of_line.find("]")
   if(idx_left >= 0):
-    return option_part_of_line[0: idx_left] + " %s " + option_part_of_line[idx_right+1: ]
+    return split_words(option_part_of_line[0: idx_left]) + [options_slot] + split_words(option_part_of_line[idx_right+1: ])
   else:
-    return option_part_of_line + " %s"
+    return with_utility(split_words(option_part_of_line), [options_slot])
+
+# add words to the end of the arguments of the utility in the words of a line, before the command of its pipe
+def with_utility(words, added):
+  if ("|",) in words:
+    at = words.index(("|",))
+    return words[:at] + added + words[at:]
+  return words + added
+
+# fill the placeholders of an argv template
+def expand_argv(template, options, testcase="", testcase2="", delay=0):
+  argv = []
+  for arg in template:
+    if(arg == options_slot):
+      argv.extend(options)
+    elif(arg == testcase_slot):
+      argv.append(testcase)
+    elif(arg == testcase2_slot):
+      argv.append(testcase2)
+    elif(arg == delay_slot):
+      argv.append("%g" % delay)
+    else:
+      argv.append(arg)
+  return argv
+
+# the command as it would be typed in a shell, for the output and the logs. redirects are the streams of
+# parse_streams but stdin
+def format_cmd(argv, stdin_path, redirects=None):
+  cmd = " ".join([shlex.quote(arg) for arg in argv])
+  if(stdin_path is not None):
+    cmd = cmd + " < " + shlex.quote(stdin_path)
+  if(redirects is not None):
+    if(redirects["stdout"] is not None):
+      cmd = cmd + (" >> " if redirects["append"] else " > ") + shlex.quote(redirects["stdout"])
+    if(redirects["stderr"] == "stdout"):
+      cmd = cmd + " 2>&1"
+    elif(redirects["stderr"] is not None):
+      cmd = cmd + " 2> " + shlex.quote(redirects["stderr"])
+    if(redirects["pipe"] is not None):
+      cmd = cmd + " | " + " ".join([shlex.quote(arg) for arg in redirects["pipe"]])
+  return cmd
 
 def parse_a_line(line):
 
@@ -116,322 +353,489 @@ def parse_a_line(line):
 
   # get the options in option pool
   all_options_from_pool = get_options_from_pool(option_part_of_line)
+  for option in all_options_from_pool.split():
+    if(split_words(option) != [option]):
+      raise ValueError("%s in the option pool is not a plain argument" % option)
   other_options = get_other_options(option_part_of_line)
 
+  # the runs happen in scratch directories, so a utility given by a relative path is made absolute
+  program = utility_name
+  if("/" in program):
+    program = os.path.abspath(program)
 
+  # cmd is the argv template, streams are where its standard streams go (see parse_streams), stdin None to inherit it
   if(test_type == "stdin"):
     # leave a space for testcase
-    cmd = utility_name \
-              + " " + other_options \
-              + " < " + "%s" 
+    cmd = [program] + with_utility(other_options, [("<",), testcase_slot])
 
   elif(test_type == "file"):
     # leave a space for testcase
-    cmd = utility_name \
-              + " " + other_options \
-              + " " + "%s"
+    cmd = [program] + with_utility(other_options, [testcase_slot])
 
   elif(test_type == "cp"):
-    cmd = utility_name \
-              + " " + other_options \
-              + " " + new_file_name
+    cmd = [program] + with_utility(other_options, [new_file_name])
 
   elif(test_type == "two_files"):
     # leave two space for testcases
-    cmd = utility_name \
-              + " " + other_options \
-              + " " + "%s" \
-              + " " + "%s"
+    cmd = [program] + with_utility(other_options, [testcase_slot, testcase2_slot])
 
   elif(test_type == "pty"):
-    # -d delay will be set in run_pty
+    # -d delay will be set in make_jobs
 
-    # more and less are special, it requires two files. The first file is the file to operate on, the second file provides random control sequence. Before the testing, copy one big test case to /tmp/tmp as the first file.
+    # more and less are special, it requires two files. The first file is the file to operate on, the second file provides random control sequence. Before the testing, copy one big test case to more_file_name as the first file.
     if(utility_name == "more" or utility_name == "less"):
-        cmd = ptyjig_path \
-              + " " + "-d" + " " + "%g" \
-              + " " + "-x" \
-              + " " + utility_name \
-              + " " + other_options \
-              + " " + "/tmp/tmp" \
-              + " < " + new_file_name
+        cmd = [program] + other_options + [more_file_name]
     else:
-        cmd = ptyjig_path \
-              + " " + "-d" + " " + "%g" \
-              + " " + "-x" \
-              + " " + utility_name \
-              + " " + other_options \
-              + " < " + new_file_name
+        cmd = [program] + other_options
+    # the input is typed into the pty and the output read from it, the utility has no other streams
+    if any(isinstance(word, tuple) for word in cmd):
+      raise ValueError("pty lines can't redirect")
+    # the python backend types the input itself
+    if(pty_backend == "ptyjig"):
+      cmd = [ptyjig_path, "-d", delay_slot, "-x"] + cmd
+    cmd = cmd + [("<",), new_file_name]
 
+  cmd, streams = parse_streams(cmd)
 
   log_name = "%s.%s" % (os.path.basename(utility_name), test_type)
 
-  return cmd, test_type, utility_name, new_file_name, all_options_from_pool, log_name
-
-# run "file"
-def run_file(cmd, utility_name, log_path, all_options_from_pool, testcase_list): 
-
-  # if the log exists and have been finished, go to test the next utility
-  if os.path.exists(log_path) and os.stat(log_path).st_size != 0:
-    with open(log_path, "r") as f:
-      if f.readlines()[-1] == "finished\n":
-        return
-
-  # otherwise, create the log or overwrite it 
-  log_writer = open(log_path, "w")
-  log_writer.write("start: %s\n" % line)
-
-  for testcase in testcase_list:
-
-    options_sampled_from_pool = random_subset(all_options_from_pool.split())
-    final_cmd = cmd % (options_sampled_from_pool, testcase)
-    print("running: %s" % final_cmd)
-
-    try:
-      retcode = subprocess.call(final_cmd, shell=True, stdout=fnull, stderr=subprocess.STDOUT, timeout=timeout)
-
-    except(subprocess.TimeoutExpired):
-      log_writer.write("%s hung\n" % final_cmd)
-
-    else:
-      print("retcode is %d" % retcode)
-      if(retcode == 127):
-        log_writer.write("%s not found\n" % utility_name)
-        break
-      # check return value, record exit code with special meaning
-      if retcode >= return_value or retcode < 0:
-        log_writer.write("%s failed, error: %d\n" % (final_cmd, retcode))
-
-  log_writer.write("%s\n" % datetime.datetime.now())
-  log_writer.write("finished\n")
-  log_writer.close()
-  print("finished: %s" % line)
-
-# run "stdin", so far it's identical to run_file
-def run_stdin(cmd, utility_name, log_path, all_options_from_pool, testcase_list): 
-
-  # if the log exists and have been finished, go to test the next utility
-  if os.path.exists(log_path) and os.stat(log_path).st_size != 0:
-    with open(log_path, "r") as f:
-      if f.readlines()[-1] == "finished\n":
-        return
-
-  # otherwise, create the log or overwrite it 
-  log_writer = open(log_path, "w")
-  log_writer.write("start: %s\n" % line)
-
-  for testcase in testcase_list:
-
-    options_sampled_from_pool = random_subset(all_options_from_pool.split())
-    final_cmd = cmd % (options_sampled_from_pool, testcase)
-    print("running: %s" % final_cmd)
-
-    try:
-      retcode = subprocess.call(final_cmd, shell=True, stdout=fnull, stderr=subprocess.STDOUT, timeout=timeout)
-
-    except(subprocess.TimeoutExpired):
-      log_writer.write("%s hung\n" % final_cmd)
-
-    else:
-      print("retcode is %d" % retcode)
-      if(utility_name not in ("sh", "csh", "zsh") and retcode == 127):
-        log_writer.write("%s not found\n" % utility_name)
-        break
-      # check return value, record exit code with special meaning
-      if retcode >= return_value or retcode < 0:
-        log_writer.write("%s failed, error: %d\n" % (final_cmd, retcode))
-
-  log_writer.write("%s\n" % datetime.datetime.now())
-  log_writer.write("finished\n")
-  log_writer.close()
-  print("finished: %s" % line)
-
-# run "cp", need to copy test case firstly
-def run_cp(cmd, utility_name, new_file_name, log_path, all_options_from_pool, testcase_list): 
-
-  # if the log exists and have been finished, go to test the next utility
-  if os.path.exists(log_path) and os.stat(log_path).st_size != 0:
-    with open(log_path, "r") as f:
-      if f.readlines()[-1] == "finished\n":
-        return
-
-  # otherwise, create the log or overwrite it 
-  log_writer = open(log_path, "w")
-  log_writer.write("start: %s\n" % line)
-
-  for testcase in testcase_list:
-
-    options_sampled_from_pool = random_subset(all_options_from_pool.split())
-    final_cmd = cmd % options_sampled_from_pool
-
-    # copy test case to a new temporary file with a specified name
-    subprocess.call(["cp %s %s" % (testcase, new_file_name)], shell=True)
-
-    print("running: %s" % final_cmd)
-
-    try:
-      retcode = subprocess.call(final_cmd, shell=True, stdout=fnull, stderr=subprocess.STDOUT, timeout=timeout)
-
-    except(subprocess.TimeoutExpired):
-      log_writer.write("%s hung, testcase is %s\n" % (final_cmd, testcase))
-
-    else:
-      print("retcode is %d" % retcode)
-      if(retcode == 127):
-        log_writer.write("%s not found\n" % utility_name)
-        break
-      # check return value, record exit code with special meaning
-      if retcode >= return_value or retcode < 0:
-        log_writer.write("%s failed, error: %d\n" % (final_cmd, retcode))
-
-    finally:
-      subprocess.call("rm %s" % new_file_name, shell=True)
-
-  log_writer.write("%s\n" % datetime.datetime.now())
-  log_writer.write("finished\n")
-  log_writer.close()
-  print("finished: %s" % line)
-
-
-# run "two_files", so far it's identical to run_file
-def run_two_files(cmd, utility_name, log_path, all_options_from_pool, testcase_list): 
-
-  # if the log exists and have been finished, go to test the next utility
-  if os.path.exists(log_path) and os.stat(log_path).st_size != 0:
-    with open(log_path, "r") as f:
-      if f.readlines()[-1] == "finished\n":
-        return
-
-  # otherwise, create the log or overwrite it 
-  log_writer = open(log_path, "w")
-  log_writer.write("start: %s\n" % line)
-
-  for testcase in testcase_list:
-
-    options_sampled_from_pool = random_subset(all_options_from_pool.split())
-
-    # randomly select two testcases each time
-    testcase1 = random.choice(testcase_list)
-    testcase2 = random.choice(testcase_list)
-    final_cmd = cmd % (options_sampled_from_pool, testcase1, testcase2)
-    print("running: %s" % final_cmd)
-
-    try:
-      retcode = subprocess.call(final_cmd, shell=True, stdout=fnull, stderr=subprocess.STDOUT, timeout=timeout)
-
-    except(subprocess.TimeoutExpired):
-      log_writer.write("%s hung\n" % final_cmd)
-
-    else:
-      print("retcode is %d" % retcode)
-      if(retcode == 127):
-        log_writer.write("%s not found\n" % utility_name)
-        break
-      # check return value, record exit code with special meaning
-      if retcode >= return_value or retcode < 0:
-        log_writer.write("%s failed, error: %d\n" % (final_cmd, retcode))
-
-  log_writer.write("%s\n" % datetime.datetime.now())
-  log_writer.write("finished\n")
-  log_writer.close()
-  print("finished: %s" % line)
-
-
-# run "pty"
-def run_pty(cmd, utility_name, log_path, all_options_from_pool, testcase_list):  
-
-  # if the log exists and have been finished, go to test the next utility
-  if os.path.exists(log_path) and os.stat(log_path).st_size != 0:
-    with open(log_path, "r") as f:
-      if f.readlines()[-1] == "finished\n":
-        return
-
-  # otherwise, create the log or overwrite it 
-  log_writer = open(log_path, "w")
-  log_writer.write("start: %s\n" % line)
-
-  for testcase in testcase_list:
-
-    options_sampled_from_pool = random_subset(all_options_from_pool.split())
-
-    # copy test case to tmp and append the designed end file 
-    subprocess.call("cat %s ./end/end_%s > tmp" % (testcase, utility_name), shell=True, stdout=fnull, stderr=subprocess.STDOUT)
-
-    fr = open("tmp", "rb")
-    s = fr.read()
-    fr.close()
-    # remove all ^z in tmp
-    s = s.replace(b"\x1a", b"")
-    # remove all ^c in tmp
-    s = s.replace(b"\x03", b"")
-    # remove all ^\ in tmp
-    s = s.replace(b"\x1c", b"")
-    # remove all \x9a in tmp
-    s = s.replace(b"\x9a", b"")
-    # remove all \xc0 in tmp
-    s = s.replace(b"\xc0", b"")
-
-    # Z or z will suspend telnet 
-    if(utility_name == "telnet"):
-        s = s.replace(b"Z", b"")
-        s = s.replace(b"z", b"")
-    # command F will make less show the file updates in real time, it requires an interrupt to quit.
-    if(utility_name == "less"):
-        s = s.replace(b"F", b"")
-    fw = open("tmp", "wb")
-    fw.write(s)
-    fw.close()
+  return cmd, streams, test_type, utility_name, new_file_name, all_options_from_pool, log_name
 
+# the job running cmd, the template of a line, with the given options on testcase. two_files runs on the two files
+# in files instead, testcase is only the test case the job is for
+def make_job(line_no, index, line, cmd, streams, test_type, utility_name, new_file_name, options, testcase, files=None):
+  delay = 0
+  # a compressed or packed test case is staged in the scratch directory under its name without the suffix
+  if(test_type == "two_files"):
+    argv = expand_argv(cmd, options, *[file if corpus.plain(file) else corpus.staged_name(file) for file in files])
+  elif(test_type == "pty"):
     # htop and top need to be fed input slowly, otherwise it can't quit
     if(utility_name == "htop"):
-      final_cmd = cmd % (0.01, options_sampled_from_pool)
+      delay = 0.01
     elif(utility_name == "top"):
-      final_cmd = cmd % (0.01, options_sampled_from_pool)
+      delay = 0.01
     else:
-      final_cmd = cmd % (0.001, options_sampled_from_pool)
+      delay = 0.001
+    argv = expand_argv(cmd, options, delay=delay)
+    if(pty_backend == "python" and pty_pacing == "adaptive"):
+      delay = None
+  elif(test_type == "file" and not corpus.plain(testcase)):
+    argv = expand_argv(cmd, options, corpus.staged_name(testcase))
+  else:
+    argv = expand_argv(cmd, options, testcase)
+
+  stdin_path = testcase if streams["stdin"] == testcase_slot else streams["stdin"]
+  # where stdout and stderr go if not to the pipe counting the output (see launch.spawn)
+  redirects = None
+  if(streams["stdout"] is not None or streams["stderr"] is not None or streams["pipe"] is not None):
+    redirects = dict((key, streams[key]) for key in ("stdout", "append", "stderr", "pipe"))
+
+  end_path = None
+  if(test_type == "pty" and os.path.isfile(os.path.join(end_dir, "end_%s" % utility_name))):
+    end_path = os.path.join(end_dir, "end_%s" % utility_name)
+
+  return {"line_no": line_no, "index": index, "test_type": test_type, "utility_name": utility_name, \
+    "new_file_name": new_file_name, "testcase": testcase, "files": files, "argv": argv, "stdin": stdin_path, \
+    "redirects": redirects, "final_cmd": format_cmd(argv, stdin_path, redirects), \
+    "pty_driver": test_type == "pty" and pty_backend == "python", "delay": delay, "idle_timeout": pty_idle_timeout, \
+    "end_path": end_path, "input_cache": pty_input_dir, "corpus_cache": corpus_cache_dir, "memory_cache": memory_cache_size, "window": watch_window, "busy": busy_windows, "limits": limits, \
+    "key": journal.job_key(line, testcase, options, [testcase_digests.get(file) for file in files or [testcase]]), "line": line, "options": options, \
+    "trace": [] if profiling else None}
+
+# sample the options (and the test cases of two_files) of every run of a line, return one job per test case.
+# The options of a test case are the row of the covering arrays of the line (see sampling.py) at its position in
+# name order, or flipped from a coin without a strength. The sampling of a job only depends on the seed of the
+# campaign, the line and the name of the test case (without the suffix of its compression), or the names of the
+# test cases, so a resumed campaign samples the same options and finds the test cases it has already run in the
+# journal, and a compressed corpus is tested like the plain one
+def make_jobs(line_no, line, seed, cmd, streams, test_type, utility_name, new_file_name, all_options_from_pool, testcase_list):
+  jobs = []
+  pool = all_options_from_pool.split()
+  samples = None
+  if(sampling_strength > 0):
+    ranks = sorted(range(len(testcase_list)), key=lambda i: (corpus.staged_name(testcase_list[i]), testcase_list[i]))
+    rows = sampling.sample_options(seed, line, pool, sampling_strength, len(testcase_list))
+    samples = [None] * len(testcase_list)
+    for rank, i in enumerate(ranks):
+      samples[i] = rows[rank]
+  for index, testcase in enumerate(testcase_list):
+    rng = random.Random("%s\0%s\0%s" % (seed, line, corpus.staged_name(testcase)))
+
+    if(samples is None):
+      options_sampled_from_pool = random_subset(pool, rng).split()
+    else:
+      options_sampled_from_pool = samples[index]
+
+    files = None
+    if(test_type == "two_files"):
+      # randomly select two testcases each time
+      files = [rng.choice(testcase_list), rng.choice(testcase_list)]
+
+    jobs.append(make_job(line_no, index, line, cmd, streams, test_type, utility_name, new_file_name, \
+      options_sampled_from_pool, testcase, files))
+  return jobs
+
+# the jobs of all lines in the given order (see job_orders). The jobs are made line by line, and index is the
+# position of the test case of a job in testcase_list. A block holds the test cases that fit in budget bytes,
+# at least one
+def order_jobs(jobs, order, testcase_list, budget):
+  if(order == "testcase"):
+    return sorted(jobs, key=lambda job: job["index"])
+  if(order == "block"):
+    blocks = []
+    block = 0
+    size = 0
+    for testcase in testcase_list:
+      length = corpus.testcase_stat(testcase)[0] if not os.path.isdir(testcase) else 0
+      if(size > 0 and size + length > budget):
+        block += 1
+        size = 0
+      size += length
+      blocks.append(block)
+    return sorted(jobs, key=lambda job: blocks[job["index"]])
+  return jobs
+
+# every run has three steps shared by the engines: prepare_job creates the files the job needs in the
+# scratch directory work_dir, the job is launched in work_dir, and job_records turns its return code into
+# the records for the log
+
+# create the temporary files of a job in work_dir
+def prepare_job(job, work_dir):
+  test_type = job["test_type"]
+  testcase = job["testcase"]
+  utility_name = job["utility_name"]
+
+  # "cp" needs to copy test case firstly, to a new temporary file with a specified name. The utility may write to
+  # it, so it is only reflinked rather than copied when possible
+  if(test_type == "cp"):
+    corpus.stage(job["corpus_cache"], testcase, os.path.join(work_dir, job["new_file_name"]), corpus_cache_size, \
+      writable=True)
+
+  # the compressed or packed test cases of "file" and "two_files" are written once into the cache, and staged from it
+  elif(test_type == "file" or test_type == "two_files"):
+    for path in job["files"] or [testcase]:
+      if not corpus.plain(path):
+        corpus.stage(job["corpus_cache"], path, os.path.join(work_dir, corpus.staged_name(path)), corpus_cache_size)
+
+  elif(test_type == "pty"):
+    # the test case with the designed end file appended and the characters that would suspend the utility
+    # removed, it is made once per test case and filter set. The utility runs in work_dir on whatever it is typed
+    # and may write to the files there, so they are reflinked or copied like the file of "cp"
+    ptyinput.stage_input(job["input_cache"], testcase, job["end_path"], ptyinput.utility_filter(utility_name), \
+      pty_input_size, os.path.join(work_dir, job["new_file_name"]))
 
     # more needs two files, one file provides random control sequence, another file is the file to read
     if(utility_name == "more" or utility_name == "less"):
-      subprocess.call(["cp %s /tmp/tmp" % first_file_for_more], shell=True)
-    
-
+      try:
+        staging.stage_file(first_file_for_more, os.path.join(work_dir, more_file_name), writable=True)
+      except OSError as err:
+        print("cp %s: %s" % (first_file_for_more, err.strerror))
+
+# remove the temporary files of a job, and the files the utility left in work_dir (a.out, tags, *.o, ...),
+# so every run starts in an empty scratch directory
+def cleanup_job(job, work_dir):
+  staging.clear_dir(work_dir)
+
+# the path stdin of a job is read from, relative paths are in work_dir
+def job_stdin(job, work_dir):
+  if(job["stdin"] is None):
+    return None
+  return os.path.join(work_dir, job["stdin"])
+
+def print_running(job):
+  if(job["test_type"] == "pty"):
     # print final_cmd to stdin
-    print("running: %s, test case: %s" % (final_cmd, testcase))
-
-    # debug
-    f = open("log", "w")
-    f.write("running: %s, current test case: %s" % (final_cmd, testcase))
-    f.close()
-    # debug
-
-    try:
-      retcode = subprocess.call(final_cmd, shell=True, stdout=fnull, stderr=subprocess.STDOUT, timeout=timeout)
-
-    except(subprocess.TimeoutExpired):
-      log_writer.write("%s hung, testcase is %s\n" % (final_cmd, testcase))
-
+    print("running: %s, test case: %s" % (job["final_cmd"], job["testcase"]))
+  else:
+    print("running: %s" % job["final_cmd"])
+
+# return the records for the log, and whether the utility was not found. retcode is None if the job hung,
+# hang tells how if the watchdog found it. A job over one of its limits is recorded as exceeding it
+def job_records(job, retcode, hang=None, exceeded=None):
+  test_type = job["test_type"]
+  final_cmd = job["final_cmd"]
+  testcase = job["testcase"]
+  utility_name = job["utility_name"]
+
+  hung = "hung"
+  if(hang is not None and hang not in ("timeout", "no output")):
+    hung = "hung (%s)" % hang
+  # "cp" and "pty" name the test case in the log, it is not part of their command
+  if(test_type == "cp" or test_type == "pty"):
+    hung_record = "%s %s, testcase is %s\n" % (final_cmd, hung, testcase)
+  else:
+    hung_record = "%s %s\n" % (final_cmd, hung)
+
+  if(exceeded is not None):
+    if(test_type == "cp" or test_type == "pty"):
+      return ["%s exceeded the %s limit, testcase is %s\n" % (final_cmd, exceeded, testcase)], False
+    return ["%s exceeded the %s limit\n" % (final_cmd, exceeded)], False
+
+  if(retcode is None):
+    return [hung_record], False
+
+  print("retcode is %d" % retcode)
+  # shells tested with "stdin" may return 127 themselves
+  if(retcode == 127 and not (test_type == "stdin" and utility_name in ("sh", "csh", "zsh"))):
+    return ["%s not found\n" % utility_name], True
+
+  if(test_type == "pty"):
+    # killed by built-in timer of ptyjig (or ptydriver) because of timeout
+    if(retcode == 137 or retcode == -9):
+      return [hung_record], False
+    # check return value, record exit code with special meaning
+    elif retcode >= return_value or retcode < 0:
+      return ["%s failed, testcase is %s, error: %d\n" % (final_cmd, testcase, retcode)], False
+  # check return value, record exit code with special meaning
+  elif retcode >= return_value or retcode < 0:
+    return ["%s failed, error: %d\n" % (final_cmd, retcode)], False
+  return [], False
+
+# create the scratch directory of this worker and run inside it
+def init_worker(scratch_root, worker_timeout, flags=None):
+  global scratch_dir, timeout, missing_flags
+  timeout = worker_timeout
+  missing_flags = flags
+  scratch_dir = os.path.join(scratch_root, "w%d" % os.getpid())
+  if not os.path.exists(scratch_dir):
+    os.makedirs(scratch_dir)
+  os.chdir(scratch_dir)
+
+# prepare a job in work_dir and return the path of its stdin
+def start_job(job, work_dir):
+  job["start_time"] = time.monotonic()
+  trace = job["trace"]
+  t = job["start_ns"] = tracing.now(trace)
+  corpus.set_memory_budget(job["memory_cache"])
+  prepare_job(job, work_dir)
+  t = tracing.span(trace, "prepare", t)
+  print_running(job)
+  tracing.span(trace, "print", t)
+  return job_stdin(job, work_dir)
+
+# clean up after a job, return the records with the position of the job so that the logs can be merged,
+# and the return code, duration and resource usage of the run for the result store. info is the launch.run_info
+# of the run
+def finish_job(job, work_dir, retcode, info):
+  run = dict(info)
+  run.update({"retcode": retcode, "leaked": len(info["leaked"]), "duration": time.monotonic() - job["start_time"], \
+    "timestamp": time.time()})
+  # processes of the run still alive after it, they have been killed
+  for process in info["leaked"]:
+    print("leaked: %s" % process)
+  if(info["exceeded"] is not None):
+    print("exceeded the %s limit" % info["exceeded"])
+  trace = job["trace"]
+  t = tracing.now(trace)
+  cleanup_job(job, work_dir)
+  t = tracing.span(trace, "cleanup", t)
+  records, not_found = job_records(job, retcode, info["hang"], info["exceeded"])
+  tracing.span(trace, "records", t)
+  if(trace is not None):
+    tracing.span(trace, "job", job["start_ns"])
+    # the worker, its process and the track of its scratch directory (w<pid> or s<slot>)
+    run["trace"] = trace
+    run["worker"] = os.path.basename(work_dir)
+    run["pid"] = os.getpid()
+  return job["line_no"], job["index"], records, not_found, run
+
+# the row of a run in the result store. result is "ok", "failed", "hung", "exceeded" or "not found", signal is
+# the signal that killed the utility, hang tells how it hung: "timeout", "no output" (killed by ptyjig or
+# ptydriver), or what the watchdog found, exceeded the limit it exceeded. aliases are the test cases the run also
+# stands for
+def store_row(job, run, not_found, seed):
+  retcode = run["retcode"]
+  signal = None
+  hang = None
+  if(not_found):
+    result = "not found"
+  elif(run["exceeded"] is not None):
+    result = "exceeded"
+    if(retcode is not None and retcode > 128):
+      signal = retcode - 128
+  elif(retcode is None or (job["test_type"] == "pty" and (retcode == 137 or retcode == -9))):
+    result = "hung"
+    hang = run.get("hang") or ("timeout" if retcode is None else "no output")
+  elif(retcode >= return_value or retcode < 0):
+    result = "failed"
+    if(retcode > 128):
+      signal = retcode - 128
+    elif(retcode < 0):
+      signal = -retcode
+  else:
+    result = "ok"
+  return {"seed": seed, "line": job["line"], "utility": job["utility_name"], "test_type": job["test_type"], \
+    "dataset": re.sub(r"\.pack$", "", os.path.basename(os.path.dirname(job["testcase"]))), "testcase": os.path.basename(job["testcase"]), \
+    "path": job["testcase"], "files": None if job["files"] is None else json.dumps(job["files"]), \
+    "aliases": json.dumps(testcase_aliases[job["testcase"]]) if job["testcase"] in testcase_aliases else None, \
+    "options": " ".join(job["options"]), "cmd": job["final_cmd"], "retcode": retcode, "signal": signal, \
+    "result": result, "hang": hang, "leaked": run["leaked"], "duration": run["duration"], "timestamp": run["timestamp"], \
+    "exceeded": run["exceeded"], "maxrss": run["maxrss"], "utime": run["utime"], "stime": run["stime"], \
+    "nvcsw": run["nvcsw"], "nivcsw": run["nivcsw"], "output": run["output"]}
+
+# run one job in a worker
+def run_job(job):
+  # the utility of the line was not found, the parent records the job like the first miss
+  if(missing_flags is not None and missing_flags[job["line_no"]]):
+    return job["line_no"], job["index"], None, True, None
+  stdin_path = start_job(job, scratch_dir)
+  if(job["pty_driver"]):
+    t = tracing.now(job["trace"])
+    retcode, info = ptydriver.run(job["argv"], stdin_path, job["delay"], job["idle_timeout"], timeout, \
+      limits=job["limits"])
+    tracing.span(job["trace"], "utility", t)
+  else:
+    retcode, info = launch.run(job["argv"], stdin_path, timeout, window=job["window"], limits=job["limits"], \
+      trace=job["trace"], redirects=job["redirects"], busy=job["busy"])
+  return finish_job(job, scratch_dir, retcode, info)
+
+# write the end of the log of a line
+def finish_log(state):
+  if(state["writer"] is None):
+    state["writer"] = open(state["log_path"], "w")
+    state["writer"].write("start: %s\n" % state["line"])
+  state["writer"].write("%s\n" % datetime.datetime.now())
+  state["writer"].write("finished\n")
+  state["writer"].close()
+  print("finished: %s" % state["line"])
+
+# the parent is the only writer of the logs. Results arrive in any order, they are kept until all the
+# previous test cases of the same line are done, so every log is written in test case order as before
+def merge_result(state, index, records, not_found):
+  # otherwise, create the log or overwrite it 
+  if(state["writer"] is None):
+    state["writer"] = open(state["log_path"], "w")
+    state["writer"].write("start: %s\n" % state["line"])
+
+  state["pending"][index] = (records, not_found)
+  while state["next"] in state["pending"]:
+    records, not_found = state["pending"].pop(state["next"])
+    state["next"] += 1
+    # the utility does not exist, drop the results of the remaining test cases
+    if(state["not_found"]):
+      continue
+    for record in records:
+      state["writer"].write(record)
+    state["not_found"] = not_found
+
+  if(state["next"] == state["count"]):
+    finish_log(state)
+
+# whether the log at log_path ends with "finished", only its end is read
+def log_finished(log_path):
+  if not os.path.isfile(log_path):
+    return False
+  with open(log_path, "rb") as f:
+    f.seek(0, os.SEEK_END)
+    f.seek(max(0, f.tell() - len(b"\nfinished\n")))
+    tail = f.read()
+  return tail == b"finished\n" or tail.endswith(b"\nfinished\n")
+
+# run all jobs and merge their results into the log of each line. The "pool" engine runs them with a pool of
+# worker processes, the "async" engine from one event loop with workers children in flight, the "distributed"
+# engine leases them to the workers (worker.py) connected to listen_address with listen_token (see coordinator.py).
+# A job already in the journal (results read from it in journaled) is not run again, new results are appended to it
+# and recorded in the result store. With profile_state (see tracing.py), the stages of every run and of the merge
+# are added to the profile
+def run_jobs(line_states, jobs, workers, scratch_root, engine, journal_state, journaled, store_state, seed, profile_state=None, \
+  listen_address=None, listen_token=None):
+  # lines without test cases are finished immediately
+  for state in line_states.values():
+    if(state["count"] == 0):
+      finish_log(state)
+
+  running = {}
+  # the records of the lines whose utility was not found. Their jobs not started yet are not run: the engines skip
+  # them as they read them, and the workers of the pool skip the ones already queued, from flags shared with them
+  missing = {}
+  flags = None
+  if(engine == "pool" and workers > 1):
+    flags = multiprocessing.RawArray("b", max(line_states, default=-1) + 1)
+
+  # once the utility of a line is not found, its other jobs get the same records without running, like the first
+  # miss used to end the line. They are not journaled, a restart tries the utility again
+  def skip(line_no, index):
+    running.pop((line_no, index), None)
+    merge_result(line_states[line_no], index, missing[line_no], True)
+
+  def skipped(job):
+    if(job["line_no"] not in missing):
+      return False
+    skip(job["line_no"], job["index"])
+    return True
+
+  def merge(result):
+    line_no, index, records, not_found, run = result
+    if(records is None):
+      skip(line_no, index)
+      return
+    start = time.monotonic_ns()
+    if(not_found and line_no not in missing):
+      missing[line_no] = records
+      if(flags is not None):
+        flags[line_no] = 1
+    if (line_no, index) in running:
+      job = running.pop((line_no, index))
+      journal.write_result(journal_state, job["key"], records, not_found)
+      store.add_run(store_state, store_row(job, run, not_found, seed))
+      if(profile_state is not None):
+        worker = run["worker"]
+        tracing.add_events(profile_state, worker, run["pid"], int(worker[1:]), run["trace"], \
+          {"cmd": job["final_cmd"], "testcase": job["testcase"]})
+    merge_result(line_states[line_no], index, records, not_found)
+    if(profile_state is not None):
+      tracing.add_events(profile_state, "parent", os.getpid(), 0, [("merge", start, time.monotonic_ns() - start)])
+
+  todo = []
+  resumed = 0
+  for job in jobs:
+    if job["key"] in journaled:
+      records, not_found = journaled[job["key"]]
+      merge((job["line_no"], job["index"], records, not_found, None))
+      resumed += 1
     else:
-      print("retcode is %d" % retcode)
-      if(retcode == 127):
-        log_writer.write("%s not found\n" % utility_name)
-        break
-
-      # killed by built-in timer of ptyjig because of timeout
-      if(retcode == 137 or retcode == -9):
-        log_writer.write("%s hung, testcase is %s\n" % (final_cmd, testcase))
-      # check return value, record exit code with special meaning
-      elif retcode >= return_value or retcode < 0:
-        log_writer.write("%s failed, testcase is %s, error: %d\n" % (final_cmd, testcase, retcode))
-
-    finally:
-      subprocess.call("rm tmp", shell=True)
-
-  log_writer.write("%s\n" % datetime.datetime.now())
-  log_writer.write("finished\n")
-  log_writer.close()
-  print("finished: %s" % line)
+      running[(job["line_no"], job["index"])] = job
+      todo.append(job)
+  if(resumed > 0):
+    print("resumed: %d test cases found in the journal" % resumed)
+
+  # the async engine and a single process read the jobs as they start them, the pool queues them all at once
+  jobs = (job for job in todo if not skipped(job))
+  if(engine == "async"):
+    scheduler.run_jobs(jobs, workers, scratch_root, timeout, start_job, finish_job, merge)
+  elif(engine == "distributed"):
+    coordinator.run_jobs(todo, listen_address, {"timeout": timeout}, merge, listen_token, skipped)
+  elif(flags is not None):
+    run_pool(todo, workers, scratch_root, merge, flags)
+  else:
+    run_pool(jobs, workers, scratch_root, merge)
+  shutil.rmtree(scratch_root, ignore_errors=True)
+  journal.close_journal(journal_state)
+  store.close_store(store_state)
+  if(profile_state is not None):
+    for line in tracing.close_profile(profile_state, workers):
+      print(line)
+
+# run jobs with a pool of worker processes, passing every result to merge. The workers skip the jobs of the lines
+# set in missing_flags (see run_job)
+def run_pool(jobs, workers, scratch_root, merge, missing_flags=None):
+  pool = None
+  if(workers > 1):
+    pool = multiprocessing.Pool(workers, init_worker, (scratch_root, timeout, missing_flags))
+    results = pool.imap_unordered(run_job, jobs)
+  else:
+    cwd = os.getcwd()
+    init_worker(scratch_root, timeout)
+    results = map(run_job, jobs)
 
+  for result in results:
+    merge(result)
 
+  if(pool is not None):
+    pool.close()
+    pool.join()
+  else:
+    os.chdir(cwd)
 
 
 # the script start here
@@ -449,8 +853,18 @@ if __name__ == "__main__":
   # which means all the files in test_dir will be tested.
   prefix = ""
 
-  # if the cmd does not finish in timeout(300 by default) seconds, the test result will be considered as a hang
-  timeout = 300
+  # number of test cases run in parallel, each by its own worker process with the "pool" engine
+  workers = 1
+  engine = "pool"
+  # where the coordinator of the "distributed" engine listens for workers
+  listen_address = None
+  # the seed of the option sampling, by default the seed in the journal or a new random one
+  seed = None
+  # test cases with the same content are run once, unless --keep-duplicates
+  keep_duplicates = False
+  # with --peak-rss, every run is started by ../src/peakrss for its own peak RSS (see launch.py)
+  peak_rss = False
+  job_order = "line"
 
   # too few arguments
   if(len(sys.argv) < 2):
@@ -470,7 +884,7 @@ if __name__ == "__main__":
     sys.exit(1)
 
   try:
-    opts, args = getopt.getopt(sys.argv[2:],"i:o:p:t:",["ifile=", "ofile=", "prefix=", "timeout="])
+    opts, args = getopt.getopt(sys.argv[2:],"i:o:p:t:j:e:b:s:w:r:l:m:",["ifile=", "ofile=", "prefix=", "timeout=", "jobs=", "engine=", "backend=", "seed=", "window=", "limits=", "profile", "listen=", "keep-duplicates", "memory=", "order=", "pace=", "strength=", "peak-rss", "busy="])
   except getopt.GetoptError as err:
     print("error on arguments")
     print(usage)
@@ -485,9 +899,52 @@ if __name__ == "__main__":
       prefix = arg
     elif(opt in ("-t", "--timeout")):
       timeout = int(arg)
-
-  if not os.path.isdir(test_dir):
-    print("%s is not a directory" % test_dir)
+    elif(opt in ("-j", "--jobs")):
+      workers = int(arg)
+    elif(opt in ("-e", "--engine")):
+      engine = arg
+    elif(opt in ("-b", "--backend")):
+      pty_backend = arg
+    elif(opt in ("-s", "--seed")):
+      seed = arg
+    elif(opt in ("-w", "--window")):
+      watch_window = float(arg)
+    elif(opt == "--busy"):
+      busy_windows = int(arg)
+    elif(opt in ("-r", "--limits")):
+      try:
+        limits = launch.parse_limits(arg)
+      except ValueError as err:
+        print("%s" % err)
+        print(usage)
+        sys.exit(1)
+    elif(opt == "--profile"):
+      profiling = True
+    elif(opt == "--peak-rss"):
+      peak_rss = True
+    elif(opt == "--keep-duplicates"):
+      keep_duplicates = True
+    elif(opt in ("-m", "--memory")):
+      memory_cache_size = int(float(arg) * (1 << 20))
+    elif(opt == "--order"):
+      job_order = arg
+    elif(opt == "--pace"):
+      pty_pacing = arg
+    elif(opt == "--strength"):
+      sampling_strength = int(arg)
+    elif(opt in ("-l", "--listen")):
+      try:
+        listen_address = coordinator.parse_address(arg)
+      except ValueError:
+        print("bad address %s" % arg)
+        print(usage)
+        sys.exit(1)
+
+  if(peak_rss):
+    limits = dict(limits or {}, peak_rss=1)
+
+  if not os.path.isdir(test_dir) and not (test_dir.endswith(".pack") and os.path.isfile(test_dir)):
+    print("%s is not a directory or a pack" % test_dir)
     print(usage)
     sys.exit(1)
 
@@ -496,6 +953,56 @@ if __name__ == "__main__":
     print(usage)
     sys.exit(1)
 
+  if workers < 1:
+    print("jobs should be at least 1")
+    print(usage)
+    sys.exit(1)
+
+  if engine not in ("pool", "async", "distributed"):
+    print("engine should be pool, async or distributed")
+    print(usage)
+    sys.exit(1)
+
+  if engine == "distributed" and listen_address is None:
+    print("the distributed engine needs -l address")
+    print(usage)
+    sys.exit(1)
+
+  if job_order not in job_orders:
+    print("order should be line, testcase or block")
+    print(usage)
+    sys.exit(1)
+
+  if job_order == "block" and memory_cache_size <= 0:
+    print("the block order needs -m MB")
+    print(usage)
+    sys.exit(1)
+
+  if pty_backend not in ("ptyjig", "python"):
+    print("backend should be ptyjig or python")
+    print(usage)
+    sys.exit(1)
+
+  if pty_pacing not in ("fixed", "adaptive"):
+    print("pace should be fixed or adaptive")
+    print(usage)
+    sys.exit(1)
+
+  if(sampling_strength < 0):
+    print("strength should be 0 or more")
+    print(usage)
+    sys.exit(1)
+
+  if busy_windows is not None and (busy_windows < 1 or watch_window is None):
+    print("--busy needs -w and at least 1 window")
+    print(usage)
+    sys.exit(1)
+
+  if pty_pacing == "adaptive" and pty_backend != "python":
+    print("the adaptive pace needs -b python")
+    print(usage)
+    sys.exit(1)
+
 
   # print out the parameters
   print("Input directory is %s" % test_dir)
@@ -503,24 +1010,87 @@ if __name__ == "__main__":
   print("Configuration file is %s" % configuration_file)
   print("Prefix is %s" % "None" if(prefix == "") else prefix)
   print("Timeout is %d" % timeout)
+  print("Jobs is %d" % workers)
+  print("Engine is %s" % engine)
+  if(listen_address is not None):
+    print("Listening on %s" % ":".join(str(part or "localhost") for part in listen_address[1:]))
+  # the workers connecting over TCP need the token of the campaign
+  listen_token = None
+  if(listen_address is not None and listen_address[0] == "tcp"):
+    listen_token = coordinator.campaign_token()
+    if(os.environ.get(coordinator.token_variable) is None):
+      print("Worker token is %s (worker.py -k, or %s)" % (listen_token, coordinator.token_variable))
+  print("Pty backend is %s" % pty_backend)
+  if(pty_backend == "python"):
+    print("Pty pace is %s" % pty_pacing)
+  if(watch_window is not None):
+    print("Hang window is %g" % watch_window)
+  if(busy_windows is not None):
+    print("Busy loops are hangs after %d windows" % busy_windows)
+  if(limits is not None and set(limits) != {"peak_rss"}):
+    print("Limits are %s" % ", ".join("%s=%d" % item for item in sorted(limits.items()) if item[0] != "peak_rss"))
+  if(launch.limits_account(limits)["peak_rss"]):
+    print("Peak RSS is reported by %s" % launch.peakrss_path)
+  if(memory_cache_size > 0):
+    print("Memory cache is %g MB per process" % (memory_cache_size / 1048576.0))
+  print("Order is %s" % job_order)
+
+  # the workers run in their scratch directories, so every path has to be absolute
+  test_dir = os.path.abspath(test_dir)
+  result_dir = os.path.abspath(result_dir)
+  ptyjig_path = os.path.abspath(ptyjig_path)
+  end_dir = os.path.abspath(end_dir)
+  pty_input_dir = os.path.join(result_dir, "pty_input")
+  corpus_cache_dir = os.path.join(result_dir, "corpus_cache")
 
   # make directory to save output
   if not os.path.exists(result_dir):
     os.makedirs(result_dir)
 
+  # the results of the test cases run so far, and the seed they were sampled with
+  journal_path = os.path.join(result_dir, "journal")
+  journal_seed, journaled = journal.read_journal(journal_path)
+  if(seed is None):
+    seed = journal_seed if journal_seed is not None else str(random.randrange(2**32))
+  print("Seed is %s" % seed)
+  if(sampling_strength == 0):
+    print("Options are sampled at random")
+  else:
+    print("Options are sampled %d-wise" % sampling_strength)
+
+  # the stages of the parent are timed like the ones of the runs
+  profile_state = None
+  parent_trace = None
+  if(profiling):
+    profile_state = tracing.open_profile(os.path.join(result_dir, "profile"))
+    parent_trace = []
+    print("Profile is in %s" % profile_state["dir"])
+
   # get path of all test cases
-  testcase_list = []
-  testcase_list = os.listdir(test_dir)
-  testcase_list = [file for file in testcase_list if file.startswith(prefix)]
-  testcase_list = [os.path.join(test_dir, file) for file in testcase_list]
-  testcase_list.sort()
+  t = tracing.now(parent_trace)
+  try:
+    testcase_list = corpus.list_testcases(test_dir, prefix)
+  except ValueError as err:
+    print("%s" % err)
+    sys.exit(1)
+  testcase_digests = corpus.digests(testcase_list, test_dir)
+  if(not keep_duplicates):
+    count = len(testcase_list)
+    testcase_list, testcase_aliases = corpus.dedup(testcase_list, test_dir, testcase_digests)
+    print("Test cases are %d, %d with the content of another" % (count, count - len(testcase_list)))
+    corpus.write_duplicates(os.path.join(result_dir, "duplicates"), testcase_aliases)
+  tracing.span(parent_trace, "scan", t)
+
+  # the state of the log of every line to be tested, and the jobs of all lines
+  line_states = {}
+  jobs = []
 
   # open run.master and test every cmd
   with open(configuration_file, "r") as configuration_reader:
     utilities = configuration_reader.readlines()
 
     # process every line in configuration_file
-    for line in utilities:
+    for line_no, line in enumerate(utilities):
       line = line.strip()
       # skip empty line
       if(line == ""):
@@ -539,26 +1109,38 @@ if __name__ == "__main__":
           err_writer.write("invalid syntax: %s\n" % line)
         continue
 
-      print("start testing: %s" % line)
-
       # parse the line
-      cmd, test_type, utility_name, new_file_name, all_options_from_pool, log_name = parse_a_line(line)
+      t = tracing.now(parent_trace)
+      try:
+        cmd, streams, test_type, utility_name, new_file_name, all_options_from_pool, log_name = parse_a_line(line)
+      except ValueError as err:
+        print("invalid syntax: %s (%s)" % (line, err))
+        with open(os.path.join(result_dir, "err"), "a") as err_writer:
+          err_writer.write("invalid syntax: %s (%s)\n" % (line, err))
+        continue
 
       log_path = os.path.join(result_dir, log_name)
 
-      if(test_type == "file"):
-        run_file(cmd, utility_name, log_path, all_options_from_pool, testcase_list)
-      elif(test_type == "stdin"):
-        run_stdin(cmd, utility_name, log_path, all_options_from_pool, testcase_list)
-      elif(test_type == "cp"):
-        run_cp(cmd, utility_name, new_file_name, log_path, all_options_from_pool, testcase_list)
-      elif(test_type == "two_files"):
-        run_two_files(cmd, utility_name, log_path, all_options_from_pool, testcase_list)
-      else:
-        run_pty(cmd, utility_name, log_path, all_options_from_pool, testcase_list)
+      # a line with the same log as an earlier line is skipped, as if the log had been finished by the earlier line
+      if(log_path in [state["log_path"] for state in line_states.values()]):
+        continue
 
-  fnull.close()
+      # if the log exists and have been finished, go to test the next utility
+      if log_finished(log_path):
+        continue
+
+      print("start testing: %s" % line)
 
+      line_states[line_no] = {"line": line, "log_path": log_path, "count": len(testcase_list), \
+        "writer": None, "next": 0, "pending": {}, "not_found": False}
+      jobs.extend(make_jobs(line_no, line, seed, cmd, streams, test_type, utility_name, new_file_name, all_options_from_pool, testcase_list))
+      tracing.span(parent_trace, "parse", t)
 
+  jobs = order_jobs(jobs, job_order, testcase_list, memory_cache_size)
 
+  if(profile_state is not None):
+    tracing.add_events(profile_state, "parent", os.getpid(), 0, parent_trace)
 
+  run_jobs(line_states, jobs, workers, os.path.join(result_dir, "scratch"), engine, \
+    journal.open_journal(journal_path, seed, journal_seed), journaled, \
+    store.open_store(os.path.join(result_dir, "results.db")), seed, profile_state, listen_address, listen_token)
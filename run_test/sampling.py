@@ -0,0 +1,148 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the sampling of the options of an option pool ([ ... ] in a line of config_file). Flipping a coin for every option
+# of every run needs many runs before every pair of options has been tried together on and off, and a pool like the
+# 40 options of less loses the rarer combinations. A covering array of strength t is a list of rows (a value, on or
+# off, for every option) in which every t options take each of their 2^t combinations of values in some row: for 40
+# options, pairwise (t = 2) takes 13 rows where a coin takes about 30, and t = 3 takes 36 rows.
+#
+# The arrays are built greedily like AETG: every row starts with a combination not covered yet, and the other
+# options are then set one by one, in a random order, to the value covering the most combinations not covered yet
+# with the options already set. The best of a few such candidates is kept. The random choices come from a seed, so
+# an array only depends on the seed of the campaign, the line and the strength, and it is built once per line.
+# run.py gives the rows of the array to the test cases of a line in name order, and once every row has been given,
+# goes on with the rows of the same array with its options shuffled and some of them flipped (on for off), which is
+# still a covering array but pairs other rows, and so on.
+
+import random
+import itertools
+
+# the candidates built for every row
+candidates = 10
+
+# the covering arrays built, by (seed, line, strength, count)
+arrays = {}
+
+# the combinations of strength options not covered by any row yet, as (combination of option indexes, value) pairs,
+# a value being the bits of the options of the combination, the first one the lowest. The pairs are in a list, to
+# draw one at random, with their positions in it: a covered pair is replaced by the last one of the list. masks has
+# the values not covered yet of every combination as bits, the combinations fully covered are removed from it
+def all_combinations(count, strength):
+  combinations = list(itertools.combinations(range(count), strength))
+  pairs = [(combination, value) for combination in combinations for value in range(1 << strength)]
+  return {"pairs": pairs, "index": dict((pair, i) for i, pair in enumerate(pairs)), \
+    "masks": dict((combination, (1 << (1 << strength)) - 1) for combination in combinations)}
+
+# mark a pair of uncovered as covered
+def cover(uncovered, pair):
+  i = uncovered["index"].pop(pair)
+  last = uncovered["pairs"].pop()
+  if(i < len(uncovered["pairs"])):
+    uncovered["pairs"][i] = last
+    uncovered["index"][last] = i
+  combination, value = pair
+  mask = uncovered["masks"][combination] & ~(1 << value)
+  if(mask):
+    uncovered["masks"][combination] = mask
+  else:
+    del uncovered["masks"][combination]
+
+# the value of combination in row, an option not set yet is off
+def value_of(row, combination):
+  value = 0
+  for bit, option in enumerate(combination):
+    if(row[option]):
+      value = value | (1 << bit)
+  return value
+
+# the pairs not covered yet that row covers
+def covered_by(row, uncovered):
+  covered = []
+  for combination, mask in uncovered["masks"].items():
+    value = value_of(row, combination)
+    if(mask >> value & 1):
+      covered.append((combination, value))
+  return covered
+
+# a candidate row: a combination not covered yet, then the other options set one by one
+def candidate(count, strength, uncovered, rng):
+  masks = uncovered["masks"]
+  row = [None] * count
+  combination, value = rng.choice(uncovered["pairs"])
+  for bit, option in enumerate(combination):
+    row[option] = bool(value & (1 << bit))
+  fixed = list(combination)
+  others = [option for option in range(count) if row[option] is None]
+  rng.shuffle(others)
+  for option in others:
+    gains = [0, 0]
+    for rest in itertools.combinations(fixed, strength - 1):
+      combination = tuple(sorted(rest + (option,)))
+      mask = masks.get(combination)
+      if not mask:
+        continue
+      off = value_of(row, combination)
+      gains[0] += mask >> off & 1
+      gains[1] += mask >> (off | (1 << combination.index(option))) & 1
+    if(gains[0] == gains[1]):
+      row[option] = rng.random() < 0.5
+    else:
+      row[option] = gains[1] > gains[0]
+    fixed.append(option)
+  return row
+
+# a covering array of strength for count options, a list of rows of count booleans. The strength is at most count,
+# so a pool smaller than the strength gets all its combinations, and an empty pool one empty row
+def covering_array(count, strength, rng):
+  strength = min(strength, count)
+  if(strength <= 0):
+    return [[False] * count]
+  uncovered = all_combinations(count, strength)
+  rows = []
+  while uncovered["pairs"]:
+    best = None
+    for i in range(candidates):
+      row = candidate(count, strength, uncovered, rng)
+      covered = covered_by(row, uncovered)
+      if(best is None or len(covered) > len(best[1])):
+        best = (row, covered)
+    row, covered = best
+    for pair in covered:
+      cover(uncovered, pair)
+    rows.append(row)
+  return rows
+
+# the covering array of count options of a line (see covering_array)
+def line_array(seed, line, count, strength):
+  key = (seed, line, strength, count)
+  if key not in arrays:
+    rng = random.Random("%s\0%s\0%d" % (seed, line, strength))
+    arrays[key] = covering_array(count, strength, rng)
+  return arrays[key]
+
+# the rows of array for cycle: for every cycle after the first, its options are shuffled and some flipped, the
+# same way for every row
+def cycle_rows(array, seed, line, strength, cycle):
+  if(cycle == 0):
+    return array
+  rng = random.Random("%s\0%s\0%d\0%d" % (seed, line, strength, cycle))
+  count = len(array[0])
+  order = list(range(count))
+  rng.shuffle(order)
+  flips = [rng.random() < 0.5 for option in range(count)]
+  return [[row[order[option]] != flips[option] for option in range(count)] for row in array]
+
+# the options of the rows of the array of a line given to count test cases, in order
+def sample_options(seed, line, options, strength, count):
+  array = line_array(seed, line, len(options), strength)
+  samples = []
+  cycle = 0
+  while len(samples) < count:
+    for row in cycle_rows(array, seed, line, strength, cycle):
+      samples.append([option for option, on in zip(options, row) if on])
+    cycle = cycle + 1
+  return samples[:count]
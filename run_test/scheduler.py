@@ -0,0 +1,166 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the asyncio engine of run.py (-e async). One process keeps up to "slots" children in flight. Every slot runs
+# its jobs one after another in its own scratch directory, a child is waited for with a pidfd registered in the
+# event loop (polling elsewhere), and the timeout of every run is a timer of the event loop. No thread is blocked
+# per child, so hundreds of short runs can be in flight at once. Only the pty runs of the python backend, which
+# type their input byte by byte, are run by ptydriver in a thread of their slot, and the files of a job are staged
+# and cleaned up in a thread of the event loop, so a large test case does not hold the other slots back.
+
+import os
+import time
+import signal
+import asyncio
+import concurrent.futures
+
+import launch
+import ptydriver
+import watchdog
+import tracing
+
+# wait for the child from the event loop, return its status or None if it is still running after timeout.
+# Like launch.wait_child, the output of a child with an account is drained meanwhile and None is returned once it
+# is over its limit
+async def wait_child(pid, timeout):
+  loop = asyncio.get_running_loop()
+  acct = launch.accounting.get(pid)
+
+  if hasattr(os, "pidfd_open"):
+    exited = loop.create_future()
+    fd = os.pidfd_open(pid)
+    loop.add_reader(fd, lambda: exited.done() or exited.set_result(True))
+    out_fd = None
+    if(acct is not None and acct["fd"] is not None):
+      out_fd = acct["fd"]
+      def on_output():
+        launch.drain(acct)
+        if(acct["fd"] is None):
+          loop.remove_reader(out_fd)
+        if(launch.output_exceeded(acct) and not exited.done()):
+          exited.set_result(False)
+      loop.add_reader(out_fd, on_output)
+    try:
+      if not await asyncio.wait_for(exited, timeout):
+        return None
+    except asyncio.TimeoutError:
+      return None
+    finally:
+      loop.remove_reader(fd)
+      os.close(fd)
+      # once at end of file, the pipe is closed and its reader already removed
+      if(out_fd is not None and acct["fd"] == out_fd):
+        loop.remove_reader(out_fd)
+    return launch.reap(pid)
+
+  # elsewhere poll, with a delay growing up to 50ms
+  deadline = None if timeout is None else time.monotonic() + timeout
+  delay = 0.0005
+  while True:
+    wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+    if(wpid == pid):
+      return launch.reaped(pid, status, rusage)
+    if(acct is not None):
+      launch.drain(acct)
+      if launch.output_exceeded(acct):
+        return None
+    if(deadline is not None and time.monotonic() >= deadline):
+      return None
+    await asyncio.sleep(delay)
+    delay = min(delay * 2, 0.05)
+
+# stop a run that hung like launch.terminate, waiting for it from the event loop
+async def terminate(pid):
+  pids = launch.descendants(pid)
+  launch.signal_tree(pid, pids, signal.SIGTERM)
+  status = await wait_child(pid, launch.kill_grace)
+  launch.signal_tree(pid, pids, signal.SIGKILL)
+  if(status is None):
+    status = launch.reap(pid)
+  return status
+
+# wait for the child like wait_child, and if window is not None, declare it hung once its process tree made no
+# progress for window seconds, or was busy for busy windows. Return its status, or None and how it hangs, like
+# launch.wait_watched
+async def wait_watched(pid, timeout, window, busy=None):
+  acct = launch.accounting.get(pid)
+  if(window is None):
+    status = await wait_child(pid, timeout)
+    if(status is None and launch.output_exceeded(acct)):
+      return None, None
+    return status, None if status is not None else "timeout"
+
+  watch = watchdog.new_watch(pid, window, busy)
+  deadline = None if timeout is None else time.monotonic() + timeout
+  while True:
+    wait = watchdog.next_interval(watch)
+    if(deadline is not None):
+      wait = max(0, deadline - time.monotonic()) if wait is None else min(wait, max(0, deadline - time.monotonic()))
+    status = await wait_child(pid, wait)
+    if(status is not None):
+      return status, None
+    if launch.output_exceeded(acct):
+      return None, None
+    if(deadline is not None and time.monotonic() >= deadline):
+      return None, watchdog.timed_out(watch)
+    hang = watchdog.check(watch)
+    if(hang is not None):
+      return None, hang
+
+# run jobs, an iterator shared by all slots, in the scratch directory slot_dir
+async def run_slot(jobs, slot_dir, timeout, start_job, finish_job, on_result, executor):
+  loop = asyncio.get_running_loop()
+  for job in jobs:
+    stdin_path = await loop.run_in_executor(None, start_job, job, slot_dir)
+    trace = job["trace"]
+    t = tracing.now(trace)
+    if(job["pty_driver"]):
+      retcode, info = await loop.run_in_executor(executor, ptydriver.run, job["argv"], stdin_path, \
+        job["delay"], job["idle_timeout"], timeout, slot_dir, None, None, job["limits"])
+      tracing.span(trace, "utility", t)
+      on_result(await loop.run_in_executor(None, finish_job, job, slot_dir, retcode, info))
+      continue
+    limits = job["limits"]
+    acct = launch.limits_account(limits)
+    try:
+      pid = launch.spawn(job["argv"], stdin_path, slot_dir, limits, acct, job["redirects"])
+    except OSError as err:
+      retcode = launch.spawn_error_retcode(err, stdin_path)
+      info = launch.run_info(acct, limits, None)
+    else:
+      t = tracing.span(trace, "spawn", t)
+      try:
+        status, hang = await wait_watched(pid, timeout, job["window"], job["busy"])
+        t = tracing.span(trace, "utility", t)
+        if(status is None):
+          await terminate(pid)
+          t = tracing.span(trace, "kill", t)
+          retcode = None
+        else:
+          retcode = launch.shell_retcode(status)
+        leaked = launch.leaked(pid)
+        tracing.span(trace, "leaked", t)
+        info = launch.run_info(acct, limits, retcode, hang, leaked)
+      finally:
+        launch.close_account(acct)
+    on_result(await loop.run_in_executor(None, finish_job, job, slot_dir, retcode, info))
+
+async def run_slots(jobs, slots, scratch_root, timeout, start_job, finish_job, on_result):
+  jobs = iter(jobs)
+  tasks = []
+  with concurrent.futures.ThreadPoolExecutor(slots) as executor:
+    for i in range(slots):
+      slot_dir = os.path.join(scratch_root, "s%d" % i)
+      if not os.path.exists(slot_dir):
+        os.makedirs(slot_dir)
+      tasks.append(run_slot(jobs, slot_dir, timeout, start_job, finish_job, on_result, executor))
+    await asyncio.gather(*tasks)
+
+# run all jobs with up to slots children in flight. start_job(job, work_dir) prepares a job and returns the path of
+# its stdin, finish_job(job, work_dir, retcode, info) (info is a launch.run_info) cleans up and returns the result, which is passed to on_result.
+# start_job and finish_job are called in threads, on_result and the iterator of jobs from the event loop
+def run_jobs(jobs, slots, scratch_root, timeout, start_job, finish_job, on_result):
+  asyncio.run(run_slots(jobs, slots, scratch_root, timeout, start_job, finish_job, on_result))
@@ -0,0 +1,70 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# put the input files of a run into its scratch directory without copying them when possible, and empty the
+# scratch directory after the run, together with whatever the utility left there (a.out, tags, *.o, ...)
+
+import os
+import sys
+import shutil
+
+# the FICLONE ioctl of Linux shares the blocks of a file on btrfs, xfs, ...
+FICLONE = 0x40049409
+
+# make dst a reflink of src, return False if the file system can't
+def reflink(src, dst):
+  if not sys.platform.startswith("linux"):
+    return False
+  import fcntl
+  src_fd = os.open(src, os.O_RDONLY)
+  try:
+    dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+  except OSError:
+    os.close(src_fd)
+    return False
+  try:
+    fcntl.ioctl(dst_fd, getattr(fcntl, "FICLONE", FICLONE), src_fd)
+    return True
+  except OSError:
+    os.unlink(dst)
+    return False
+  finally:
+    os.close(src_fd)
+    os.close(dst_fd)
+
+# make dst have the content of src, trying a hard link, a reflink, a symbolic link, then a copy.
+# A file the utility itself opens may be written to, and writing to a link would change src, so with
+# writable only a reflink (copy on write) or a copy is made. Return how it was done
+def stage_file(src, dst, writable=False):
+  if os.path.lexists(dst):
+    os.unlink(dst)
+  if not writable:
+    try:
+      os.link(src, dst)
+      return "link"
+    except OSError:
+      pass
+  if reflink(src, dst):
+    return "reflink"
+  if not writable:
+    try:
+      os.symlink(os.path.abspath(src), dst)
+      return "symlink"
+    except OSError:
+      pass
+  shutil.copyfile(src, dst)
+  return "copy"
+
+# remove everything in the scratch directory path
+def clear_dir(path):
+  for entry in os.scandir(path):
+    if entry.is_dir(follow_symlinks=False):
+      shutil.rmtree(entry.path, ignore_errors=True)
+    else:
+      try:
+        os.unlink(entry.path)
+      except FileNotFoundError:
+        pass
@@ -0,0 +1,90 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the result store of run.py (result_dir/results.db), an SQLite database with one row per run next to the result
+# files. Rows are kept in memory and inserted in one transaction every flush_count rows or flush_interval seconds,
+# so the store costs the harness almost nothing per run. report.py queries it.
+#
+# Besides the result, a run has the limit it exceeded (see launch.exceeded) and what it used: peak RSS in KB,
+# user and system CPU seconds, voluntary and involuntary context switches and bytes of output. aliases are the
+# paths of the test cases with the same content, which were not run (see corpus.py).
+
+import time
+import sqlite3
+
+flush_count = 256
+flush_interval = 1.0
+
+schema = """
+create table if not exists runs (
+  id integer primary key,
+  seed text,
+  line text,
+  utility text,
+  test_type text,
+  dataset text,
+  testcase text,
+  path text,
+  files text,
+  options text,
+  cmd text,
+  retcode integer,
+  signal integer,
+  result text,
+  hang text,
+  leaked integer,
+  duration real,
+  timestamp real,
+  exceeded text,
+  maxrss integer,
+  utime real,
+  stime real,
+  nvcsw integer,
+  nivcsw integer,
+  output integer,
+  aliases text
+);
+create index if not exists runs_utility on runs (utility, test_type);
+create index if not exists runs_result on runs (result, signal);
+create index if not exists runs_dataset on runs (dataset, testcase);
+"""
+
+columns = ("seed", "line", "utility", "test_type", "dataset", "testcase", "path", "files", "options", "cmd", "retcode", "signal", \
+  "result", "hang", "leaked", "duration", "timestamp", "exceeded", "maxrss", "utime", "stime", "nvcsw", "nivcsw", "output", "aliases")
+
+def open_db(path):
+  db = sqlite3.connect(path)
+  db.execute("pragma journal_mode=wal")
+  db.execute("pragma synchronous=normal")
+  db.executescript(schema)
+  # a store made by an older run.py lacks the newer columns
+  existing = [row[1] for row in db.execute("pragma table_info(runs)")]
+  for column in columns:
+    if column not in existing:
+      db.execute("alter table runs add column %s" % column)
+  return db
+
+def open_store(path):
+  return {"db": open_db(path), "rows": [], "last_flush": time.monotonic()}
+
+# insert the rows kept so far
+def flush_store(state):
+  if(state["rows"]):
+    with state["db"]:
+      state["db"].executemany("insert into runs (%s) values (%s)" % (", ".join(columns), ", ".join("?" * len(columns))), \
+        state["rows"])
+  state["rows"] = []
+  state["last_flush"] = time.monotonic()
+
+# add a run, row is a dict with the columns
+def add_run(state, row):
+  state["rows"].append(tuple(row.get(column) for column in columns))
+  if(len(state["rows"]) >= flush_count or time.monotonic() - state["last_flush"] >= flush_interval):
+    flush_store(state)
+
+def close_store(state):
+  flush_store(state)
+  state["db"].close()
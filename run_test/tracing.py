@@ -0,0 +1,100 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# the stage profiler of run.py --profile. Every run records how long each of its stages took (prepare, print,
+# spawn, utility, kill, leaked, cleanup, records) as (stage, start, duration) in nanoseconds of the monotonic
+# clock, which is shared by the workers, and sends them to the parent with its result. The parent times its own
+# stages (parse, scan, merge), adds up every stage, and streams the events to a Chrome trace per worker in
+# result_dir/profile (<worker>.json and parent.json), which chrome://tracing and ui.perfetto.dev open.
+# Without --profile the events of a run are None and nothing is timed.
+
+import os
+import json
+import time
+
+# the stages of a run, in order, "utility" is the time the utility under test ran
+run_stages = ("prepare", "print", "spawn", "utility", "kill", "leaked", "cleanup", "records")
+parent_stages = ("parse", "scan", "merge")
+
+# the time, 0 without events
+def now(events):
+  if(events is None):
+    return 0
+  return time.monotonic_ns()
+
+# record in events that stage ran from start to now, return now
+def span(events, stage, start):
+  if(events is None):
+    return 0
+  end = time.monotonic_ns()
+  events.append((stage, start, end - start))
+  return end
+
+def open_profile(profile_dir):
+  if not os.path.exists(profile_dir):
+    os.makedirs(profile_dir)
+  return {"dir": profile_dir, "start": time.monotonic_ns(), "files": {}, "stages": {}, "jobs": [0, 0]}
+
+# the trace file of worker, created with the name of its track
+def trace_file(state, worker, pid, tid):
+  f = state["files"].get(worker)
+  if(f is None):
+    f = open(os.path.join(state["dir"], "%s.json" % worker), "w")
+    f.write('{"traceEvents": [\n')
+    f.write('{"name": "thread_name", "ph": "M", "pid": %d, "tid": %d, "args": {"name": %s}}' % \
+      (pid, tid, json.dumps(worker)))
+    state["files"][worker] = f
+  return f
+
+# add the events of worker (a process pid, tid for its track) to its trace and to the totals. The span of a whole
+# job is its stage "job", with args (e.g. the command) shown by the trace viewers
+def add_events(state, worker, pid, tid, events, args=None):
+  f = trace_file(state, worker, pid, tid)
+  start0 = state["start"]
+  for stage, start, duration in events:
+    if(stage == "job"):
+      state["jobs"][0] += 1
+      state["jobs"][1] += duration
+      f.write(',\n{"name": "job", "ph": "X", "ts": %.3f, "dur": %.3f, "pid": %d, "tid": %d, "args": %s}' % \
+        ((start - start0) / 1000.0, duration / 1000.0, pid, tid, json.dumps(args or {})))
+      continue
+    total = state["stages"].setdefault(stage, [0, 0, 0])
+    total[0] += 1
+    total[1] += duration
+    total[2] = max(total[2], duration)
+    f.write(',\n{"name": "%s", "ph": "X", "ts": %.3f, "dur": %.3f, "pid": %d, "tid": %d}' % \
+      (stage, (start - start0) / 1000.0, duration / 1000.0, pid, tid))
+
+# the aggregate breakdown, as lines of text
+def breakdown(state, workers):
+  wall = time.monotonic_ns() - state["start"]
+  runs, job_time = state["jobs"]
+  lines = ["wall %.3f s, %d runs, %.1f runs/s, %d workers" % (wall / 1e9, runs, runs * 1e9 / wall if wall else 0, workers)]
+  row = "%-10s %8s %10s %10s %10s %8s"
+  lines.append(row % ("stage", "count", "total s", "mean ms", "max ms", "share"))
+  # the stages of the runs are shares of the time spent in jobs, the stages of the parent shares of the wall time
+  for stages, whole in ((run_stages, job_time), (parent_stages, wall)):
+    for stage in stages:
+      if stage not in state["stages"]:
+        continue
+      count, total, longest = state["stages"][stage]
+      lines.append(row % (stage, count, "%.3f" % (total / 1e9), "%.3f" % (total / 1e6 / count), "%.3f" % (longest / 1e6), \
+        "%.1f%%" % (100.0 * total / whole if whole else 0)))
+  utility = state["stages"].get("utility", [0, 0, 0])[1]
+  if(job_time):
+    lines.append("harness overhead %.1f%% of the job time (%.3f ms per run)" % (100.0 * (job_time - utility) / job_time, \
+      (job_time - utility) / 1e6 / runs))
+  return lines
+
+# close the traces and write the breakdown to summary.txt, return it
+def close_profile(state, workers):
+  for f in state["files"].values():
+    f.write("\n]}\n")
+    f.close()
+  lines = breakdown(state, workers)
+  with open(os.path.join(state["dir"], "summary.txt"), "w") as f:
+    f.write("\n".join(lines) + "\n")
+  return lines
@@ -0,0 +1,204 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# early hang detection (run.py -w window). The process tree of a running utility is sampled through /proc: the
+# state, utime + stime and wchan of every process, and the bytes it read and wrote (rchar, wchar and read_bytes of
+# /proc/<pid>/io). A run makes progress when the tree reads or writes something, or a process starts or exits.
+# After window seconds without progress the run is declared hung as "blocked" with the kernel function it sleeps
+# in (e.g. "blocked in n_tty_read"). A tree using the CPU meanwhile may be computing rather than looping, so it is
+# only declared hung at the timeout, as a "busy loop" if it made no progress for window seconds until then: the
+# window saves no time on busy loops, but a long computation is not killed as one.
+#
+# With run.py --busy windows, a tree that makes no progress and uses at least spin_ratio of a CPU during that many
+# consecutive windows is declared hung as a "busy loop" right away. A computation without I/O that long would be
+# killed as one, so it is opt-in. A loop sharing its CPU with other runs (more jobs than CPUs) may stay below the
+# ratio and is then only found at the timeout.
+#
+# The tree is sampled every 0.1 second at first, then less and less often, up to every window / 4 seconds.
+# Without /proc (FreeBSD, MacOS) there is no sample and only the timeout applies.
+
+import os
+import time
+
+clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# a busy loop is runnable, or used the CPU at least this part of the time (other runs share the CPU)
+busy_ratio = 0.1
+
+# with --busy, the part of a CPU a tree uses during a window for the window to count as a busy one
+spin_ratio = 0.9
+
+first_interval = 0.1
+
+def read_file(path):
+  try:
+    with open(path, "r") as f:
+      return f.read()
+  except OSError:
+    return None
+
+# the children of pid, from /proc/<pid>/task/<tid>/children
+def children(pid):
+  pids = []
+  try:
+    tids = os.listdir("/proc/%d/task" % pid)
+  except OSError:
+    return pids
+  for tid in tids:
+    text = read_file("/proc/%d/task/%s/children" % (pid, tid))
+    if(text):
+      pids.extend(int(child) for child in text.split())
+  return pids
+
+# the children of every process, from the parent pid in /proc/<pid>/stat
+def children_by_scan():
+  parents = {}
+  for name in os.listdir("/proc"):
+    if not name.isdigit():
+      continue
+    stat = read_file("/proc/%s/stat" % name)
+    if(stat is not None):
+      parents.setdefault(int(stat[stat.rfind(")") + 2:].split()[1]), []).append(int(name))
+  return parents
+
+# pid and all its descendants. Without /proc/<pid>/task/<tid>/children (a kernel option), /proc is scanned
+def tree(pid):
+  if os.path.exists("/proc/%d/task/%d/children" % (pid, pid)):
+    get_children = children
+  else:
+    parents = children_by_scan()
+    get_children = lambda p: parents.get(p, [])
+  pids = [pid]
+  i = 0
+  while i < len(pids):
+    pids.extend(get_children(pids[i]))
+    i = i + 1
+  return pids
+
+# state, cpu ticks, bytes read and written, and wchan of a process, or None if it is gone
+def sample_process(pid):
+  stat = read_file("/proc/%d/stat" % pid)
+  if(stat is None):
+    return None
+  # the command name in parentheses may contain spaces
+  fields = stat[stat.rfind(")") + 2:].split()
+  state = fields[0]
+  cpu = int(fields[11]) + int(fields[12])
+  io = 0
+  text = read_file("/proc/%d/io" % pid)
+  if(text is not None):
+    for line in text.splitlines():
+      name, _, value = line.partition(":")
+      if(name in ("rchar", "wchar", "read_bytes", "write_bytes")):
+        io = io + int(value)
+  wchan = read_file("/proc/%d/wchan" % pid) or ""
+  return state, cpu, io, wchan
+
+# the samples of the tree of pid, pid -> (state, cpu, io, wchan)
+def sample(pid):
+  samples = {}
+  for p in tree(pid):
+    s = sample_process(p)
+    if(s is not None):
+      samples[p] = s
+  return samples
+
+# start watching the tree of pid, None if /proc can't be used. With spin_windows, the tree is declared hung once
+# it was busy without progress for that many consecutive windows
+def new_watch(pid, window, spin_windows=None):
+  if not os.path.isdir("/proc/%d" % pid):
+    return None
+  now = time.monotonic()
+  return {"pid": pid, "window": window, "samples": sample(pid), "since": now, "cpu": 0, "interval": first_interval, \
+    "spin_windows": spin_windows, "spin_since": now, "spin_cpu": 0, "spins": 0}
+
+# how long to wait before the next check
+def next_interval(watch):
+  if(watch is None):
+    return None
+  interval = watch["interval"]
+  watch["interval"] = min(interval * 2, max(first_interval, watch["window"] / 4.0))
+  return interval
+
+# a process of the tree sleeping in the kernel, and where. A process waiting for its children (like peakrss, see
+# launch.py) is only reported if no other process sleeps
+def blocked_in(samples):
+  found = ""
+  for state, cpu, io, wchan in samples.values():
+    if(state in ("S", "D") and wchan not in ("", "0")):
+      if(wchan != "do_wait"):
+        return wchan
+      found = wchan
+  return found
+
+# whether the tree used the CPU since its last progress, elapsed seconds ago
+def busy(watch, elapsed):
+  return watch["cpu"] >= busy_ratio * elapsed * clock_ticks or any(s[0] == "R" for s in watch["samples"].values())
+
+# with --busy, count the consecutive windows the tree used at least spin_ratio of a CPU in, cpu ticks since the
+# last check. Whether it did for spin_windows windows
+def spinning(watch, now, cpu):
+  if(watch["spin_windows"] is None):
+    return False
+  watch["spin_cpu"] = watch["spin_cpu"] + cpu
+  elapsed = now - watch["spin_since"]
+  if(elapsed < watch["window"]):
+    return False
+  if(watch["spin_cpu"] >= spin_ratio * elapsed * clock_ticks):
+    watch["spins"] = watch["spins"] + 1
+  else:
+    watch["spins"] = 0
+  watch["spin_since"] = now
+  watch["spin_cpu"] = 0
+  return watch["spins"] >= watch["spin_windows"]
+
+# sample the tree again, return None if it made progress, the window is not over yet or the tree is using the CPU,
+# otherwise how it hangs: "blocked" followed by where, or "busy loop" with --busy (see spinning)
+def check(watch):
+  if(watch is None):
+    return None
+  now = time.monotonic()
+  samples = sample(watch["pid"])
+  old = watch["samples"]
+  watch["samples"] = samples
+
+  progress = set(samples) != set(old)
+  cpu = 0
+  for p, (state, p_cpu, io, wchan) in samples.items():
+    if(p in old):
+      if(io != old[p][2]):
+        progress = True
+      cpu = cpu + p_cpu - old[p][1]
+  if(progress):
+    watch["since"] = now
+    watch["cpu"] = 0
+    watch["spin_since"] = now
+    watch["spin_cpu"] = 0
+    watch["spins"] = 0
+    return None
+
+  watch["cpu"] = watch["cpu"] + cpu
+  if(spinning(watch, now, cpu)):
+    return "busy loop"
+  elapsed = now - watch["since"]
+  if(elapsed < watch["window"]):
+    return None
+  if busy(watch, elapsed):
+    return None
+  wchan = blocked_in(samples)
+  if(wchan != ""):
+    return "blocked in %s" % wchan
+  return "blocked"
+
+# how a run that did not finish before the timeout hangs: "busy loop" if its tree used the CPU without progress
+# for the last window seconds, "timeout" otherwise
+def timed_out(watch):
+  if(watch is None):
+    return "timeout"
+  elapsed = time.monotonic() - watch["since"]
+  if(elapsed >= watch["window"] and busy(watch, elapsed)):
+    return "busy loop"
+  return "timeout"
@@ -0,0 +1,152 @@
+#  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+#
+#  This program is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+# a worker of a distributed campaign (see coordinator.py). It connects to the coordinator started by
+# "run.py config_file -e distributed -l address", runs the jobs leased to it with slots worker processes like the
+# pool engine of run.py, each in its own scratch directory, and sends the results back until every job is done.
+# The test cases, ptyjig and the utilities must be at the same paths as on the coordinator (e.g. a shared file
+# system). Several workers can run on the same machine. Over TCP, the worker sends the token of the campaign, given
+# by -k or the FUZZ_TOKEN environment variable (see coordinator.py):
+#
+#   export FUZZ_TOKEN=...
+#   python3 run.py ../test_Linux/run.master -i ../../testcases -e distributed -l 0.0.0.0:7007
+#   python3 worker.py coordinator_host:7007 -j 8
+
+import os
+import sys
+import time
+import socket
+import getopt
+import shutil
+import asyncio
+import tempfile
+import multiprocessing
+import concurrent.futures
+
+import run
+import coordinator
+
+usage = "Usage: python3 worker.py address [-j slots] [-n name] [-k token]"
+
+# seconds to keep trying to reach a coordinator that is not listening yet
+connect_timeout = 60
+
+async def connect(address):
+  deadline = time.monotonic() + connect_timeout
+  while True:
+    try:
+      if(address[0] == "unix"):
+        return await asyncio.open_unix_connection(address[1])
+      return await asyncio.open_connection(address[1] or "localhost", address[2])
+    except OSError:
+      if(time.monotonic() >= deadline):
+        raise
+      await asyncio.sleep(1)
+
+# run the jobs leased by the coordinator at address with slots worker processes, token is the token of the campaign.
+# Return True once the coordinator said every job is done, False if it went away or turned the worker away
+async def work(address, slots, name, token=None):
+  loop = asyncio.get_running_loop()
+  reader, writer = await connect(address)
+  writer.write(coordinator.encode({"type": "hello", "name": name, "slots": slots, "token": token}))
+  welcome = await coordinator.read_message(reader)
+  if(welcome is None):
+    print("the coordinator closed the connection, check the token")
+    return False
+  if(welcome["type"] != "welcome"):
+    # a campaign already done says so right away
+    return welcome["type"] == "done"
+  print("connected to %s" % ":".join(str(part) for part in address[1:]))
+
+  scratch_root = tempfile.mkdtemp(prefix="worker")
+  # forked worker processes would keep the connection open if this process died, and the coordinator would only
+  # notice once the worker timed out
+  context = None
+  if "forkserver" in multiprocessing.get_all_start_methods():
+    context = multiprocessing.get_context("forkserver")
+  executor = concurrent.futures.ProcessPoolExecutor(slots, context, initializer=run.init_worker, \
+    initargs=(scratch_root, welcome["settings"]["timeout"]))
+  leases = asyncio.Queue()
+  # the leases the coordinator cancelled, dropped from the queue
+  cancelled = set()
+
+  async def heartbeat():
+    while True:
+      await asyncio.sleep(welcome["heartbeat"])
+      writer.write(coordinator.encode({"type": "heartbeat"}))
+
+  async def slot():
+    while True:
+      lease, job = await leases.get()
+      if lease in cancelled:
+        cancelled.discard(lease)
+        writer.write(coordinator.encode({"type": "want", "count": 1}))
+        continue
+      result = await loop.run_in_executor(executor, run.run_job, job)
+      writer.write(coordinator.encode({"type": "result", "lease": lease, "result": result}))
+      await writer.drain()
+
+  # a lease per slot waits in the queue, so a slot does not wait for the network between two jobs
+  writer.write(coordinator.encode({"type": "want", "count": 2 * slots}))
+  tasks = [asyncio.ensure_future(heartbeat())] + [asyncio.ensure_future(slot()) for i in range(slots)]
+  done = False
+  try:
+    while True:
+      try:
+        message = await coordinator.read_message(reader)
+      except ConnectionError:
+        message = None
+      if(message is None):
+        print("the coordinator went away")
+        break
+      if(message["type"] == "lease"):
+        leases.put_nowait((message["lease"], message["job"]))
+      elif(message["type"] == "cancel"):
+        cancelled.update(message["leases"])
+      elif(message["type"] == "done"):
+        done = True
+        break
+  finally:
+    for task in tasks:
+      task.cancel()
+    writer.close()
+    executor.shutdown(wait=True, cancel_futures=True)
+    shutil.rmtree(scratch_root, ignore_errors=True)
+  return done
+
+
+if __name__ == "__main__":
+
+  if(len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help")):
+    print(usage)
+    sys.exit(1)
+
+  try:
+    opts, args = getopt.getopt(sys.argv[2:], "j:n:k:", ["jobs=", "name=", "token="])
+  except getopt.GetoptError as err:
+    print("error on arguments")
+    print(usage)
+    sys.exit(1)
+
+  slots = os.cpu_count() or 1
+  name = "%s:%d" % (socket.gethostname(), os.getpid())
+  token = os.environ.get(coordinator.token_variable)
+  for opt, arg in opts:
+    if(opt in ("-j", "--jobs")):
+      slots = int(arg)
+    elif(opt in ("-n", "--name")):
+      name = arg
+    elif(opt in ("-k", "--token")):
+      token = arg
+
+  try:
+    address = coordinator.parse_address(sys.argv[1])
+  except ValueError:
+    print("bad address %s" % sys.argv[1])
+    print(usage)
+    sys.exit(1)
+
+  sys.exit(0 if asyncio.run(work(address, slots, name, token)) else 1)
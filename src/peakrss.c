@@ -0,0 +1,121 @@
+/*
+ *  Copyright (c) 2020 Emma He, Mengxiao Zhang, Barton Miller
+ *
+ *  This program is distributed in the hope that it will be useful, but
+ *  WITHOUT ANY WARRANTY; without even the implied warranty of
+ *  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+ *
+ */
+
+/*
+ *  peakrss -- Report the peak RSS of a command.
+ *
+ *  peakrss fd cmd [args]
+ *
+ *  Run "cmd" with arguments "args", write its peak RSS (ru_maxrss of
+ *  wait4, in KB on Linux) as a decimal number to the file descriptor
+ *  "fd" once it exited, and exit the way it did: with its exit code,
+ *  or killed by the same signal.
+ *
+ *  The peak RSS of a process is not reset by exec on Linux, a command
+ *  started by the test harness (run_test/launch.py) would report at
+ *  least the RSS of the harness. The command is forked from this small
+ *  process instead, so its peak RSS is its own.
+ *
+ *  peakrss stops when "cmd" stops, and continues it once it is continued.
+ *  "fd" is not inherited by "cmd". Like a shell, peakrss exits with 127
+ *  if "cmd" is not found and 126 if it can't be run.
+ */
+
+#include <sys/types.h>
+#include <sys/time.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+
+// the command, once forked
+pid_t child = -1;
+
+void forward(int sig) {
+  if (child > 0)
+    kill(child, sig);
+}
+
+int main(int argc, char** argv) {
+  int fd;
+  int status;
+  pid_t pid;
+  struct rusage ru;
+  struct rlimit no_core;
+  char buf[32];
+  char* end;
+
+  if (argc < 3) {
+    fprintf(stderr, "Usage: peakrss fd cmd [args]\n");
+    exit(2);
+  }
+  fd = (int) strtol(argv[1], &end, 10);
+  if (*end != '\0' || fcntl(fd, F_SETFD, FD_CLOEXEC) < 0) {
+    fprintf(stderr, "peakrss: bad file descriptor %s\n", argv[1]);
+    exit(2);
+  }
+
+  pid = fork();
+  if (pid < 0) {
+    perror("peakrss: fork");
+    exit(126);
+  }
+  if (pid == 0) {
+    execvp(argv[2], argv + 2);
+    fprintf(stderr, "%s: %s\n", argv[2], strerror(errno));
+    _exit(errno == ENOENT ? 127 : 126);
+  }
+  child = pid;
+
+  // the command decides how it ends and peakrss reports it, these signals
+  // are passed to it (a hangup of the terminal is only sent to peakrss,
+  // the session leader)
+  signal(SIGHUP, forward);
+  signal(SIGINT, forward);
+  signal(SIGQUIT, forward);
+  signal(SIGTERM, forward);
+
+  for (;;) {
+    if (wait4(pid, &status, WUNTRACED, &ru) < 0) {
+      if (errno == EINTR)
+        continue;
+      perror("peakrss: wait4");
+      exit(126);
+    }
+    if (!WIFSTOPPED(status))
+      break;
+    // stop with the command, the harness sees a stopped run, and continue
+    // it when peakrss is continued
+    kill(getpid(), SIGSTOP);
+    kill(pid, SIGCONT);
+  }
+
+  snprintf(buf, sizeof(buf), "%ld\n", (long) ru.ru_maxrss);
+  if (write(fd, buf, strlen(buf)) < 0) {
+    perror("peakrss: write");
+  }
+  close(fd);
+
+  if (WIFSIGNALED(status)) {
+    // die of the same signal, without a core of peakrss over the one of
+    // the command
+    no_core.rlim_cur = 0;
+    no_core.rlim_max = 0;
+    setrlimit(RLIMIT_CORE, &no_core);
+    signal(WTERMSIG(status), SIG_DFL);
+    kill(getpid(), WTERMSIG(status));
+    exit(128 + WTERMSIG(status));
+  }
+  exit(WEXITSTATUS(status));
+}